@@ -1,21 +1,94 @@
 import argparse
+import csv
+import importlib.util
 import io
+import json
 import logging
+import os
 import subprocess
 import sys
 import tempfile
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from make_profiler.dot_export import export_dot, render_dot
-from make_profiler.parser import parse, get_dependencies_influences
-from make_profiler.preprocess import generate_makefile
-from make_profiler.timing import parse_timing_db, analyze_target
-from make_profiler.report_export import export_report
+from make_profiler.history import annotate_quantiles, flag_regressions, quantiles, read_history, update_history
+from make_profiler.parse_cache import CACHE_FILENAME, load_makefile
+from make_profiler.parser import dependency_maps
+from make_profiler.preprocess import HOOK_SETS, compressed_log_hooks, event_stream_hooks, generate_makefile
+from make_profiler import timing_binary, timing_sqlite
+from make_profiler.timing import parse_timing_db, analyze_target, analyze_all_targets, analyze_target_lines
+from make_profiler.report_export import export_report, export_runs, export_utilisation
+from make_profiler.run_index import list_runs
+from make_profiler.utilisation import annotate_scheduler_wait, job_limit, run_utilisation
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('make_profiler')
 
 
+STATISTICS_FIELDS = ('target', 'count', 'total', 'min', 'max', 'mean', 'median', 'p90', 'p99', 'stddev')
+
+
+def print_statistics(stats, fmt):
+    """Print per-target statistics of ``analyze_all_targets`` as CSV or JSON."""
+    if fmt == 'json':
+        print(json.dumps(stats, indent=2))
+        return
+    writer = csv.DictWriter(sys.stdout, fieldnames=STATISTICS_FIELDS)
+    writer.writeheader()
+    writer.writerows(stats)
+
+
+def print_runs(runs):
+    """Print build summaries of ``run_index.list_runs`` as a table."""
+    print('%-24s %-19s %-19s %12s %7s %7s %7s' % (
+        'build id', 'start', 'end', 'wall', 'built', 'failed', 'running'))
+    for run in runs:
+        print('%-24s %-19s %-19s %12s %7d %7d %7d' % (
+            run['bid'],
+            datetime.fromtimestamp(run['start']).strftime('%Y-%m-%d %H:%M:%S'),
+            datetime.fromtimestamp(run['end']).strftime('%Y-%m-%d %H:%M:%S'),
+            timedelta(seconds=int(run['wall'])),
+            run['built'],
+            run['failed'],
+            run['running']))
+
+
+def print_utilisation(result):
+    """Print the parallelism summary of ``utilisation.run_utilisation``."""
+    if result['start'] is None:
+        print('no events of build', result['bid'])
+        return
+    print('build id:', result['bid'])
+    print('start:', datetime.fromtimestamp(result['start']).strftime('%Y-%m-%d %H:%M:%S'))
+    print('wall: %.3f' % result['wall'])
+    print('mean concurrency: %.2f' % result['mean'])
+    print('max concurrency:', result['max'])
+    if result['below_jobs'] is not None:
+        print('below -j%d: %.1f%%' % (result['jobs'], 100 * result['below_jobs']))
+    print('idle: %.3f in %d gaps' % (result['idle'], len(result['idle_gaps'])))
+    for start, duration in sorted(result['idle_gaps'], key=lambda gap: -gap[1])[:10]:
+        print('  %12.3f +%.3f' % (start, duration))
+
+
+def recipe_lines(ast, target):
+    """Return the recipe lines of ``target`` in the parsed Makefile ``ast``."""
+    for ttype, data in ast:
+        if ttype == 'target' and target in data.get('all_targets', [data['target']]):
+            return [body for body_type, body in data['body'] if body_type == 'command']
+    return []
+
+
+def print_lines(stats, commands):
+    """Print per recipe line statistics of ``analyze_target_lines`` as a table."""
+    total = sum(line['avg'] for line in stats) or 1
+    print('%4s %7s %12s %12s %12s %6s  %s' % ('line', 'runs', 'avg', 'median', 'max', 'share', 'command'))
+    for line in stats:
+        command = commands[line['line'] - 1] if line['line'] <= len(commands) else ''
+        print('%4d %7d %12.3f %12.3f %12.3f %5.1f%%  %s' % (
+            line['line'], line['finished'], line['avg'], line['median'], line['max'],
+            100 * line['avg'] / total, command.split('\n')[0]))
+
+
 def main(argv=sys.argv[1:]):
     parser = argparse.ArgumentParser(
         description='Advanced Makefile processor')
@@ -38,6 +111,31 @@ def main(argv=sys.argv[1:]):
         type=str,
         default='make_profile.db',
         help='Profile with timings')
+    parser.add_argument(
+        '--checkpoint',
+        dest='checkpoint',
+        action='store_true',
+        help='Keep parsed timings in a checkpoint next to the profile and read only lines appended since the previous run')
+    parser.add_argument(
+        '--reverse_scan',
+        dest='reverse_scan',
+        action='store_true',
+        help='Read the profile backwards and stop once every target has its current and previous run timings')
+    parser.add_argument(
+        '--max_runs',
+        action='store',
+        dest='max_runs',
+        type=int,
+        default=None,
+        help='Read timings of at most this many most recent builds')
+    parser.add_argument(
+        '--timing_store',
+        action='store',
+        dest='timing_store',
+        type=str,
+        default=None,
+        help='Timing store to sync the profile into and read timings from: '
+             'binary columnar db for *.bin files, SQLite database otherwise')
     parser.add_argument(
         '-p',
         action='store',
@@ -57,6 +155,95 @@ def main(argv=sys.argv[1:]):
         dest='analyze',
         metavar='TARGET',
         help='Analyze timing statistics for given target')
+    parser.add_argument(
+        '--lines',
+        dest='lines',
+        action='store_true',
+        help='With --analyze, break the target time down by recipe line (needs --line_timing)')
+    parser.add_argument(
+        '--analyze-all',
+        dest='analyze_all',
+        action='store_true',
+        help='Print timing statistics for every target sorted by total time spent')
+    parser.add_argument(
+        '--format',
+        dest='format',
+        choices=('csv', 'json'),
+        default='csv',
+        help='Output format of --analyze-all, json also applies to --utilisation (default %(default)s)')
+    parser.add_argument(
+        '--history',
+        dest='history',
+        action='store_true',
+        help='Keep duration history of every target next to the profile, flag targets that got slower '
+             'than their moving average and report their p50/p95/p99')
+    parser.add_argument(
+        '--runs',
+        dest='runs',
+        action='store_true',
+        help='List past builds with their duration and number of built and failed targets')
+    parser.add_argument(
+        '--export_runs',
+        dest='export_runs',
+        action='store_true',
+        help='Also write the build history shown by the web dashboard to runs.json')
+    parser.add_argument(
+        '--utilisation',
+        dest='utilisation',
+        nargs='?',
+        const='',
+        metavar='BUILD_ID',
+        help='Report how many targets ran in parallel during the latest or the given build, '
+             'pass the -j of the build to compare against it')
+    parser.add_argument(
+        '--export_utilisation',
+        dest='export_utilisation',
+        action='store_true',
+        help='Also write the parallelism of the latest build to utilisation.json')
+    parser.add_argument(
+        '--hooks',
+        dest='hooks',
+        choices=sorted(HOOK_SETS),
+        default='default',
+        help='Instrumentation hooks: default, or light to record the same events '
+             'with fewer processes per target (needs bash) (default %(default)s)')
+    parser.add_argument(
+        '--logs',
+        dest='logs',
+        choices=('plain', 'gzip', 'zstd'),
+        default='plain',
+        help='Log capture: plain text, or compressed with batched timestamps (default %(default)s)')
+    parser.add_argument(
+        '--log_max_bytes',
+        action='store',
+        dest='log_max_bytes',
+        type=int,
+        default=None,
+        help='Keep only the head and the tail of compressed logs, this many bytes per target')
+    parser.add_argument(
+        '--log_stamp_interval',
+        action='store',
+        dest='log_stamp_interval',
+        type=float,
+        default=1,
+        help='Seconds between line timestamps in compressed logs (default %(default)s)')
+    parser.add_argument(
+        '--line_timing',
+        dest='line_timing',
+        action='store_true',
+        help='Record start and finish of every recipe line, see --analyze TARGET --lines')
+    parser.add_argument(
+        '--rusage',
+        dest='rusage',
+        action='store_true',
+        help='Record CPU time, max RSS, context switches and block I/O of every recipe line')
+    parser.add_argument(
+        '--event_stream',
+        action='store',
+        dest='event_stream',
+        type=str,
+        default=None,
+        help='Also send target events to this FIFO while it exists, see profile_make_collect')
     parser.add_argument(
         '--disable_loop_detection',
         dest='disable_loop_detection',
@@ -70,12 +257,66 @@ def main(argv=sys.argv[1:]):
         default=20,
         help='Depth of the nesting includes')
 
+    parser.add_argument(
+        '--no_parse_cache',
+        dest='parse_cache',
+        action='store_const',
+        const=None,
+        default=CACHE_FILENAME,
+        help='Parse the Makefile again instead of reading the parse result cached in %s' % CACHE_FILENAME)
+
     parser.add_argument('target', nargs='?')
 
     args, unknown_args = parser.parse_known_args(argv)
+    if args.logs == 'zstd' and importlib.util.find_spec('zstandard') is None:
+        parser.error('--logs zstd needs the zstandard package')
+    if args.checkpoint and args.max_runs is not None:
+        parser.error('--max_runs can\'t be used with --checkpoint, which keeps only the runs of the full result')
+    if args.checkpoint and args.timing_store:
+        parser.error('--checkpoint can\'t be used with --timing_store, which is synced incrementally itself')
+    if args.max_runs is not None and args.timing_store and not args.timing_store.endswith('.bin'):
+        parser.error('--max_runs needs a binary --timing_store (*.bin)')
+    if args.analyze and args.lines and args.timing_store:
+        parser.error('--lines can\'t be used with --timing_store, which doesn\'t keep recipe line events')
+
+    store = None
+    if args.timing_store:
+        store = timing_binary if args.timing_store.endswith('.bin') else timing_sqlite
+        store.sync(args.db_filename, args.timing_store)
+
+    if args.runs:
+        print_runs(list_runs(args.db_filename))
+        return
+
+    if args.utilisation is not None:
+        result = run_utilisation(args.db_filename, args.utilisation or None, job_limit(unknown_args))
+        if args.format == 'json':
+            print(json.dumps(result, indent=2))
+        else:
+            print_utilisation(result)
+        return
+
+    if args.analyze_all:
+        if args.timing_store:
+            stats = store.analyze_all_targets(args.timing_store)
+        else:
+            stats = analyze_all_targets(args.db_filename)
+        print_statistics(stats, args.format)
+        return
+
+    if args.analyze and args.lines:
+        commands = []
+        if os.path.isfile(args.in_filename):
+            ast, _ = load_makefile(args.in_filename, args.disable_loop_detection, args.include_depth, args.parse_cache)
+            commands = recipe_lines(ast, args.analyze)
+        print_lines(analyze_target_lines(args.db_filename, args.analyze), commands)
+        return
 
     if args.analyze:
-        stats = analyze_target(args.db_filename, args.analyze)
+        if args.timing_store:
+            stats = store.analyze_target(args.timing_store, args.analyze)
+        else:
+            stats = analyze_target(args.db_filename, args.analyze)
         print('started:', stats['started'])
         print('finished:', stats['finished'])
         if stats['finished']:
@@ -84,16 +325,24 @@ def main(argv=sys.argv[1:]):
             print('avg:', stats['avg'])
             print('median:', stats['median'])
             print('last:', stats['last'])
+        history = update_history(args.db_filename) if args.history else read_history(args.db_filename)
+        for name, value in quantiles(history, args.analyze).items():
+            print(name + ':', value)
         return
 
-    in_file = open(args.in_filename, 'r')
     if args.preprocess_only:
         out_file = io.StringIO()
     else:
         out_file = tempfile.NamedTemporaryFile(mode='w+')
 
-    ast = parse(in_file, args.disable_loop_detection, args.include_depth)
-    generate_makefile(ast, out_file, args.db_filename)
+    hooks = HOOK_SETS[args.hooks]
+    if args.logs != 'plain':
+        hooks = compressed_log_hooks(hooks, args.logs, args.log_max_bytes, args.log_stamp_interval)
+    if args.event_stream:
+        hooks = event_stream_hooks(hooks, os.path.abspath(args.event_stream))
+
+    ast, graph = load_makefile(args.in_filename, args.disable_loop_detection, args.include_depth, args.parse_cache)
+    generate_makefile(ast, out_file, args.db_filename, hooks, args.rusage, args.line_timing)
     out_file.flush()
 
     if args.preprocess_only:
@@ -111,8 +360,27 @@ def main(argv=sys.argv[1:]):
             continue
         for name in data.get('all_targets', [data['target']]):
             docs[name] = data['docs']
-    performance = parse_timing_db(args.db_filename, args.after_date)
-    deps, influences, order_only, indirect_influences = get_dependencies_influences(ast)
+    deps, influences, order_only, indirect_influences = dependency_maps(graph)
+    if args.timing_store:
+        options = {'max_runs': args.max_runs} if args.max_runs is not None else {}
+        performance = store.parse_timing_store(
+            args.timing_store,
+            args.after_date,
+            targets=set(graph.names) if args.reverse_scan else None,
+            **options)
+    else:
+        checkpoint = args.db_filename + '.checkpoint' if args.checkpoint else None
+        performance = parse_timing_db(
+            args.db_filename,
+            args.after_date,
+            checkpoint,
+            targets=set(graph.names) if args.reverse_scan else None,
+            max_runs=args.max_runs)
+    if args.history:
+        history = update_history(args.db_filename)
+        flag_regressions(performance, history)
+        annotate_quantiles(performance, history)
+    annotate_scheduler_wait(performance, deps)
 
     dot_file = io.StringIO()
 
@@ -135,9 +403,14 @@ def main(argv=sys.argv[1:]):
     export_report(
         performance,
         docs,
-        influences.keys()
+        graph.ids
     )
 
+    if args.export_runs:
+        export_runs(list_runs(args.db_filename))
+    if args.export_utilisation:
+        export_utilisation(run_utilisation(args.db_filename, jobs=job_limit(unknown_args)))
+
 
 if __name__ == '__main__':
     main()
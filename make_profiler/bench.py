@@ -0,0 +1,176 @@
+#!/usr/bin/python3
+"""Benchmark of the instrumentation overhead of the profiling hooks.
+
+Synthetic Makefiles with a given number of trivial targets, each depending
+on ``fan_in`` random earlier targets, are built with ``make -j`` first as
+they are and then preprocessed with each of the hook sets. The overhead per
+target is the difference in wall time divided by the number of targets.
+"""
+
+import argparse
+import io
+import json
+import logging
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from make_profiler.parser import parse
+from make_profiler.preprocess import HOOK_SETS, generate_makefile
+
+# Tools the hook sets need besides make.
+REQUIREMENTS = {
+    'default': ('gawk', 'hexdump', 'date'),
+    'light': ('bash',),
+}
+
+
+def synthetic_makefile(n_targets, fan_in, seed=0):
+    """Return a Makefile of ``n_targets`` targets touching their output.
+
+    Every target depends on up to ``fan_in`` targets picked at random among
+    the ones before it, ``all`` depends on every target.
+    """
+    rng = random.Random(seed)
+    names = ['t%d' % i for i in range(n_targets)]
+    lines = ['all: %s' % ' '.join(names), '']
+    for i, name in enumerate(names):
+        deps = sorted(rng.sample(names[:i], min(fan_in, i)))
+        lines.append('%s: %s' % (name, ' '.join(deps)))
+        lines.append('\ttouch $@')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def build_time(makefile, jobs):
+    """Return the wall time of building ``all`` of ``makefile`` from scratch."""
+    with tempfile.TemporaryDirectory() as directory:
+        with open('%s/Makefile' % directory, 'w') as fd:
+            fd.write(makefile)
+        started = time.perf_counter()
+        subprocess.run(
+            ['make', '-s', '-j%d' % jobs, 'all'],
+            cwd=directory, check=True, stdout=subprocess.DEVNULL)
+        return time.perf_counter() - started
+
+
+def run_benchmark(targets, fan_ins, jobs, hooks, repeat=3):
+    """Measure every combination of ``targets``, ``fan_ins`` and ``jobs``.
+
+    Each build is repeated ``repeat`` times and the fastest run is kept.
+    Returns a list of results holding the configuration, the ``plain`` wall
+    time and, for each of ``hooks``, its wall time and overhead per target.
+    """
+    results = []
+    for n_targets in targets:
+        for fan_in in fan_ins:
+            plain = synthetic_makefile(n_targets, fan_in)
+            makefiles = {}
+            for name in hooks:
+                out = io.StringIO()
+                generate_makefile(parse(io.StringIO(plain)), out, 'make_profile.db', HOOK_SETS[name])
+                makefiles[name] = out.getvalue()
+            for j in jobs:
+                result = {
+                    'targets': n_targets,
+                    'fan_in': fan_in,
+                    'jobs': j,
+                    'plain': min(build_time(plain, j) for _ in range(repeat)),
+                }
+                for name, makefile in makefiles.items():
+                    wall = min(build_time(makefile, j) for _ in range(repeat))
+                    result[name] = {
+                        'wall': wall,
+                        'per_target_ms': 1000 * (wall - result['plain']) / (n_targets + 1),
+                        'relative': wall / result['plain'] - 1,
+                    }
+                results.append(result)
+    return results
+
+
+def print_results(results, hooks):
+    print('%7s %6s %4s %9s' % ('targets', 'fan_in', 'jobs', 'plain, s')
+          + ''.join(' %26s' % ('%s, s / ms per target' % name) for name in hooks))
+    for result in results:
+        print('%7d %6d %4d %9.3f' % (result['targets'], result['fan_in'], result['jobs'], result['plain'])
+              + ''.join(' %9.3f / %6.2f (%+5.0f%%)' % (
+                  result[name]['wall'], result[name]['per_target_ms'], 100 * result[name]['relative'])
+                  for name in hooks))
+
+
+def main(argv=sys.argv[1:]):
+    options = argparse.ArgumentParser(
+        description='Measure how much the profiling hooks slow down synthetic builds.')
+    options.add_argument(
+        '--targets',
+        type=int,
+        nargs='+',
+        default=[200],
+        help='Numbers of targets (default %(default)s)')
+    options.add_argument(
+        '--fan_in',
+        type=int,
+        nargs='+',
+        default=[0, 4],
+        help='Numbers of dependencies of every target (default %(default)s)')
+    options.add_argument(
+        '-j',
+        dest='jobs',
+        type=int,
+        nargs='+',
+        default=[1, 8, 32, 64],
+        help='Numbers of parallel jobs (default %(default)s)')
+    options.add_argument(
+        '--hooks',
+        nargs='+',
+        choices=sorted(HOOK_SETS),
+        default=sorted(HOOK_SETS),
+        help='Hook sets to measure (default %(default)s)')
+    options.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Builds per measurement, the fastest one counts (default %(default)s)')
+    options.add_argument(
+        '--format',
+        choices=('table', 'json'),
+        default='table',
+        help='Output format (default %(default)s)')
+    options.add_argument(
+        '--max_overhead_ms',
+        type=float,
+        default=None,
+        help='Exit with an error when a hook set costs more than this per target')
+
+    args = options.parse_args(argv)
+    if not shutil.which('make'):
+        logging.error('make not found')
+        return 1
+    hooks = []
+    for name in args.hooks:
+        missing = [tool for tool in REQUIREMENTS[name] if not shutil.which(tool)]
+        if missing:
+            logging.warning('skipping %s hooks, missing %s', name, ', '.join(missing))
+        else:
+            hooks.append(name)
+
+    results = run_benchmark(args.targets, args.fan_in, args.jobs, hooks, args.repeat)
+    if args.format == 'json':
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results, hooks)
+
+    if args.max_overhead_ms is not None:
+        worst = max((r[name]['per_target_ms'] for r in results for name in hooks), default=0)
+        if worst > args.max_overhead_ms:
+            logging.error('overhead of %.2f ms per target exceeds %.2f ms', worst, args.max_overhead_ms)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -6,7 +6,9 @@ import os
 import shutil
 import sys
 
-from make_profiler.parser import parse, get_dependencies_influences
+from make_profiler.graph import Graph
+from make_profiler.parse_cache import CACHE_FILENAME, load_makefile
+from make_profiler.parser import parse
 
 
 def rm_node(node):
@@ -19,12 +21,9 @@ def rm_node(node):
         os.remove(node)
 
 
-def clean_target(target, subtree):
-    if target not in subtree:
-        return
-    for subtarget in subtree[target]:
+def clean_target(target, graph):
+    for subtarget in graph.descendants(target):
         rm_node(subtarget)
-        clean_target(subtarget, subtree)
 
 
 def main(argv=sys.argv[1:]):
@@ -37,6 +36,13 @@ def main(argv=sys.argv[1:]):
         type=str,
         default='Makefile',
         help='Makefile to read (default %(default)s)')
+    options.add_argument(
+        '--no_parse_cache',
+        dest='parse_cache',
+        action='store_const',
+        const=None,
+        default=CACHE_FILENAME,
+        help='Parse the Makefile again instead of reading and writing the parse result cached in %s' % CACHE_FILENAME)
     options.add_argument(
         'targets',
         default=['all'],
@@ -46,21 +52,21 @@ def main(argv=sys.argv[1:]):
         help='Targets to process')
 
     args = options.parse_args(argv)
-    in_file = open(args.in_filename, 'r') if args.in_filename else sys.stdin
-
-    ast = parse(in_file)
-    deps, influences, order_only, indirect_influences = get_dependencies_influences(ast)
+    if args.in_filename:
+        _, graph = load_makefile(args.in_filename, cache_filename=args.parse_cache)
+    else:
+        graph = Graph.from_ast(parse(sys.stdin))
 
     exit_code = 0
 
     for target in args.targets:
-        if target not in influences:
+        if target not in graph:
             logging.error('Target %s not found', target)
             exit_code = 1
             continue
 
         rm_node(target)
-        clean_target(target, influences)
+        clean_target(target, graph)
 
     return exit_code
 
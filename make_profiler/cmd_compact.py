@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from make_profiler.sketch import QuantileSketch
+from make_profiler.timing import AGGREGATE, LogIndex
+
+# pause before looking for lines appended to a replaced db once more
+SETTLE_INTERVAL = 0.1
+
+
+def fold_runs(record, target, runs, log_index):
+    """Fold ``runs`` of ``target`` into its aggregate ``record``.
+
+    ``runs`` maps a build id to a ``(start, finish)`` pair of timestamps,
+    either of them may be ``None``, oldest build first. Returns the updated
+    record together with the build id and timestamp the record line should
+    carry: those of the last run, its finish or its last event when it failed.
+    """
+    if record is None:
+        record = {'started': 0, 'count': 0, 'sum': 0.0, 'sumsq': 0.0, 'min': None, 'max': None, 'sketch': []}
+    sketch = QuantileSketch(record['sketch'])
+    last_bid = last_ts = None
+    for bid, (start, finish) in runs.items():
+        last_bid = bid
+        if start is not None:
+            record['started'] += 1
+        if start is None or finish is None or log_index.exists(bid, target, 'failed.touch'):
+            # the logs may be cleaned up later, only db times keep the lines in order
+            last_ts = max(t for t in (start, finish) if t is not None)
+            record['failed'] = start if start is not None else last_ts
+            continue
+        duration = finish - start
+        record['count'] += 1
+        record['sum'] += duration
+        record['sumsq'] += duration * duration
+        record['min'] = duration if record['min'] is None else min(record['min'], duration)
+        record['max'] = duration if record['max'] is None else max(record['max'], duration)
+        sketch.add(duration)
+        record.pop('failed', None)
+        record['bid'] = bid
+        record['start'] = start
+        record['finish'] = last_ts = finish
+        record['last'] = duration
+    record['sketch'] = sketch.to_list()
+    return record, last_bid, last_ts
+
+
+def compact(filename, keep_runs, log_index=None):
+    """Fold all but the last ``keep_runs`` builds of ``filename`` into aggregates.
+
+    Raw start and finish lines of older builds are replaced by one aggregate
+    record per target holding the number of started and successful runs, the
+    sum, sum of squares, minimum and maximum of successful run durations, a
+    quantile sketch, the build id, start and finish of the last successful
+    run and, when the last run failed, its start. The record line carries
+    the build id and finish, or last event when it failed, of the last run.
+    Aggregates written by a previous compaction are merged into the new ones,
+    resource usage and recipe line events of the folded builds are dropped.
+    Aggregates are written in the order of the runs they end with, so the
+    newest one still comes last when ``keep_runs`` is 0 and every build is
+    folded. Returns the number of builds folded.
+    """
+    if keep_runs < 0:
+        raise ValueError('number of builds to keep must not be negative: %d' % keep_runs)
+    if log_index is None:
+        log_index = LogIndex()
+
+    # the db stays open until it is replaced, so that lines a running build
+    # appends to it meanwhile can still be carried over
+    with open(filename, 'rb') as src:
+        data = src.read()
+        # an unterminated last line may still be being written by make
+        data = data[:data.rfind(b'\n') + 1]
+        src.seek(len(data))
+        folded = _compact_lines(filename, data.decode('utf-8').splitlines(), keep_runs, log_index, src)
+    return folded
+
+
+def _compact_lines(filename, lines, keep_runs, log_index, src):
+    """Write the compacted ``lines`` of ``filename`` followed by the rest of ``src``."""
+    builds = {}
+    records = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 5 and parts[2] == AGGREGATE:
+            records[parts[3]] = (parts[1], parts[0], json.loads(parts[4]))
+        elif len(parts) == 4:
+            builds.setdefault(parts[1], None)
+    kept = set(list(builds)[-keep_runs:]) if keep_runs else set()
+    folded = [bid for bid in builds if bid not in kept]
+    if not folded:
+        return 0
+
+    old_runs = {}
+    raw_lines = []
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 5 and parts[2] != AGGREGATE and parts[1] in kept:
+            # resource usage and recipe line events
+            raw_lines.append(line)
+        if len(parts) != 4:
+            continue
+        ts, bid, action, target = parts
+        if bid in kept:
+            raw_lines.append(line)
+        elif action in ('start', 'finish'):
+            run = old_runs.setdefault(target, {}).setdefault(bid, [None, None])
+            run[action == 'finish'] = float(ts)
+
+    for target, runs in old_runs.items():
+        record = records.get(target, (None, None, None))[2]
+        record, bid, ts = fold_runs(record, target, runs, log_index)
+        records[target] = (bid, repr(ts), record)
+
+    tmp_name = filename + '.compact'
+    with open(tmp_name, 'wb') as fd:
+        for target, (bid, ts, record) in sorted(records.items(), key=lambda item: (float(item[1][1]), item[0])):
+            fd.write(('%s %s %s %s %s\n' % (
+                ts, bid, AGGREGATE, target, json.dumps(record, separators=(',', ':')))).encode('utf-8'))
+        for line in raw_lines:
+            fd.write((line + '\n').encode('utf-8'))
+        # keep lines appended by a running build while the db was compacted
+        fd.write(src.read())
+    os.replace(tmp_name, filename)
+    # hooks that opened the db before it got replaced still append to the
+    # old file, move what they write there over until they are done
+    while True:
+        time.sleep(SETTLE_INTERVAL)
+        tail = src.read()
+        if not tail:
+            break
+        with open(filename, 'ab') as fd:
+            fd.write(tail)
+    return len(folded)
+
+def main(argv=sys.argv[1:]):
+    options = argparse.ArgumentParser(
+        description='Folds old builds of the profile into per-target aggregates.')
+    options.add_argument(
+        '-db',
+        action='store',
+        dest='db_filename',
+        type=str,
+        default='make_profile.db',
+        help='Profile with timings (default %(default)s)')
+    options.add_argument(
+        '-n',
+        action='store',
+        dest='keep_runs',
+        type=int,
+        default=20,
+        help='Number of most recent builds to keep raw events for, 0 folds all of them (default %(default)s)')
+
+    args = options.parse_args(argv)
+    if args.keep_runs < 0:
+        options.error('-n must not be negative')
+    if not os.path.isfile(args.db_filename):
+        logging.error('Profile %s not found', args.db_filename)
+        return 1
+
+    folded = compact(args.db_filename, args.keep_runs)
+    logging.info('folded %d builds of %s', folded, args.db_filename)
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
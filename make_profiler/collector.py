@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+"""Collector of live build events.
+
+``profile_make --event_stream make_profile.fifo`` makes the Makefile hooks
+send every ``start``, ``finish`` and ``fail`` event, formatted like a db
+line, to the given FIFO as well. The collector reads the db once and then
+follows the FIFO, folding every event into the same reduced state the
+``--checkpoint`` sidecar keeps, so that the per-target information of
+``timing.parse_timing_db`` is available at any moment without reading the
+db again. ``profile_make_collect`` rewrites ``report.json`` from it while a
+build is running.
+
+The hooks only write to the FIFO while it exists and open it write-only
+and non-blocking, dropping the event when nobody reads it or its buffer is
+full, so builds don't wait for a collector that is gone or stalled.
+"""
+
+import argparse
+import errno
+import logging
+import os
+import select
+import signal
+import sys
+import time
+
+from make_profiler.parse_cache import CACHE_FILENAME, load_makefile
+from make_profiler.report_export import export_report
+from make_profiler.timing import (
+    FAIL,
+    LogIndex,
+    _collect_targets,
+    _empty_checkpoint,
+    _fold_lines,
+    _read_appended,
+    _retained_lines,
+)
+
+
+class Collector:
+    """In-memory timing state kept up to date from an event stream."""
+
+    def __init__(self, db_filename, fifo):
+        self.fifo = fifo
+        if not os.path.exists(fifo):
+            os.mkfifo(fifo)
+        # opened before the db is read so that no event gets lost, events
+        # that also made it into the db are folded twice, which is harmless;
+        # read-write so that it never reports end of file when hooks close it
+        self.fd = os.open(fifo, os.O_RDWR | os.O_NONBLOCK)
+        self.buffer = b''
+        self.log_index = LogIndex()
+        self.state = _empty_checkpoint()
+        self.updated = time.time()
+        if os.path.isfile(db_filename):
+            lines, _, _ = _read_appended(db_filename, 0)
+            _fold_lines(self.state, (line.split() for line in lines))
+
+    def close(self):
+        os.close(self.fd)
+        os.unlink(self.fifo)
+
+    def feed(self, data):
+        """Fold the events in ``data`` read from the FIFO into the state."""
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b'\n')
+        events = [line.decode('utf-8').split() for line in lines]
+        events = [parts for parts in events if len(parts) == 4]
+        if not events:
+            return 0
+        _fold_lines(self.state, [parts for parts in events if parts[2] != FAIL])
+        for _, bid, _, target in events:
+            # pick up the log and failed.touch files of the target
+            self.log_index.refresh(bid, target)
+        self.updated = time.time()
+        return len(events)
+
+    def poll(self, timeout=None):
+        """Wait up to ``timeout`` seconds for events and fold them in."""
+        received = 0
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        while ready:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+                break
+            received += self.feed(data)
+        return received
+
+    def targets(self, after_date=None):
+        """Return the same per-target information as ``timing.parse_timing_db``."""
+        return _collect_targets(_retained_lines(self.state), after_date, log_index=self.log_index)
+
+
+def main(argv=sys.argv[1:]):
+    options = argparse.ArgumentParser(
+        description='Keep report.json up to date from the events of a running build.')
+    options.add_argument(
+        '-f',
+        action='store',
+        dest='in_filename',
+        type=str,
+        default='Makefile',
+        help='Makefile to read (default %(default)s)')
+    options.add_argument(
+        '-db',
+        action='store',
+        dest='db_filename',
+        type=str,
+        default='make_profile.db',
+        help='Profile with timings (default %(default)s)')
+    options.add_argument(
+        '--fifo',
+        action='store',
+        dest='fifo',
+        type=str,
+        default='make_profile.fifo',
+        help='FIFO passed to profile_make --event_stream (default %(default)s)')
+    options.add_argument(
+        '--interval',
+        action='store',
+        dest='interval',
+        type=float,
+        default=0.5,
+        help='Minimum seconds between report updates (default %(default)s)')
+    options.add_argument(
+        '--no_parse_cache',
+        dest='parse_cache',
+        action='store_const',
+        const=None,
+        default=CACHE_FILENAME,
+        help='Parse the Makefile again instead of reading and writing the parse result cached in %s' % CACHE_FILENAME)
+
+    args = options.parse_args(argv)
+    ast, graph = load_makefile(args.in_filename, cache_filename=args.parse_cache)
+    docs = {}
+    for ttype, data in ast:
+        if ttype == 'target':
+            for name in data.get('all_targets', [data['target']]):
+                docs[name] = data['docs']
+
+    collector = Collector(args.db_filename, args.fifo)
+    # unlink the FIFO on the way out when terminated as well
+    for signum in (signal.SIGTERM, signal.SIGHUP):
+        signal.signal(signum, lambda signum, frame: sys.exit(128 + signum))
+    logging.info('collecting events from %s', args.fifo)
+    try:
+        while True:
+            export_report(collector.targets(), docs, graph.ids)
+            # wait for the next event, then let more of them pile up
+            collector.poll()
+            time.sleep(args.interval)
+            collector.poll(0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.close()
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Critical path method over the targets of a Makefile.
+
+:func:`schedule` visits every target reachable from the inputs once in
+topological order of ``influences`` to get its earliest start, then once in
+the reverse order to get its latest start, so the whole computation is
+linear in the number of targets and edges. Targets with no slack between the two form the critical path.
+"""
+
+import collections
+import math
+
+# slack left by rounding of fractional durations still counts as none
+SLACK_TOLERANCE = 1e-6
+
+
+def _topological(nodes, edges):
+    """Yield ``nodes`` so that every node comes after the ones leading to it.
+
+    ``edges(node)`` lists the nodes a node leads to; edges leaving ``nodes``
+    are ignored. Nodes on a dependency cycle are yielded last, in no
+    particular order, instead of never.
+    """
+    pending = collections.Counter()
+    for node in nodes:
+        for z in edges(node):
+            if z in nodes:
+                pending[z] += 1
+    queue = collections.deque(node for node in nodes if not pending[node])
+    seen = set()
+    while queue:
+        node = queue.popleft()
+        seen.add(node)
+        yield node
+        for z in edges(node):
+            if z in nodes:
+                pending[z] -= 1
+                if not pending[z]:
+                    queue.append(z)
+    for node in nodes:
+        if node not in seen:
+            yield node
+
+
+def schedule(influences, inputs, durations):
+    """Compute the earliest and latest times of the targets built from ``inputs``.
+
+    ``influences`` maps a target to the targets depending on it and
+    ``durations`` a target to its expected duration. Returns
+    ``{target: {'early_start', 'duration', 'early_end', 'late_start',
+    'late_end', 'slack'}}`` for every target reachable from ``inputs``.
+    Final targets end as early as they can, every other target before the
+    latest start of the targets depending on it.
+    """
+    reached = set()
+    stack = list(inputs)
+    while stack:
+        t = stack.pop()
+        if t not in reached:
+            reached.add(t)
+            stack.extend(influences.get(t, ()))
+
+    order = list(_topological(reached, lambda t: influences.get(t, ())))
+    targets = {t: {'early_start': 0.0} for t in order}
+    for t in order:
+        target = targets[t]
+        target['duration'] = durations(t)
+        target['early_end'] = target['early_start'] + target['duration']
+        for z in influences.get(t, ()):
+            targets[z]['early_start'] = max(targets[z]['early_start'], target['early_end'])
+
+    for t in reversed(order):
+        target = targets[t]
+        late_ends = [targets[z]['late_start'] for z in influences.get(t, ()) if 'late_start' in targets[z]]
+        target['late_end'] = min(late_ends) if late_ends else target['early_end']
+        target['late_start'] = target['late_end'] - target['duration']
+        target['slack'] = target['late_start'] - target['early_start']
+    return targets
+
+
+def critical_set(targets):
+    """Names of the scheduled ``targets`` that can't start any later."""
+    return {t for t, target in targets.items() if math.isclose(target['slack'], 0, abs_tol=SLACK_TOLERANCE)}
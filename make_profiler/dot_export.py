@@ -7,70 +7,48 @@ import math
 from subprocess import Popen, PIPE
 from graphviz import Digraph
 
+from make_profiler.critical_path import critical_set, schedule
+
 # Build DOT graphs using the ``graphviz`` library to ensure that
 # node names and attributes are properly escaped.
 
+def estimated_duration(perf):
+    """Expected duration of a target in seconds, 1 when nothing is known.
+
+    Running targets are expected to take at least their median duration.
+    """
+    duration = perf.get('timing_sec', perf.get('p50', 1))
+    if perf.get('running') and 'p50' in perf:
+        duration = max(duration, perf['p50'])
+    return duration
+
+
 def critical_path(influences, dependencies, inputs, timing):
-    targets = dict()
-    update_queue = list(inputs)
-    results = list()
-
-    # forward: early start
-    while update_queue:
-        t = update_queue.pop(0)
-        if t not in targets:
-            targets[t] = {"early_start": 0.0}
-        if t in timing:
-            duration = timing[t].get('timing_sec', 1)
-        else:
-            duration = 1
-        targets[t]["duration"] = duration
-        targets[t]["early_end"] = targets[t]["early_start"] + duration
-        # add timing tag as hour number from very start
-        targets[t]["timing_tag"] = math.ceil(targets[t]["early_end"]/60/10)
-        targets[t]["pin_timing_tag"] = True
-        for z in influences[t]:
-            update_queue.append(z)
-            if z not in targets:
-                targets[z] = {"early_start": targets[t]["early_end"]}
-            else:
-                targets[z]["early_start"] = max(targets[z]["early_start"], targets[t]["early_end"])
-        if not influences[t]:
-            results.append(t)
-            # don't pin the final targets to the timeline
-            targets[t]["pin_timing_tag"] = False
-
-    # backward: late start
-    update_queue = results
-    while update_queue:
-        t = update_queue.pop(0)
-        if "late_end" not in targets[t]:
-            targets[t]["late_end"] = targets[t]["early_end"]
-        targets[t]["late_start"] = targets[t]["late_end"] - targets[t]["duration"]
-        for d in dependencies.get(t, []):
-            for z in d:
+    """Return the critical path and the targets pinned to each timing tag.
+
+    Timing tags count ten minute steps from the start of the build until
+    the earliest end of a target. Final targets aren't pinned, nor are
+    targets ending in the same step as a target depending on them.
+    """
+    targets = schedule(influences, inputs, lambda t: estimated_duration(timing.get(t, {})))
+
+    for z in targets.values():
+        z['timing_tag'] = math.ceil(z['early_end'] / 60 / 10)
+    # don't pin the final targets to the timeline
+    unpinned = {t for t in targets if not influences.get(t)}
+    for t, z in targets.items():
+        for deps in dependencies.get(t, ()):
+            for d in deps:
                 # don't pin timing tags for dependencies if they're at the same tag
-                if targets[z]["timing_tag"] == targets[t]["timing_tag"]:
-                    targets[z]["pin_timing_tag"] = False
-                if z not in update_queue:
-                    update_queue.append(z)
-                if "late_end" not in targets[z]:
-                    targets[z]["late_end"] = targets[t]["late_start"]
-                else:
-                    targets[z]["late_end"] = min(targets[t]["late_start"], targets[z]["late_end"])
-
-    cp = set()
+                if d in targets and targets[d]['timing_tag'] == z['timing_tag']:
+                    unpinned.add(d)
+
     timing_tags = {}
     for t, z in targets.items():
-        if z["early_start"] == z["late_start"]:
-            cp.add(t)
-        if z["pin_timing_tag"]:
-            if z["timing_tag"] not in timing_tags:
-                timing_tags[z["timing_tag"]] = [t]
-            else:
-                timing_tags[z["timing_tag"]].append(t)
+        if t not in unpinned:
+            timing_tags.setdefault(z['timing_tag'], []).append(t)
 
-    return cp, timing_tags
+    return critical_set(targets), timing_tags
 
 
 def current_run_critical_path(influences, dependencies, timing):
@@ -80,22 +58,13 @@ def current_run_critical_path(influences, dependencies, timing):
         return set()
 
     inf = {k: {d for d in v if d in current} for k, v in influences.items() if k in current}
-    deps = {}
-    for k, (deps_list, order_list) in dependencies.items():
-        if k not in current:
-            continue
-        deps[k] = [
-            [d for d in deps_list if d in current],
-            [d for d in order_list if d in current],
-        ]
 
     inputs = set(inf.keys())
     for v in inf.values():
         for t in v:
             inputs.discard(t)
 
-    cp, _ = critical_path(inf, deps, inputs, timing)
-    return cp
+    return critical_set(schedule(inf, inputs, lambda t: estimated_duration(timing.get(t, {}))))
 
 
 def classify_target(name, influences, dependencies, inputs, order_only):
@@ -128,6 +97,10 @@ def dot_node(graph, name, performance, docstring, cp, *, invisible=False):
         # Mark targets built in the current run with a dedicated color.
         if target_performance.get('failed'):
             node['fillcolor'] = '.05 .3 1.0'
+        elif target_performance.get('regression'):
+            # finished in the current run, but much slower than usual
+            node['fillcolor'] = '#FB8C00'
+            node['fontcolor'] = '#fff'
         elif target_performance.get('current'):
             node['fillcolor'] = '#0969DA'
             node['fontcolor'] = '#fff'
@@ -142,6 +115,15 @@ def dot_node(graph, name, performance, docstring, cp, *, invisible=False):
         if timing != '0:00:00':
             node['label'] += '\\n%s\\r' % timing
             node['fontsize'] = min(max(timing_sec ** .5, node['fontsize']), 150)
+        rusage = target_performance.get('rusage')
+        if rusage:
+            cpu_sec = rusage.get('utime', 0) + rusage.get('stime', 0)
+            node['label'] += '\\ncpu %s, rss %d MB\\r' % (
+                datetime.timedelta(seconds=int(cpu_sec)), rusage.get('maxrss', 0) // 1024)
+        # time the target was ready but waited for a job slot
+        wait_sec = int(target_performance.get('wait_sec', 0))
+        if wait_sec:
+            node['label'] += '\\nwaited %s\\r' % datetime.timedelta(seconds=wait_sec)
     if name in cp:
         node['color'] = '#cc0000'
     node['group'] = '/'.join(name.split('/')[:2])
@@ -0,0 +1,264 @@
+"""Compact dependency graph of a Makefile.
+
+Targets get integer ids in the order they appear in the rules, their names
+are interned and the edges are kept in CSR form:
+for a target ``i`` its neighbours are ``targets[offsets[i]:offsets[i + 1]]``
+of flat ``array`` columns. Generated Makefiles with a hundred thousand
+targets then take a few megabytes instead of a dict of sets per relation;
+the dicts ``get_dependencies_influences`` returns are built from the graph
+only by the callers that need them.
+"""
+
+import collections
+import collections.abc
+import sys
+from array import array
+
+
+def _csr(rows):
+    """Pack a list of id sequences into ``(offsets, targets)`` arrays."""
+    offsets = array('I', [0])
+    targets = array('I')
+    for row in rows:
+        targets.extend(row)
+        offsets.append(len(targets))
+    return offsets, targets
+
+
+class Graph:
+    """Targets of a Makefile with their prerequisites and dependants."""
+
+    __slots__ = (
+        'names', 'ids', 'rule_ids',
+        'dep_offsets', 'dep_ids', 'order_offsets', 'order_ids',
+        'influence_offsets', 'influence_ids', 'order_only',
+    )
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def _add(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            name = sys.intern(name)
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    @classmethod
+    def from_ast(cls, ast):
+        """Build the graph of the rules of a parsed Makefile.
+
+        Every rule of a target replaces its prerequisites, but the targets
+        all of its rules depend on influence it. Grouped targets are merged
+        into the first one, ``.PHONY`` is left out.
+        """
+        graph = cls()
+        alias_map = {}
+        for item_t, item in ast:
+            if item_t != 'target':
+                continue
+            targets = item.get('all_targets', [item['target']])
+            for alias_name in targets[1:]:
+                alias_map[alias_name] = targets[0]
+
+        rules = {}
+        influences = []
+        order_only = set()
+        for item_t, item in ast:
+            if item_t != 'target':
+                continue
+            target = alias_map.get(item['target'], item['target'])
+            if target in ('.PHONY',):
+                continue
+            deps, order_deps = item['deps']
+            t = graph._add(target)
+            deps = [graph._add(alias_map.get(d, d)) for d in deps]
+            order_deps = [graph._add(alias_map.get(d, d)) for d in order_deps]
+            # a new rule of the same target keeps its position
+            rules[t] = (deps, order_deps)
+            influences.extend((d, t) for d in deps)
+            order_only.update(order_deps)
+
+        n = len(graph.names)
+        graph.rule_ids = array('I', rules)
+        graph.dep_offsets, graph.dep_ids = _csr(rules.get(i, ((), ()))[0] for i in range(n))
+        graph.order_offsets, graph.order_ids = _csr(rules.get(i, ((), ()))[1] for i in range(n))
+        rows = [[] for _ in range(n)]
+        for d, t in sorted(set(influences)):
+            rows[d].append(t)
+        graph.influence_offsets, graph.influence_ids = _csr(rows)
+        graph.order_only = bytearray(n)
+        for i in order_only:
+            graph.order_only[i] = 1
+        return graph
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def deps_of(self, i):
+        """Ids of the normal prerequisites of target ``i``."""
+        return self.dep_ids[self.dep_offsets[i]:self.dep_offsets[i + 1]]
+
+    def order_deps_of(self, i):
+        """Ids of the order-only prerequisites of target ``i``."""
+        return self.order_ids[self.order_offsets[i]:self.order_offsets[i + 1]]
+
+    def influences_of(self, i):
+        """Ids of the targets that depend on target ``i``."""
+        return self.influence_ids[self.influence_offsets[i]:self.influence_offsets[i + 1]]
+
+    def descendants(self, name):
+        """Names of all targets that depend on ``name``, directly or not."""
+        seen = bytearray(len(self.names))
+        stack = [self.ids[name]]
+        result = []
+        while stack:
+            for t in self.influences_of(stack.pop()):
+                if not seen[t]:
+                    seen[t] = 1
+                    result.append(self.names[t])
+                    stack.append(t)
+        return result
+
+    def redundant_influences(self):
+        """Return the direct dependants also reached through other targets.
+
+        The result maps a target id to the ids of the targets it influences
+        directly as well as through another target, which are the edges a
+        transitive reduction of the graph drops. Targets are visited after
+        all the targets they influence, each keeping the ranks it reaches as
+        an integer bitset until all targets depending on it are visited, so
+        only the bitsets of the frontier are alive. Ranking dependants first
+        keeps the bitsets short when many targets feed a few results. Edges
+        closing a dependency cycle are ignored.
+        """
+        n = len(self.names)
+        rows = [[] for _ in range(n)]
+        for d in range(n):
+            for t in self.influences_of(d):
+                rows[t].append(d)
+        parent_offsets, parent_ids = _csr(rows)
+        del rows
+
+        pending = array('I', (self.influence_offsets[i + 1] - self.influence_offsets[i] for i in range(n)))
+        waiting = array('I', (parent_offsets[i + 1] - parent_offsets[i] for i in range(n)))
+        rank = array('i', [-1]) * n
+        reach = {}
+        redundant = {}
+        queue = collections.deque(i for i in range(n) if not pending[i])
+        ranked = 0
+        next_forced = 0
+        while ranked < n:
+            if not queue:
+                # the rest depends on a cycle, break it at the first target left
+                while rank[next_forced] >= 0:
+                    next_forced += 1
+                queue.append(next_forced)
+            i = queue.popleft()
+            if rank[i] >= 0:
+                continue
+            children = [t for t in self.influences_of(i) if rank[t] >= 0]
+            below = 0
+            for t in children:
+                below |= reach[t]
+            shortcuts = [t for t in children if below >> rank[t] & 1]
+            if shortcuts:
+                redundant[i] = shortcuts
+            for t in children:
+                below |= 1 << rank[t]
+                waiting[t] -= 1
+                if not waiting[t]:
+                    del reach[t]
+            rank[i] = ranked
+            ranked += 1
+            if waiting[i]:
+                reach[i] = below
+            for p in parent_ids[parent_offsets[i]:parent_offsets[i + 1]]:
+                pending[p] -= 1
+                if not pending[p]:
+                    queue.append(p)
+        return redundant
+
+    def dependencies(self):
+        """Return ``{target: [deps, order_deps]}`` for targets having a rule."""
+        names = self.names
+        return {
+            names[i]: [[names[d] for d in self.deps_of(i)], [names[d] for d in self.order_deps_of(i)]]
+            for i in self.rule_ids
+        }
+
+    def influences(self):
+        """Return ``{target: set of targets depending on it}`` for all targets."""
+        names = self.names
+        result = collections.defaultdict(set)
+        for i, name in enumerate(names):
+            result[name] = {names[t] for t in self.influences_of(i)}
+        return result
+
+    def order_only_names(self):
+        return {name for name, flag in zip(self.names, self.order_only) if flag}
+
+
+class IndirectInfluences(collections.abc.Mapping):
+    """Targets each target influences through at least one other target.
+
+    Edges from a target to a target it also influences indirectly are the
+    redundant ones the graph draws dashed. Checking a direct dependant only
+    needs :meth:`Graph.redundant_influences`, computed once on first access;
+    the complete set of a target is only walked when it is iterated or
+    checked for other targets.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.redundant = None
+
+    def __getitem__(self, name):
+        if self.redundant is None:
+            self.redundant = self.graph.redundant_influences()
+        return _IndirectSet(self, self.graph.ids.get(name))
+
+    def __iter__(self):
+        return iter(self.graph.names)
+
+    def __len__(self):
+        return len(self.graph.names)
+
+
+class _IndirectSet(collections.abc.Set):
+    __slots__ = ('influences', 'target', 'names')
+
+    def __init__(self, influences, target):
+        self.influences = influences
+        self.target = target
+        self.names = None
+
+    def _walk(self):
+        if self.names is None:
+            graph = self.influences.graph
+            self.names = set()
+            if self.target is not None:
+                for t in graph.influences_of(self.target):
+                    if graph.names[t] not in self.names:
+                        self.names.update(graph.descendants(graph.names[t]))
+        return self.names
+
+    def __contains__(self, name):
+        graph = self.influences.graph
+        t = graph.ids.get(name)
+        if t is None or self.target is None:
+            return False
+        if t in graph.influences_of(self.target):
+            return t in self.influences.redundant.get(self.target, ())
+        return name in self._walk()
+
+    def __iter__(self):
+        return iter(self._walk())
+
+    def __len__(self):
+        return len(self._walk())
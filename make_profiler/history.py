@@ -0,0 +1,200 @@
+"""Per-target duration history used to spot performance regressions.
+
+For every target an exponentially weighted moving average and variance of
+its successful run durations, together with a quantile sketch of all of
+them, is kept in a JSON sidecar next to ``make_profile.db`` and updated
+incrementally from lines appended to the db. The moving statistics from
+before the latest run of a target are kept as well, so that the current run
+can be compared with the history it is not part of.
+"""
+
+import json
+import math
+import os
+
+from make_profiler.sketch import QuantileSketch
+from make_profiler.timing import AGGREGATE, _prefix_unchanged, _read_appended, _save_state
+
+# Weight of the newest duration in the moving average.
+ALPHA = 0.2
+
+# A target is flagged when its current duration exceeds the moving average
+# by SIGMAS standard deviations and by at least MIN_SECONDS and MIN_RATIO of
+# the average, once it has MIN_RUNS runs of history.
+SIGMAS = 3
+MIN_SECONDS = 5
+MIN_RATIO = 0.25
+MIN_RUNS = 3
+
+
+def _empty_history():
+    return {'offset': 0, 'tail': '', 'cur_run_bid': '', 'horizon': 0, 'pending': {}, 'targets': {}}
+
+
+def _load_history(filename, history_filename):
+    empty = _empty_history()
+    if not os.path.isfile(history_filename):
+        return empty
+    try:
+        with open(history_filename, encoding='utf-8') as fd:
+            state = json.load(fd)
+    except ValueError:
+        return empty
+    if not _prefix_unchanged(filename, state['offset'], state['tail']):
+        # the db was compacted or rotated: read it again, skipping the
+        # durations that are already part of the history
+        state['offset'] = 0
+        state['tail'] = ''
+        state['rescan'] = True
+    return state
+
+
+def _fold_duration(entry, sketch, bid, duration):
+    """Add ``duration`` of build ``bid`` to the statistics ``entry``."""
+    if entry.get('bid') == bid:
+        # the same run finished again, replace its duration
+        entry['mean'], entry['var'], entry['n'] = entry['base']
+    else:
+        sketch.add(duration)
+    entry['base'] = [entry['mean'], entry['var'], entry['n']]
+    if entry['n'] == 0:
+        entry['mean'] = duration
+    else:
+        diff = duration - entry['mean']
+        increment = ALPHA * diff
+        entry['mean'] += increment
+        entry['var'] = (1 - ALPHA) * (entry['var'] + diff * increment)
+    entry['n'] += 1
+    entry['bid'] = bid
+    entry['last'] = duration
+
+
+def _seed_from_aggregate(entry, sketch, record):
+    """Start the history of a target from its ``profile_make_compact`` record."""
+    count = record['count']
+    if not count or entry['n']:
+        return
+    mean = record['sum'] / count
+    entry['mean'] = mean
+    entry['var'] = max(record['sumsq'] / count - mean * mean, 0)
+    entry['n'] = count
+    entry['base'] = [entry['mean'], entry['var'], entry['n']]
+    sketch.merge(QuantileSketch(record['sketch']))
+
+
+def update_history(filename, history_filename=None):
+    """Fold lines appended to ``filename`` into the duration history.
+
+    Returns the history state, which is also written to ``history_filename``
+    (``make_profile.db.history`` by default).
+    """
+    if history_filename is None:
+        history_filename = filename + '.history'
+    if not os.path.isfile(filename):
+        return _empty_history()
+    state = _load_history(filename, history_filename)
+    rescan = state.pop('rescan', False)
+    lines, offset, tail = _read_appended(filename, state['offset'])
+    if not lines and not rescan:
+        return state
+
+    sketches = {}
+
+    def target_history(target):
+        entry = state['targets'].setdefault(target, {'mean': 0.0, 'var': 0.0, 'n': 0, 'sketch': []})
+        if target not in sketches:
+            sketches[target] = QuantileSketch(entry['sketch'])
+        return entry, sketches[target]
+
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 5 and parts[2] == AGGREGATE:
+            _seed_from_aggregate(*target_history(parts[3]), json.loads(parts[4]))
+            continue
+        if len(parts) != 4:
+            continue
+        ts, bid, action, target = parts
+        ts = float(ts)
+        state['cur_run_bid'] = bid
+        if action == 'start':
+            state['pending'][target] = [bid, ts]
+        elif action == 'finish':
+            pending = state['pending'].pop(target, None)
+            if pending is None or pending[0] != bid or (rescan and ts < state['horizon']):
+                continue
+            _fold_duration(*target_history(target), bid, ts - pending[1])
+            state['horizon'] = max(state['horizon'], ts)
+    for target, sketch in sketches.items():
+        state['targets'][target]['sketch'] = sketch.to_list()
+    state['offset'] = offset
+    state['tail'] = tail
+    _save_state(history_filename, state)
+    return state
+
+
+def read_history(filename, history_filename=None):
+    """Return the duration history kept next to ``filename`` as it is.
+
+    Unlike :func:`update_history` the db isn't read, so lines appended
+    since the history was last updated are missing from it. The history is
+    empty when there is no sidecar.
+    """
+    if history_filename is None:
+        history_filename = filename + '.history'
+    return _load_history(filename, history_filename)
+
+
+def baseline(history, target):
+    """Return ``(mean, stddev, runs)`` of ``target`` excluding the current build."""
+    entry = history['targets'].get(target)
+    if entry is None:
+        return 0.0, 0.0, 0
+    if entry['bid'] == history['cur_run_bid']:
+        mean, var, n = entry['base']
+    else:
+        mean, var, n = entry['mean'], entry['var'], entry['n']
+    return mean, math.sqrt(var), n
+
+
+def flag_regressions(performance, history):
+    """Mark targets of the current build that got significantly slower.
+
+    Finished targets of the current build get a ``regression`` flag and the
+    ``baseline_sec`` moving average they were compared with.
+    """
+    for target, perf in performance.items():
+        if not perf.get('current') or perf.get('running') or perf.get('failed'):
+            continue
+        mean, stddev, n = baseline(history, target)
+        if n < MIN_RUNS:
+            continue
+        duration = perf.get('timing_sec', 0)
+        perf['baseline_sec'] = mean
+        perf['regression'] = (
+            duration > mean + SIGMAS * stddev
+            and duration - mean > max(MIN_SECONDS, MIN_RATIO * mean))
+    return performance
+
+
+def quantiles(history, target):
+    """Return the ``p50``, ``p95`` and ``p99`` duration of ``target``.
+
+    The values come from the quantile sketch of all successful runs seen so
+    far, an empty dictionary is returned for targets without history.
+    """
+    entry = history['targets'].get(target)
+    if not entry or not entry.get('sketch'):
+        return {}
+    sketch = QuantileSketch(entry['sketch'])
+    return {
+        'p50': sketch.quantile(0.5),
+        'p95': sketch.quantile(0.95),
+        'p99': sketch.quantile(0.99),
+    }
+
+
+def annotate_quantiles(performance, history):
+    """Add ``p50``, ``p95`` and ``p99`` durations to every target with history."""
+    for target, perf in performance.items():
+        perf.update(quantiles(history, target))
+    return performance
@@ -1,12 +1,13 @@
 import argparse
 import collections
+import linecache
 import os
 import re
 import sys
 from dataclasses import dataclass
 from typing import Callable
 
-from make_profiler.parser import parse
+from make_profiler.parse_cache import CACHE_FILENAME, load_makefile
 
 
 @dataclass
@@ -17,6 +18,7 @@ class LintError:
     message: str
     line_number: int | None = None
     line_text: str | None = None
+    filename: str | None = None
 
 
 def parse_args():
@@ -27,6 +29,15 @@ def parse_args():
         default="Makefile",
         help="Makefile to read (default %(default)s)",
     )
+    parser.add_argument(
+        "--no_parse_cache",
+        dest="parse_cache",
+        action="store_const",
+        const=None,
+        default=CACHE_FILENAME,
+        help="Parse the Makefile again instead of reading and writing the parse result cached in %s"
+        % CACHE_FILENAME,
+    )
 
     return parser.parse_args()
 
@@ -38,6 +49,7 @@ class TargetData:
     line_number: int | None = None
     line_text: str | None = None
     grouped: bool = False
+    filename: str | None = None
 
 
 def _create_error(
@@ -45,6 +57,7 @@ def _create_error(
     message: str,
     line_number: int | None = None,
     line_text: str | None = None,
+    filename: str | None = None,
 ) -> LintError:
     """Construct a LintError with consistent arguments."""
 
@@ -53,6 +66,7 @@ def _create_error(
         message=message,
         line_number=line_number,
         line_text=line_text,
+        filename=filename,
     )
 
 
@@ -110,8 +124,14 @@ def parse_targets(
             continue
 
         names = data.get("all_targets", [data["target"]])
+        source = data.get("source")
         for name in names:
             line_number, line_text = line_map.get(name, (None, None))
+            filename = None
+            if line_number is None and source and os.path.isfile(source[0]):
+                # rule of an included makefile
+                filename, line_number = source[0], source[1] - 1
+                line_text = linecache.getline(filename, source[1]).rstrip("\n")
             target_data.append(
                 TargetData(
                     name=name,
@@ -119,6 +139,7 @@ def parse_targets(
                     line_number=line_number,
                     line_text=line_text,
                     grouped=data.get("grouped", False),
+                    filename=filename,
                 ),
             )
 
@@ -140,7 +161,6 @@ def validate_target_comments(
     for t in targets:
         if not t.doc:
             msg = f"Target without comments: {t.name}"
-            print(msg, file=sys.stderr)
             if errors is not None:
                 errors.append(
                     _create_error(
@@ -148,6 +168,7 @@ def validate_target_comments(
                         msg,
                         line_number=t.line_number,
                         line_text=t.line_text,
+                        filename=t.filename,
                     ),
                 )
             is_valid = False
@@ -167,7 +188,6 @@ def validate_orphan_targets(
     for t in targets:
         if t.name not in deps and "[FINAL]" not in t.doc:
             msg = f"{t.name}, is orphan - not marked as [FINAL] and no other target depends on it"
-            print(msg, file=sys.stderr)
             if errors is not None:
                 errors.append(
                     _create_error(
@@ -175,6 +195,7 @@ def validate_orphan_targets(
                         msg,
                         line_number=t.line_number,
                         line_text=t.line_text,
+                        filename=t.filename,
                     ),
                 )
             is_valid = False
@@ -198,7 +219,6 @@ def validate_missing_rules(
         if dep not in target_names and not os.path.exists(dep):
             for parent in sorted(deps_map.get(dep, [])):
                 msg = f"No rule to make target '{dep}', needed by '{parent}'"
-                print(msg, file=sys.stderr)
                 if errors is not None:
                     t = target_map.get(parent)
                     errors.append(
@@ -207,6 +227,7 @@ def validate_missing_rules(
                             msg,
                             line_number=t.line_number if t else None,
                             line_text=t.line_text if t else None,
+                            filename=t.filename if t else None,
                         ),
                     )
             is_valid = False
@@ -230,7 +251,6 @@ def validate_spaces(lines: list[str], *, errors: list[LintError] | None = None)
     for i, line in enumerate(lines):
         if line.rstrip() != line:
             msg = f"Trailing spaces ({i}): {line}"
-            print(msg, file=sys.stderr)
             if errors is not None:
                 errors.append(
                     _create_error(
@@ -248,7 +268,6 @@ def validate_spaces(lines: list[str], *, errors: list[LintError] | None = None)
 
         if line.startswith(" ") and not line.startswith("\t"):
             msg = f"Space instead of tab ({i}): {line}"
-            print(msg, file=sys.stderr)
             if errors is not None:
                 errors.append(
                     _create_error(
@@ -286,7 +305,6 @@ def validate_multiple_targets_colon(
                     f"Multiple targets defined with ':' may run several times in parallel: "
                     f"{m.group('target')}. Use '&:' to group them"
                 )
-                print(msg, file=sys.stderr)
                 if errors is not None:
                     errors.append(
                         _create_error(
@@ -294,6 +312,7 @@ def validate_multiple_targets_colon(
                             msg,
                             line_number=t.line_number,
                             line_text=t.line_text,
+                            filename=t.filename,
                         ),
                     )
                 is_valid = False
@@ -320,6 +339,8 @@ def validate(
     errors: list[LintError] | None = None,
 ) -> bool:
     """Run all validators and collect error messages."""
+    if errors is None:
+        errors = []
     is_valid = True
 
     for validator in TEXT_VALIDATORS:
@@ -354,21 +375,33 @@ def summarize_errors(errors: list[LintError]) -> str:
     return ", ".join(parts)
 
 
+def format_error(err: LintError, default_filename: str) -> str:
+    """Return the message of ``err`` prefixed with its ``file:line``.
+
+    Errors without a file of their own belong to ``default_filename``.
+    """
+
+    filename = err.filename or default_filename
+    if err.line_number is None:
+        return f"{filename}: {err.message}"
+    return f"{filename}:{err.line_number + 1}: {err.message}"
+
+
 def main():
     args = parse_args()
     
     with open(args.in_filename, "r") as f:
         makefile_lines = f.read().split("\n")
 
-    # file_object is the stream of data and if once the data is consumed, you can't ask the source to give you the same data again.
-    # so it's the reason why we should open in_file twice
-    with open(args.in_filename, "r") as file:
-        ast = parse(file)
+    ast, _ = load_makefile(args.in_filename, cache_filename=args.parse_cache)
 
     targets, deps, deps_map = parse_targets(ast, makefile_lines)
 
     errors: list[LintError] = []
-    if not validate(makefile_lines, targets, deps, deps_map, errors=errors):
+    valid = validate(makefile_lines, targets, deps, deps_map, errors=errors)
+    for err in errors:
+        print(format_error(err, args.in_filename), file=sys.stderr)
+    if not valid:
         summary = summarize_errors(errors)
         print(f"Makefile validation failed: {summary}", file=sys.stderr)
         return 1
@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+"""Bounded and compressed capture of recipe output.
+
+``profile_make --logs gzip`` (or ``zstd``) captures the output of every
+target with this module instead of ``gawk`` and ``tee``. One process is
+started per target with ``--fifo`` and the recipe lines of the target write
+their output to that FIFO one after the other, so the interpreter starts
+once per target rather than once per line. The output is passed through to
+stdout as it comes and appended to the log compressed, as a new gzip member
+or zstd frame, so that logs appended to by several captures stay one valid
+file.
+
+Lines are timestamped in batches: only the first line starting once
+``--stamp_interval`` seconds have passed since the previous timestamp gets
+a ``[%Y-%m-%d %H:%M:%S]`` prefix. With ``--max_bytes`` only the head and the
+tail of the captured output, half of the limit each, are logged.
+"""
+
+import argparse
+import collections
+import gzip
+import os
+import select
+import sys
+import time
+
+CHUNK_SIZE = 1 << 16
+STAMP_FORMAT = '[%Y-%m-%d %H:%M:%S] '
+SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+# Suffix of the FIFO a ``--fifo`` capture is stopped with.
+STOP_SUFFIX = '.stop'
+
+
+def open_log(filename, compression):
+    """Open ``filename`` for appending a new compressed member."""
+    if compression == 'gzip':
+        return gzip.open(filename, 'ab', compresslevel=3)
+    if compression == 'zstd':
+        import zstandard  # pylint: disable=import-error
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(filename, 'ab'), closefd=True)
+    return open(filename, 'ab')
+
+
+def read_log(filename):
+    """Return the decompressed content of a log written by any capture mode."""
+    if filename.endswith(SUFFIXES['zstd']):
+        import zstandard  # pylint: disable=import-error
+        with open(filename, 'rb') as fd:
+            return zstandard.ZstdDecompressor().stream_reader(fd, read_across_frames=True).read()
+    if filename.endswith(SUFFIXES['gzip']):
+        with gzip.open(filename, 'rb') as fd:
+            return fd.read()
+    with open(filename, 'rb') as fd:
+        return fd.read()
+
+
+class BoundedLog:
+    """Writes the first and the last ``max_bytes / 2`` bytes given to it."""
+
+    def __init__(self, fd, max_bytes=None):
+        self.fd = fd
+        self.head_left = max_bytes // 2 if max_bytes else None
+        self.tail_size = max_bytes - max_bytes // 2 if max_bytes else 0
+        self.tail = collections.deque()
+        self.tail_bytes = 0
+        self.skipped = 0
+
+    def write(self, data):
+        if self.head_left is None:
+            self.fd.write(data)
+            return
+        if self.head_left:
+            head = data[:self.head_left]
+            self.fd.write(head)
+            self.head_left -= len(head)
+            data = data[len(head):]
+        if not data:
+            return
+        self.tail.append(data)
+        self.tail_bytes += len(data)
+        # drop whole chunks while the rest still covers the tail
+        while self.tail_bytes - len(self.tail[0]) >= self.tail_size:
+            dropped = self.tail.popleft()
+            self.tail_bytes -= len(dropped)
+            self.skipped += len(dropped)
+
+    def close(self):
+        excess = self.tail_bytes - self.tail_size
+        if excess > 0:
+            self.tail[0] = self.tail[0][excess:]
+            self.skipped += excess
+        if self.skipped:
+            self.fd.write(b'\n[... %d bytes skipped ...]\n' % self.skipped)
+        for data in self.tail:
+            self.fd.write(data)
+        self.fd.close()
+
+
+def capture(src, dst, log, stamp_interval=1.0, clock=time.time):
+    """Copy ``src`` to ``dst`` and to ``log`` with batched timestamps."""
+    at_line_start = True
+    last_stamp = None
+    while True:
+        data = src.read(CHUNK_SIZE)
+        if not data:
+            break
+        if dst is not None:
+            dst.write(data)
+            dst.flush()
+        now = clock()
+        pos = 0 if at_line_start else data.find(b'\n') + 1 or len(data)
+        if pos < len(data) and (last_stamp is None or now - last_stamp >= stamp_interval):
+            stamp = time.strftime(STAMP_FORMAT, time.localtime(now)).encode()
+            data = data[:pos] + stamp + data[pos:]
+            last_stamp = now
+        log.write(data)
+        at_line_start = data.endswith(b'\n')
+
+
+class FifoReader:
+    """Reads what recipe lines write to a FIFO until a hook opens ``control``.
+
+    The FIFO is held open for writing as well, so that recipe lines neither
+    wait for the reader when they open it nor end the capture when they
+    close it. Opening and closing the ``control`` FIFO means every recipe
+    line is done, so all they wrote is in the FIFO buffer: it is read to
+    the end, after which reads return nothing.
+    """
+
+    def __init__(self, fifo, control):
+        self.fd = os.open(fifo, os.O_RDWR)
+        self.control = os.open(control, os.O_RDONLY | os.O_NONBLOCK)
+        self.stopping = False
+
+    def read(self, size):
+        while not self.stopping:
+            ready, _, _ = select.select([self.fd, self.control], [], [])
+            if self.fd in ready:
+                return os.read(self.fd, size)
+            os.set_blocking(self.fd, False)
+            self.stopping = True
+        try:
+            return os.read(self.fd, size)
+        except BlockingIOError:
+            return b''
+
+    def close(self):
+        os.close(self.fd)
+        os.close(self.control)
+
+
+def serve(fifo, dst, log, stamp_interval=1.0):
+    """Capture what is written to ``fifo`` until asked to stop, then close ``log``.
+
+    A hook asks to stop by opening ``fifo + STOP_SUFFIX``, another FIFO, for
+    writing, and waits for the log to be complete by opening it for reading
+    next: it is opened for writing once more when the log is closed. Both
+    FIFOs are removed on the way out, so that writers coming too late find
+    plain files instead of waiting for a reader that is gone.
+    """
+    control = fifo + STOP_SUFFIX
+    try:
+        src = FifoReader(fifo, control)
+        try:
+            capture(src, dst, log, stamp_interval)
+        finally:
+            log.close()
+            src.close()
+            os.unlink(fifo)
+        with open(control, 'wb'):
+            pass
+    finally:
+        for name in (fifo, control):
+            if os.path.exists(name):
+                os.unlink(name)
+
+
+def main(argv=sys.argv[1:]):
+    options = argparse.ArgumentParser(
+        description='Pass recipe output through and append it to a bounded, compressed log.')
+    options.add_argument(
+        '--compress',
+        choices=('none',) + tuple(SUFFIXES),
+        default='gzip',
+        help='Log compression (default %(default)s)')
+    options.add_argument(
+        '--max_bytes',
+        type=int,
+        default=None,
+        help='Keep only the head and the tail of the output, this many bytes in total')
+    options.add_argument(
+        '--stamp_interval',
+        type=float,
+        default=1.0,
+        help='Seconds between line timestamps (default %(default)s)')
+    options.add_argument(
+        '--fifo',
+        type=str,
+        default=None,
+        help='Capture what is written to this FIFO instead of stdin, until the FIFO named like it '
+             'with %s added is opened' % STOP_SUFFIX)
+    options.add_argument(
+        'log',
+        type=str,
+        help='Log file to append to')
+
+    args = options.parse_args(argv)
+    log = BoundedLog(open_log(args.log, args.compress), args.max_bytes)
+    if args.fifo:
+        serve(args.fifo, sys.stdout.buffer, log, args.stamp_interval)
+        return 0
+    try:
+        capture(os.fdopen(sys.stdin.fileno(), 'rb', buffering=0), sys.stdout.buffer, log, args.stamp_interval)
+    finally:
+        log.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
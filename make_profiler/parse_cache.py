@@ -0,0 +1,208 @@
+"""Cache of parsed Makefiles and their dependency graphs.
+
+``profile_make``, ``profile_make_lint``, ``profile_make_clean`` and
+``profile_make_collect`` read the Makefile through :func:`load_makefile`,
+which keeps the AST and its compact :class:`~make_profiler.graph.Graph` in a
+JSON sidecar next to the Makefile. The sidecar is used as long as the root
+Makefile and every file it included, or tried to include, are unchanged:
+files whose size and modification time match are trusted, the others are
+compared by content hash, so touching a file doesn't invalidate the cache.
+
+The sidecar only holds plain data and is ignored unless it belongs to the
+current user, as the AST it holds ends up in the Makefile profile_make runs.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import sys
+import time
+from array import array
+
+from make_profiler.graph import Graph
+from make_profiler.parser import LocatedToken, Rule, Tokens, parse
+
+CACHE_FILENAME = 'make_profile.parse_cache'
+# bumped whenever the cached structures change
+CACHE_VERSION = 4
+# files modified this recently may change again within the same mtime tick
+RACY_NS = 2 * 10 ** 9
+# threads reading included makefiles ahead of the parser
+INCLUDE_THREADS = 8
+
+
+def _digest(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as fd:
+        for block in iter(lambda: fd.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _signature(filename, stat):
+    """Return what identifies the content of ``filename`` opened with ``stat``.
+
+    None stands for a missing file. False is returned when the file changed
+    since ``stat`` was taken, so that the parse result can't be trusted.
+    """
+    if stat is None:
+        return None if not os.path.exists(filename) else False
+    digest = _digest(filename)
+    current = os.stat(filename)
+    if (current.st_mtime_ns, current.st_size) != (stat.st_mtime_ns, stat.st_size):
+        return False
+    mtime_ns = stat.st_mtime_ns
+    if time.time_ns() - mtime_ns < RACY_NS:
+        # compare the content next time
+        mtime_ns = None
+    return mtime_ns, stat.st_size, digest
+
+
+def _unchanged(filename, signature):
+    if signature is None:
+        return not os.path.exists(filename)
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return False
+    mtime_ns, size, digest = signature
+    if (stat.st_mtime_ns, stat.st_size) == (mtime_ns, size):
+        return True
+    return stat.st_size == size and _digest(filename) == digest
+
+
+def _encode_token(item):
+    token, text = item
+    return [token.value, text, getattr(item, 'source', None)]
+
+
+def _decode_token(item):
+    token, text, source = item
+    return LocatedToken(Tokens(token), text, tuple(source) if source else None)
+
+
+def _encode_ast(ast):
+    items = []
+    for item in ast:
+        token, data = item
+        if isinstance(data, Rule):
+            data = {k: getattr(data, k) for k in Rule.__slots__}
+            data['body'] = [_encode_token(line) for line in data['body']]
+            items.append([token.value, data, None])
+        else:
+            items.append(_encode_token(item))
+    return items
+
+
+def _decode_ast(items):
+    ast = []
+    for token, data, source in items:
+        if not isinstance(data, dict):
+            ast.append(_decode_token([token, data, source]))
+            continue
+        deps, order_deps = data['deps']
+        ast.append((Tokens(token), Rule(
+            sys.intern(data['target']),
+            tuple(map(sys.intern, data['all_targets'])),
+            data['grouped'],
+            (tuple(map(sys.intern, deps)), tuple(map(sys.intern, order_deps))),
+            data['docs'],
+            tuple(map(_decode_token, data['body'])),
+            tuple(data['source']),
+        )))
+    return ast
+
+
+def _encode_graph(graph):
+    state = {'names': graph.names}
+    for name in Graph.__slots__:
+        value = getattr(graph, name)
+        if isinstance(value, array):
+            state[name] = [value.typecode, base64.b64encode(value.tobytes()).decode('ascii')]
+    state['order_only'] = base64.b64encode(graph.order_only).decode('ascii')
+    return state
+
+
+def _decode_graph(state):
+    graph = Graph()
+    for name in state['names']:
+        graph._add(name)
+    for name in Graph.__slots__:
+        value = state.get(name)
+        if name in ('names', 'ids', 'order_only') or value is None:
+            continue
+        typecode, data = value
+        column = array(typecode)
+        column.frombytes(base64.b64decode(data))
+        setattr(graph, name, column)
+    graph.order_only = bytearray(base64.b64decode(state['order_only']))
+    return graph
+
+
+def _load(cache_filename, key):
+    try:
+        with open(cache_filename, 'r', encoding='utf-8') as fd:
+            # anybody else could put any Makefile into it
+            if hasattr(os, 'getuid') and os.fstat(fd.fileno()).st_uid != os.getuid():
+                return None
+            cache = json.load(fd)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get('version') != CACHE_VERSION or cache.get('key') != list(key):
+        return None
+    if not all(_unchanged(name, signature) for name, signature in cache['files']):
+        return None
+    try:
+        return _decode_ast(cache['ast']), _decode_graph(cache['graph'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _save(cache_filename, cache):
+    tmp_name = cache_filename + '.tmp'
+    with open(tmp_name, 'w', encoding='utf-8') as fd:
+        json.dump(cache, fd, separators=(',', ':'))
+    os.replace(tmp_name, cache_filename)
+
+
+def load_makefile(
+    filename, is_check_loop=True, loop_check_depth=20, cache_filename=CACHE_FILENAME, threads=INCLUDE_THREADS
+):
+    """Return the AST of ``filename`` and its dependency graph.
+
+    The result is an ``(ast, graph)`` tuple, ``graph`` being a
+    :class:`~make_profiler.graph.Graph`. Both are read from
+    ``cache_filename``, relative to the directory of ``filename``, when it
+    is up to date and stored there otherwise; without ``cache_filename`` the
+    Makefile is always parsed. Included files are read ahead by ``threads``
+    threads when it is parsed.
+    """
+    key = (os.path.abspath(filename), os.getcwd(), is_check_loop, loop_check_depth)
+    if cache_filename:
+        cache_filename = os.path.join(os.path.dirname(key[0]), cache_filename)
+        cached = _load(cache_filename, key)
+        if cached is not None:
+            return cached
+
+    included = []
+    with open(filename, 'r') as fd:
+        stat = os.fstat(fd.fileno())
+        ast = parse(fd, is_check_loop, loop_check_depth, included=included, threads=threads)
+    graph = Graph.from_ast(ast)
+
+    if cache_filename:
+        files = [(filename, stat)] + included
+        signatures = [(name, _signature(name, stat)) for name, stat in files]
+        if all(signature is not False for _, signature in signatures):
+            try:
+                _save(cache_filename, {
+                    'version': CACHE_VERSION,
+                    'key': key,
+                    'files': signatures,
+                    'ast': _encode_ast(ast),
+                    'graph': _encode_graph(graph),
+                })
+            except OSError:
+                pass
+    return ast, graph
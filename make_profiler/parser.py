@@ -1,12 +1,17 @@
-import collections
+import concurrent.futures
+import errno
+import os
 import re
-import tempfile
+import sys
+import threading
 
 from enum import Enum
-from typing import Any, Dict, Generator, List, Tuple, TextIO, Pattern
+from typing import Any, Dict, Generator, Iterable, List, Match, Optional, Tuple, TextIO
 
 from more_itertools import peekable
 
+from make_profiler.graph import Graph, IndirectInfluences
+
 
 class Tokens(str, Enum):
     target = "target"
@@ -14,20 +19,187 @@ class Tokens(str, Enum):
     expression = "expression"
 
 
-def tokenizer(fd: List[str]) -> Generator[Tuple[Tokens, str], None, None]:
-    it = enumerate(fd)
+# (file name, 1-based line number) a token was read from
+Source = Tuple[str, int]
+
+
+class Rule:
+    """Target of a Makefile rule, its fields are read like dict items."""
+
+    __slots__ = ('target', 'all_targets', 'grouped', 'deps', 'docs', 'body', 'source')
+
+    def __init__(self, target, all_targets, grouped, deps, docs, body, source):
+        self.target = target
+        self.all_targets = all_targets
+        self.grouped = grouped
+        self.deps = deps
+        self.docs = docs
+        self.body = body
+        self.source = source
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __eq__(self, other):
+        if not isinstance(other, Rule):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    def __repr__(self):
+        return 'Rule(%s)' % ', '.join('%s=%r' % (k, getattr(self, k)) for k in self.__slots__)
+
+
+class LocatedToken(tuple):
+    """A ``(token type, text)`` pair that also keeps the ``source`` it was read from.
+
+    It unpacks and compares like the plain pair, so the source doesn't get in
+    the way of code that doesn't care about it.
+    """
+
+    def __new__(cls, token, value, source=None):
+        self = super().__new__(cls, (token, value))
+        self.source = source
+        return self
+
+    def __getnewargs__(self):
+        return (self[0], self[1], self.source)
+
+
+INCLUDE_RE = re.compile(' *(s?-?)include +')
+INCLUDE_LOOP_MESSAGE = (
+    'Your make chain is looped or too deep (default depth = 20). '
+    'if you have nesting depth > 20 please set your value with --include_depth option '
+    'or turn off loop checking with --disable_loop_detection')
+
+
+def _read_included(name: str) -> Tuple[str, os.stat_result]:
+    with open(name, 'r') as fd:
+        return fd.read(), os.fstat(fd.fileno())
+
+
+def _include_names(match: Match[str], line: str) -> List[str]:
+    return line[match.end():].split('#', 1)[0].split()
+
+
+class IncludeReader:
+    """Reads included makefiles ahead of the parser on a thread pool.
+
+    Every file read is scanned for include lines and the files they name
+    are submitted right away, so that the whole include tree is fetched
+    concurrently while the parser consumes it in order. Files are read once
+    even when included several times.
+    """
+
+    def __init__(self, threads: int):
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+        self.futures: Dict[str, concurrent.futures.Future] = {}
+        self.lock = threading.Lock()
+
+    def prefetch(self, text: str):
+        for line in text.splitlines():
+            match = INCLUDE_RE.match(line)
+            if match:
+                for name in _include_names(match, line):
+                    self.submit(name)
+
+    def submit(self, name: str) -> concurrent.futures.Future:
+        with self.lock:
+            if name not in self.futures:
+                self.futures[name] = self.executor.submit(self._read, name)
+            return self.futures[name]
+
+    def _read(self, name: str) -> Tuple[str, os.stat_result]:
+        text, stat = _read_included(name)
+        self.prefetch(text)
+        return text, stat
+
+    def read(self, name: str) -> Tuple[str, os.stat_result]:
+        return self.submit(name).result()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def read_makefile(
+    fd: Iterable[str], is_check_loop: bool = True, loop_check_depth: int = 20, filename: Optional[str] = None,
+    included: Optional[List[Tuple[str, Optional[os.stat_result]]]] = None, threads: int = 1
+) -> Generator[Tuple[str, Source], None, None]:
+    """Yield the lines of ``fd`` with included makefiles expanded in place.
+
+    Included files are read relative to the working directory like make
+    does, when the ``include`` line is reached, or ahead of it by an
+    :class:`IncludeReader` of ``threads`` threads when there are more than
+    one. Every line comes with the name of the file it was read from and
+    its line number there. ``-include`` and ``sinclude`` skip missing files.
+
+    When ``included`` is given, the name of every included file is appended
+    to it together with its ``os.stat`` result when it was opened, or None
+    when it was missing.
+    """
+    reader = IncludeReader(threads) if threads > 1 else None
+
+    def expand(lines: Iterable[str], name: str, depth: int) -> Generator[Tuple[str, Source], None, None]:
+        for number, line in enumerate(lines, 1):
+            match = INCLUDE_RE.match(line)
+            if not match:
+                yield line, (name, number)
+                continue
+            if is_check_loop and depth >= loop_check_depth:
+                raise Exception('%s:%d: %s' % (name, number, INCLUDE_LOOP_MESSAGE))
+            for included_name in _include_names(match, line):
+                try:
+                    text, stat = reader.read(included_name) if reader else _read_included(included_name)
+                except FileNotFoundError:
+                    if match.group(1):
+                        if included is not None:
+                            included.append((included_name, None))
+                        continue
+                    raise FileNotFoundError(
+                        errno.ENOENT, '%s:%d: included makefile not found' % (name, number), included_name) from None
+                if included is not None:
+                    included.append((included_name, stat))
+                yield from expand(text.splitlines(True), included_name, depth + 1)
+
+    if reader is None:
+        return expand(fd, filename or getattr(fd, 'name', '<makefile>'), 0)
+
+    def prefetched() -> Generator[Tuple[str, Source], None, None]:
+        lines = list(fd)
+        reader.prefetch(''.join(lines))
+        try:
+            yield from expand(lines, filename or getattr(fd, 'name', '<makefile>'), 0)
+        finally:
+            reader.close()
+
+    return prefetched()
+
+
+def located_tokenizer(
+    lines: Iterable[Tuple[str, Optional[Source]]]
+) -> Generator[Tuple[Tokens, str, Optional[Source]], None, None]:
+    """Split ``(line, source)`` pairs into tokens carrying their first line's source."""
+    it = iter(lines)
 
     def glue_multiline(line: str) -> str:
         lines = []
         strip_line = line.strip()
         while strip_line[-1] == '\\':
             lines.append(strip_line.rstrip('\\').strip())
-            line_num, line = next(it)
+            line, _ = next(it)
             strip_line = line.strip()
         lines.append(strip_line.rstrip('\\').strip())
         return ' '.join(lines)
 
-    for line_num, line in it:
+    for line, source in it:
         strip_line = line.strip()
 
         # skip empty lines
@@ -38,95 +210,34 @@ def tokenizer(fd: List[str]) -> Generator[Tuple[Tokens, str], None, None]:
         if strip_line[0] == '#' and line[:2] != '##':
             continue
         elif line[0] == '\t':
-            yield (Tokens.command, glue_multiline(line))
+            yield (Tokens.command, glue_multiline(line), source)
         elif ':' in line and '=' not in line:
-            yield (Tokens.target, glue_multiline(line))
+            yield (Tokens.target, glue_multiline(line), source)
         else:
-            yield (Tokens.expression, line.strip(' ;\t'))
+            yield (Tokens.expression, line.strip(' ;\t'), source)
+
 
+def tokenizer(fd: Iterable[str]) -> Generator[Tuple[Tokens, str], None, None]:
+    for token, value, _ in located_tokenizer((line, None) for line in fd):
+        yield (token, value)
 
-def parse(fd: TextIO, is_check_loop: bool = True, loop_check_depth: int = 20) -> List[Tuple[Tokens, Dict[str, Any]]]:
+
+def parse(
+    fd: TextIO, is_check_loop: bool = True, loop_check_depth: int = 20,
+    included: Optional[List[Tuple[str, Optional[os.stat_result]]]] = None, threads: int = 1
+) -> List[Tuple[Tokens, Any]]:
+    """Parse a Makefile, with the makefiles it includes, into a list of tokens.
+
+    Targets are :class:`Rule` records that keep the ``source`` file name and
+    line number of their rule, other tokens and the recipe lines in the
+    ``body`` of rules are :class:`LocatedToken` pairs with the ``source`` of
+    their line. ``included`` and ``threads`` are passed to :func:`read_makefile`.
+    """
     ast = []
 
-    def insert_included_files(open_file: TextIO, is_check_include_loop: bool = True, loop_check_depth: int = 20) -> TextIO:
-        
-        # create nested function to check if list of rows cointains include instructions
-        def check_for_includes(input_make: str, regular_expression: Pattern[str]) -> bool:
-            # create list of rows from input make
-            list_of_rows = input_make.split('\n')
-            # find rows which consist include instruction and replace multiple spaces with one
-            matches = [re.sub(' +', ' ', string) for string in list_of_rows if re.match(regular_expression, string)]
-
-            if len(matches) != 0:
-                return True
-            else:
-                return False
-
-        # create nested function to be able insert included makes recursively
-        def replace_include_with_file(
-            input_make: str, regular_expression: Pattern[str]
-        ) -> str:
-            output_make = input_make
-            # create list of rows from input make
-            list_of_rows = input_make.split('\n')
-            # iterate through input makefile
-            for x in range(0,len(list_of_rows)):
-                # check if string contains include instruction
-                if re.match(regular_expression, list_of_rows[x]):
-                    # get names of makefiles from instruction
-                    instruction = re.sub(' +', ' ', list_of_rows[x].split('include ')[1])
-                    # split list of included makes to support multiple entrance
-                    makes = instruction.split(' ')
-        
-                    # initialize empty list to store included instructions as string
-                    included_instructions = []   
-                    # iterate through files from instruction add write them to list
-                    for make in makes:
-                        with open(make, 'r') as fp:
-                            included_instructions.append(fp.read())
-        
-                    # transform list into single string
-                    included_string = '\n'.join(included_instructions)
-        
-                    # replace include with included instruction
-                    output_make = input_make.replace(
-                        list_of_rows[x], included_string, 1
-                    )
-
-            return output_make
-
-        make_full_text = open_file.read()
-
-        # compile regex to find include instructions
-        regex = re.compile(' *s?-?include +')
-        
-        loop_detector = 0
-        
-        # recursively check makefile to check include instruction in included files
-        while check_for_includes(make_full_text, regex):
-            make_full_text = replace_include_with_file(make_full_text, regex)
-            loop_detector += 1
-            if loop_detector > loop_check_depth and is_check_include_loop:
-                raise Exception('Your make chain is looped or too deep (default depth = 20). if you have nesting depth > 20 please set your value with --include_depth option or turn off loop checking with --disable_loop_detection')
-
-        # create temporary file
-        tmp = tempfile.NamedTemporaryFile(mode = 'w+t')
-        tmp_name=tmp.name
-        tmp.close() #on windows it is not possible to open file for writing twice. So file needs to be closed.
-
-        # open temporary file and write composed make to them
-        with open(tmp_name, 'w') as temp_input_file:
-            temp_input_file.write(make_full_text)
-
-        # open temporary file as <class '_io.TextIOWrapper'> to support type compatibiluty with tokenizer() 
-        temp_make_file = open(tmp_name, 'r')
-        
-        return temp_make_file
-
-
-    it = peekable(tokenizer(insert_included_files(fd, is_check_loop, loop_check_depth)))
-
-    def parse_target(token: Tuple[Tokens, str]):
+    it = peekable(located_tokenizer(read_makefile(fd, is_check_loop, loop_check_depth, included=included, threads=threads)))
+
+    def parse_target(token: Tuple[Tokens, str, Optional[Source]]):
         """Parse a Makefile rule and store it in the AST.
 
         Supports both traditional ``target:`` syntax and ``&:`` grouped
@@ -137,7 +248,7 @@ def parse(fd: TextIO, is_check_loop: bool = True, loop_check_depth: int = 20) ->
 
         sep = '&:' if '&:' in line else ':'
         target_part, rest = line.split(sep, 1)
-        targets = target_part.strip().split()
+        targets = [sys.intern(t) for t in target_part.strip().split()]
 
         docs = ''
         if '##' in rest:
@@ -147,36 +258,25 @@ def parse(fd: TextIO, is_check_loop: bool = True, loop_check_depth: int = 20) ->
         rest = rest.strip()
         if '|' in rest:
             deps_part, order_part = rest.split('|', 1)
-            order_deps = sorted(order_part.strip().split()) if order_part.strip() else []
+            order_deps = sorted(map(sys.intern, order_part.split()))
         else:
             deps_part = rest
             order_deps = []
-        deps = sorted(deps_part.strip().split()) if deps_part.strip() else []
+        deps = sorted(map(sys.intern, deps_part.split()))
 
         body = parse_body()
-        ast.append(
-            (
-                token[0],
-                {
-                    'target': targets[0],
-                    'all_targets': targets,
-                    'grouped': sep == '&:',
-                    'deps': [deps, order_deps],
-                    'docs': docs,
-                    'body': body
-                }
-            )
-        )
+        ast.append((token[0], Rule(
+            targets[0], tuple(targets), sep == '&:', (tuple(deps), tuple(order_deps)), docs, tuple(body), token[2])))
 
     def next_belongs_to_target() -> bool:
-        token, _ = it.peek()
+        token, _, _ = it.peek()
         return token == Tokens.command
 
     def parse_body() -> List[Tuple[Tokens, str]]:
         body = []
         try:
             while next_belongs_to_target():
-                body.append(next(it))
+                body.append(LocatedToken(*next(it)))
         except StopIteration:
             pass
         return body
@@ -186,68 +286,15 @@ def parse(fd: TextIO, is_check_loop: bool = True, loop_check_depth: int = 20) ->
             parse_target(token)
         else:
             # expression
-            ast.append(token)
+            ast.append(LocatedToken(*token))
 
     return ast
 
 
-def get_dependencies_influences(ast: List[Tuple[Tokens, Dict[str, Any]]]):
-    dependencies = {}
-    influences = collections.defaultdict(set)
-    order_only = set()
-    indirect_influences = collections.defaultdict(set)
+def dependency_maps(graph: Graph):
+    """Return the dicts of :func:`get_dependencies_influences` for ``graph``."""
+    return graph.dependencies(), graph.influences(), graph.order_only_names(), IndirectInfluences(graph)
 
-    alias_map = {}
-    for item_t, item in ast:
-        if item_t != Tokens.target:
-            continue
-        targets = item.get('all_targets', [item['target']])
-        canonical = targets[0]
-        for alias_name in targets[1:]:
-            alias_map[alias_name] = canonical
-
-    def alias(name: str) -> str:
-        return alias_map.get(name, name)
-
-    for item_t, item in ast:
-        if item_t != Tokens.target:
-            continue
-        target = alias(item['target'])
-        deps, order_deps = item['deps']
-        deps = [alias(d) for d in deps]
-        order_deps = [alias(d) for d in order_deps]
-
-        if target in ('.PHONY',):
-            continue
 
-        dependencies[target] = [deps, order_deps]
-
-        # influences
-        influences[target]
-        for k in deps:
-            influences[k].add(target)
-        for k in order_deps:
-            influences[k]
-        order_only.update(order_deps)
-
-    # Cache previously calculated descendants to avoid quadratic behaviour on
-    # large graphs. ``descendants(target)`` returns a set of all nodes reachable
-    # from ``target`` including direct children.
-    cached_descendants = {}
-
-    def descendants(target):
-        if target in cached_descendants:
-            return cached_descendants[target]
-        result = set(influences[target])
-        for child in influences[target]:
-            result.update(descendants(child))
-        cached_descendants[target] = result
-        return result
-
-    for original_target in influences:
-        indirect_influences[original_target] = (
-            descendants(original_target) - influences[original_target]
-        )
-
-    return dependencies, influences, order_only, indirect_influences
-    
\ No newline at end of file
+def get_dependencies_influences(ast: List[Tuple[Tokens, Any]]):
+    return dependency_maps(Graph.from_ast(ast))
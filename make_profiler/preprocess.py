@@ -1,5 +1,8 @@
 #!/usr/bin/python3
 
+import sys
+
+from make_profiler.logcap import STOP_SUFFIX, SUFFIXES
 from make_profiler.parser import Tokens
 
 STUFF_TARGETS = ('stuff',)
@@ -12,27 +15,13 @@ HOOKS = {
         ],
     'before_block':
         """
-        echo
-        | awk "{
-            print
-                strftime(\\"%s\\"),
-                \\"${RANDOM_HASH}\\",
-                \\"start\\",
-                \\"$@\\";
-        }"
+        echo "$$(date +%s.%6N) ${RANDOM_HASH} start $@"
         >> make_profile.db;
         mkdir -p ${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@
         """,
     'after_block':
         """
-        echo |
-        awk "{
-            print
-                strftime(\\"%s\\"),
-                \\"${RANDOM_HASH}\\",
-                \\"finish\\",
-                \\"$@\\";
-        }"
+        echo "$$(date +%s.%6N) ${RANDOM_HASH} finish $@"
         >> make_profile.db;
         ln -s -f -T ${RANDOM_HASH} ${RUN_DIRECTORY}/logs/latest;
         touch ${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@/log.txt
@@ -42,14 +31,159 @@ HOOKS = {
     'after_command':
         """
          || touch ${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@/failed.touch ; } 2>&1
-         | gawk '{print strftime("[%Y-%m-%d %H:%M:%S] ",systime()) $$0 }'
-         | tee -a ${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@/log.txt;
+         LOG_PIPE;
+        """,
+    'check_command':
+        """
         test ! -e ${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@/failed.touch
+        """,
+    'line_start':
+        """
+        echo "$$(date +%s.%6N) ${RANDOM_HASH} line_start $@ LINE_INDEX"
+        >> make_profile.db;
+        """,
+    'line_finish':
+        """
+        echo "$$(date +%s.%6N) ${RANDOM_HASH} line_finish $@ LINE_INDEX"
+        >> make_profile.db;
+        """,
+    'log_pipe':
+        """
+        | gawk '{print strftime("[%Y-%m-%d %H:%M:%S] ",systime()) $$0 }'
+        | tee -a ${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@/log.txt
+        """,
+    'event':
+        """
+        echo "$$(date +%s.%6N) ${RANDOM_HASH} EVENT_ACTION $@"
+        """,
+    'now':
+        """
+        $$(date +%s.%6N)
         """
 }
 
+# Same events and logs as HOOKS written with bash builtins: the start and
+# finish events cost no process besides the recipe shell, the log directory
+# link is made once at startup and recipe output is not timestamped per line.
+# EPOCHREALTIME needs bash 5 and may use the decimal comma of the locale.
+LIGHT_HOOKS = {
+    'start':
+        [
+            """SHELL := /bin/bash""",
+            """RANDOM_HASH := $(shell od -An -N10 -tx1 /dev/urandom | tr -d ' \\n')""",
+            """RUN_DIRECTORY := $(CURDIR)""",
+            """$(shell mkdir -p ${RUN_DIRECTORY}/logs/${RANDOM_HASH} && ln -s -f -T ${RANDOM_HASH} ${RUN_DIRECTORY}/logs/latest)"""
+        ],
+    'before_block':
+        """
+        printf '%s ${RANDOM_HASH} start $@\\n' "$${EPOCHREALTIME/,/.}" >> make_profile.db;
+        mkdir -p ${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@
+        """,
+    'after_block':
+        """
+        printf '%s ${RANDOM_HASH} finish $@\\n' "$${EPOCHREALTIME/,/.}" >> make_profile.db;
+        : >> ${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@/log.txt
+        """,
+    'before_command':
+        '{ ',
+    'after_command':
+        """
+         || : > ${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@/failed.touch ; } 2>&1
+         LOG_PIPE;
+        """,
+    'check_command':
+        """
+        test ! -e ${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@/failed.touch
+        """,
+    'line_start':
+        """
+        printf '%s ${RANDOM_HASH} line_start $@ LINE_INDEX\\n' "$${EPOCHREALTIME/,/.}" >> make_profile.db;
+        """,
+    'line_finish':
+        """
+        printf '%s ${RANDOM_HASH} line_finish $@ LINE_INDEX\\n' "$${EPOCHREALTIME/,/.}" >> make_profile.db;
+        """,
+    'log_pipe':
+        """
+        | tee -a ${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@/log.txt
+        """,
+    'event':
+        """
+        printf '%s ${RANDOM_HASH} EVENT_ACTION $@\\n' "$${EPOCHREALTIME/,/.}"
+        """,
+    'now':
+        """
+        $${EPOCHREALTIME/,/.}
+        """
+}
 
-def generate_makefile(ast, fd, db_filename):
+HOOK_SETS = {
+    'default': HOOKS,
+    'light': LIGHT_HOOKS,
+}
+
+# Runs a recipe line of the Makefile through make_profiler.rusage with the
+# shell the target uses. The line is kept verbatim in a variable of its own
+# and passed single-quoted, so that the hooks around it run without it. The
+# time the wrapper is launched lets it tell its own start-up time.
+RUSAGE_COMMAND = (
+    "{python} -m make_profiler.rusage make_profile.db $(RANDOM_HASH) $@ {now} $(SHELL) $(.SHELLFLAGS) "
+    "'$(subst ','\\'',$(PROFILE_MAKE_RECIPE_{index}))'")
+
+
+def compressed_log_hooks(hooks, compression, max_bytes=None, stamp_interval=1):
+    """Return a copy of ``hooks`` capturing logs with ``make_profiler.logcap``.
+
+    Recipe output is compressed with ``compression``, ``gzip`` or ``zstd``,
+    into ``log.txt.gz`` or ``log.txt.zst``, timestamped once per
+    ``stamp_interval`` seconds and capped to ``max_bytes`` per target. One
+    capture process is started per target, reading a FIFO in the log
+    directory that every recipe line writes to, and stopped through a second
+    one after the last line or the failed one, once the log is complete.
+    """
+    log_dir = '${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@/'
+    log_name = 'log.txt' + SUFFIXES[compression]
+    fifo = log_dir + 'log.fifo'
+    capture = '{} -m make_profiler.logcap --compress {} --stamp_interval {}'.format(
+        sys.executable, compression, stamp_interval)
+    if max_bytes:
+        capture += ' --max_bytes {}'.format(max_bytes)
+    capture += ' --fifo {} {}'.format(fifo, log_dir + log_name)
+    stop = ': > {0}; : < {0}'.format(fifo + STOP_SUFFIX)
+
+    result = {
+        k: h.replace('log.txt', log_name) if isinstance(h, str) else h
+        for k, h in hooks.items()}
+    result['before_block'] = result['before_block'] + '\n; mkfifo {0} {0}{1}; {2} &\n'.format(fifo, STOP_SUFFIX, capture)
+    result['after_block'] = '\n{};\n'.format(stop) + result['after_block']
+    result['after_command'] = result['after_command'].replace('2>&1', '> {} 2>&1'.format(fifo))
+    result['log_pipe'] = ''
+    result['check_command'] = '\n{{ {} || {{ {}; false; }}; }}\n'.format(result['check_command'].strip(), stop)
+    return result
+
+
+def event_stream_hooks(hooks, fifo):
+    """Return a copy of ``hooks`` also sending events to the FIFO ``fifo``.
+
+    Start, finish and failure of every target are written as db lines to
+    ``fifo`` whenever it exists, for ``make_profiler.collector`` to follow.
+    The FIFO is opened write-only and non-blocking, so an event is dropped
+    instead of stalling the recipe when no collector reads it or its buffer
+    is full.
+    """
+    def send(action):
+        return '[ -p {0} ] && {1} | dd of={0} oflag=nonblock conv=notrunc,nocreat status=none 2>/dev/null;'.format(
+            fifo, hooks['event'].strip().replace('EVENT_ACTION', action))
+
+    failed = '${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@/failed.touch'
+    result = dict(hooks)
+    result['before_block'] = send('start') + hooks['before_block']
+    result['after_block'] = send('finish') + hooks['after_block']
+    result['check_command'] = '\n{{ [ -e {} ] && {} }};\n'.format(failed, send('fail')) + hooks['check_command']
+    return result
+
+
+def generate_makefile(ast, fd, db_filename, hooks=HOOKS, rusage=False, line_timing=False):
     def clean(value):
         if isinstance(value, list):
             return '\n'.join(value)
@@ -57,18 +191,47 @@ def generate_makefile(ast, fd, db_filename):
 
     clean_hooks = dict(
         (k, clean(h).replace('make_profile.db', db_filename))
-        for k, h in HOOKS.items())
+        for k, h in hooks.items())
+    clean_hooks['after_command'] = clean_hooks['after_command'].replace(
+        'LOG_PIPE', clean_hooks.pop('log_pipe'))
+    del clean_hooks['event']
+    now = clean_hooks.pop('now')
+    if not line_timing:
+        del clean_hooks['line_start'], clean_hooks['line_finish']
+
+    recipes = []
+
+    def define_recipes(item):
+        """Keep the recipe lines of ``item`` in variables for the rusage wrapper."""
+        for body_type, body_item in item['body']:
+            if body_type != Tokens.expression:
+                recipes.append(body_item)
+                fd.write('define PROFILE_MAKE_RECIPE_{}\n{}\nendef\n'.format(len(recipes), body_item))
 
-    def print_body(item, ihooks={}):
+    def print_body(item, ihooks={}, first_recipe=None):
         if 'before_block' in ihooks:
             fd.write('\t{}\n'.format(ihooks['before_block']))
+        line_index = 0
         for body_type, body_item in item['body']:
             if body_type == Tokens.expression:
                 fd.write('{}\n'.format(body_item))
             else:
-                fd.write('\t{} '.format(ihooks.get('before_command')))
+                line_index += 1
+                fd.write('\t')
+                if first_recipe is not None:
+                    if '$(MAKE)' in body_item or '${MAKE}' in body_item:
+                        # make only passes its job slots to lines naming $(MAKE)
+                        fd.write('+')
+                    body_item = RUSAGE_COMMAND.replace('make_profile.db', db_filename).format(
+                        python=sys.executable, now=now, index=first_recipe + line_index)
+                if 'line_start' in ihooks:
+                    fd.write('{} '.format(ihooks['line_start'].replace('LINE_INDEX', str(line_index))))
+                fd.write('{} '.format(ihooks.get('before_command')))
                 fd.write(body_item)
                 fd.write(ihooks.get('after_command', ''))
+                if 'line_finish' in ihooks:
+                    fd.write(' {}'.format(ihooks['line_finish'].replace('LINE_INDEX', str(line_index))))
+                fd.write(ihooks.get('check_command', ''))
                 fd.write('\n')
         if 'after_block' in ihooks:
             fd.write('\t{}\n'.format(ihooks['after_block']))
@@ -80,6 +243,10 @@ def generate_makefile(ast, fd, db_filename):
         elif item_type == Tokens.target:
             targets = item.get('all_targets', [item['target']])
             sep = '&:' if item.get('grouped') else ':'
+            first_recipe = None
+            if rusage and item['target'] not in STUFF_TARGETS:
+                first_recipe = len(recipes)
+                define_recipes(item)
             fd.write(f"{' '.join(targets)}{sep}")
             deps, order_deps = item['deps']
             if deps:
@@ -91,4 +258,4 @@ def generate_makefile(ast, fd, db_filename):
             if item['target'] in STUFF_TARGETS:
                 print_body(item)
             else:
-                print_body(item, clean_hooks)
+                print_body(item, clean_hooks, first_recipe)
@@ -99,6 +99,8 @@ async function getStatus(url) {
                                         <th>Status</th>
                                         <th>Status date</th>
                                         <th>Duration</th>
+                                        <th>Typical (p50 / p95)</th>
+                                        <th>Waited for slot</th>
                                         <th>Log</th>
                             </tr>`
 
@@ -110,7 +112,9 @@ async function getStatus(url) {
             <td>${statusRecords[i].targetTime ? formatDate(statusRecords[i].targetTime) : '-'}</td>
             <td>${statusRecords[i].targetDuration ? new Date(statusRecords[i].targetDuration * 1000).toISOString().slice(11, 19) : '-'}</td>`;
             // toISOString Returns 2011-10-05T14:48:00.000Z From 11 to 19 gives hh:mm:ss
-            statusRecords[i].targetLog ? statusTable += `<td><a target='_blank' href=${statusRecords[i].targetLog}>...</a></td></tr>` : statusTable += `<td>-</td></tr>`
+            statusTable += `<td>${statusRecords[i].targetDurationP50 != null ? formatDuration(statusRecords[i].targetDurationP50) + ' / ' + formatDuration(statusRecords[i].targetDurationP95) : '-'}</td>`;
+            statusTable += `<td>${statusRecords[i].targetSchedulerWait != null ? formatDuration(statusRecords[i].targetSchedulerWait) : '-'}</td>`;
+            statusRecords[i].targetLog ? statusTable += `<td>${logLink(statusRecords[i].targetLog)}</td></tr>` : statusTable += `<td>-</td></tr>`
         }
 
         statusTable += "</table>";
@@ -118,6 +122,7 @@ async function getStatus(url) {
         const status = document.getElementById("status");
         status.innerHTML = pipelineTable + statusTable;
         sorttable.makeSortable(status.querySelector('.sortable'));
+        getRuns(runsUrl);
     })
         .catch((error) => {
             document.getElementById("status").innerHTML = errorTxt
@@ -125,6 +130,87 @@ async function getStatus(url) {
         });
 }
 
+const runsUrl = "runs.json";
+
+//appends the build history table when runs.json is available
+async function getRuns(url) {
+    await fetch(url).then((response) => {
+        if (response.ok) {
+            return response.json();
+        }
+        throw new Error("No build history available");
+    }).then((responseJson) => {
+        const runs = responseJson.runs.slice().reverse();
+        let runsTable = `
+                        <h2>Build history</h2>
+                        <table id="runsTable" class="sortable">
+                            <tr class="header">
+                                        <th>Build</th>
+                                        <th>Started</th>
+                                        <th>Finished</th>
+                                        <th>Wall time</th>
+                                        <th>Built</th>
+                                        <th>Failed</th>
+                            </tr>`
+
+        for (let i = 0; i < runs.length; i++) {
+            runsTable += `<tr class=${runs[i].numberOfTargetsFailed ? "failed" : "completed"}>
+            <td>${runs[i].buildId}</td>
+            <td>${formatDate(runs[i].startTime)}</td>
+            <td>${formatDate(runs[i].endTime)}</td>
+            <td>${formatDuration(runs[i].wallTime)}</td>
+            <td>${runs[i].numberOfTargetsBuilt}</td>
+            <td>${runs[i].numberOfTargetsFailed}</td></tr>`;
+        }
+
+        runsTable += "</table>";
+
+        const status = document.getElementById("status");
+        status.insertAdjacentHTML("beforeend", runsTable);
+        sorttable.makeSortable(document.getElementById("runsTable"));
+    })
+        .catch((error) => {
+            console.log(error.message)
+        });
+}
+
+//browsers can't decompress zstd, so those logs are offered as a download only
+function logLink(url) {
+    if (url.endsWith(".zst")) {
+        return `<a href=${url} download title="zstd compressed, open with zstdcat">download (zstd)</a>`;
+    }
+    return `<a target='_blank' href=${url} onclick="return openLog(event, this.href)">...</a>`;
+}
+
+//shows gzip compressed logs as text, other logs are opened by the link itself
+function openLog(event, url) {
+    if (!url.endsWith(".gz") || typeof DecompressionStream === "undefined") {
+        return true;
+    }
+    event.preventDefault();
+    const logWindow = window.open("", "_blank");
+    fetch(url).then((response) => response.arrayBuffer()).then((data) => {
+        if (!data.byteLength) {
+            return new Blob([]);
+        }
+        const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream("gzip"));
+        return new Response(stream).blob();
+    }).then((log) => {
+        logWindow.location = URL.createObjectURL(new Blob([log], { type: "text/plain" }));
+    }).catch((error) => {
+        logWindow.location = url;
+        console.log(error.message)
+    });
+    return false;
+}
+
+//formats seconds as hh:mm:ss, durations over a day are shown in hours
+function formatDuration(seconds) {
+    const hours = Math.floor(seconds / 3600);
+    const rest = new Date((seconds % 3600) * 1000).toISOString().slice(14, 19);
+    return ("0" + hours).slice(-2) + ":" + rest;
+}
+
 function formatDate(date) {
     if (!date) {
         return ""
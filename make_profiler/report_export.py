@@ -13,6 +13,9 @@ def export_report(performance, docs, targets):
     n_failed = 0
     n_total = 0
     oldest_completed_target = ''
+    scheduler_wait = 0
+    # the collector exports the report again and again in the same process
+    status.clear()
 
     not_started_targets = set(targets)
 
@@ -23,6 +26,7 @@ def export_report(performance, docs, targets):
 
             rec = performance[key]
             n_total += 1
+            scheduler_wait += rec.get("wait_sec", 0)
             if rec["running"]:
                 # running flag has the highest priority.
                 # target can be also marked as done, if it was built on previous run.
@@ -79,7 +83,14 @@ def export_report(performance, docs, targets):
                  "targetTime": event_time,
                  "targetDuration": event_duration,
                  "lastTargetCompletionTime": last_event_time,
-                 "targetLog": log_path
+                 "targetLog": log_path,
+                 "targetRegression": rec.get("regression", False),
+                 "targetBaselineDuration": rec.get("baseline_sec"),
+                 "targetDurationP50": rec.get("p50"),
+                 "targetDurationP95": rec.get("p95"),
+                 "targetDurationP99": rec.get("p99"),
+                 "targetResources": rec.get("rusage"),
+                 "targetSchedulerWait": rec.get("wait_sec")
                  }
             )
 
@@ -103,6 +114,7 @@ def export_report(performance, docs, targets):
         "numberOfTargetsFailed": n_failed,
         "numberOfTargetsNeverStarted": n_never_started,
         "oldestCompletionTime": oldest_completed_target,
+        "totalSchedulerWait": scheduler_wait,
         "presentStatus": current_status
     }
 
@@ -112,3 +124,42 @@ def export_report(performance, docs, targets):
     fo.write(json.dumps(status_list))
 
     fo.close()
+
+
+def export_runs(runs):
+    """Write the build history returned by ``run_index.list_runs`` to runs.json."""
+    history = []
+    for run in runs:
+        history.append({
+            "buildId": run["bid"],
+            "startTime": datetime.utcfromtimestamp(int(run["start"])).strftime(DATE_FORMAT),
+            "endTime": datetime.utcfromtimestamp(int(run["end"])).strftime(DATE_FORMAT),
+            "wallTime": run["wall"],
+            "numberOfTargetsBuilt": run["built"],
+            "numberOfTargetsFailed": run["failed"],
+            "numberOfTargetsInProgress": run["running"]
+        })
+
+    with open('runs.json', 'w', encoding="utf-8") as fo:
+        fo.write(json.dumps({"runs": history}))
+
+
+def export_utilisation(utilisation):
+    """Write the result of ``utilisation.run_utilisation`` to utilisation.json."""
+    report = {
+        "buildId": utilisation["bid"],
+        "startTime": None,
+        "wallTime": utilisation["wall"],
+        "meanConcurrency": utilisation["mean"],
+        "maxConcurrency": utilisation["max"],
+        "jobs": utilisation["jobs"],
+        "shareBelowJobs": utilisation["below_jobs"],
+        "idleTime": utilisation["idle"],
+        "idleGaps": utilisation["idle_gaps"],
+        "steps": utilisation["steps"]
+    }
+    if utilisation["start"] is not None:
+        report["startTime"] = datetime.utcfromtimestamp(int(utilisation["start"])).strftime(DATE_FORMAT)
+
+    with open('utilisation.json', 'w', encoding="utf-8") as fo:
+        fo.write(json.dumps(report))
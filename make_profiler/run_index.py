@@ -0,0 +1,105 @@
+"""Per-build summaries of the timing db kept up to date incrementally.
+
+The index lives in a JSON sidecar next to ``make_profile.db``. It holds the
+byte offset reached in the db and, for every build id, the first and the
+last event timestamp and the number of started and finished targets, so
+that listing past builds only needs to read lines appended since the
+previous call.
+"""
+
+import json
+import os
+
+from make_profiler.timing import (
+    LogIndex,
+    _prefix_unchanged,
+    _read_appended,
+    _save_state,
+)
+
+
+def _load_index(filename, index_filename):
+    empty = {'offset': 0, 'tail': '', 'runs': {}}
+    if not os.path.isfile(index_filename):
+        return empty
+    try:
+        with open(index_filename, encoding='utf-8') as fd:
+            state = json.load(fd)
+    except ValueError:
+        return empty
+    if not _prefix_unchanged(filename, state['offset'], state['tail']):
+        # the db was compacted or rotated: recount the builds it still has
+        # raw events for and keep the summaries of the others
+        state['offset'] = 0
+        state['tail'] = ''
+        state['rescan'] = True
+    return state
+
+
+def update_run_index(filename, index_filename):
+    """Fold lines appended to ``filename`` into the run index and return it."""
+    if not os.path.isfile(filename):
+        return {'offset': 0, 'tail': '', 'runs': {}}
+    state = _load_index(filename, index_filename)
+    rescan = state.pop('rescan', False)
+    lines, offset, tail = _read_appended(filename, state['offset'])
+    if not lines and not rescan:
+        return state
+
+    runs = state['runs']
+    recounted = set()
+    for line in lines:
+        parts = line.split()
+        if len(parts) != 4:
+            continue
+        ts, bid, action, _ = parts
+        ts = float(ts)
+        if rescan and bid not in recounted:
+            runs.pop(bid, None)
+            recounted.add(bid)
+        run = runs.setdefault(bid, {'start': ts, 'end': ts, 'started': 0, 'finished': 0})
+        run['start'] = min(run['start'], ts)
+        run['end'] = max(run['end'], ts)
+        if action == 'start':
+            run['started'] += 1
+        elif action == 'finish':
+            run['finished'] += 1
+    state['offset'] = offset
+    state['tail'] = tail
+    _save_state(index_filename, state)
+    return state
+
+
+def list_runs(filename, index_filename=None, log_index=None):
+    """Return summaries of all builds recorded in ``filename``, oldest first.
+
+    Every summary holds the build id, ``start`` and ``end`` timestamps, the
+    ``wall`` time in seconds and the number of targets ``built``, ``failed``
+    and still ``running``. A target that started but never finished counts
+    as failed, except in the latest build where the ``failed.touch`` markers
+    tell failed targets apart from running ones.
+    """
+    if index_filename is None:
+        index_filename = filename + '.runs'
+    if log_index is None:
+        log_index = LogIndex()
+
+    runs = sorted(
+        update_run_index(filename, index_filename)['runs'].items(),
+        key=lambda item: (item[1]['start'], item[1]['end']))
+    result = []
+    for i, (bid, run) in enumerate(runs):
+        unfinished = max(run['started'] - run['finished'], 0)
+        failed = unfinished
+        if i == len(runs) - 1:
+            failed = min(unfinished, len(log_index.targets_with(bid, 'failed.touch')))
+        result.append({
+            'bid': bid,
+            'start': run['start'],
+            'end': run['end'],
+            'wall': run['end'] - run['start'],
+            'built': run['finished'],
+            'failed': failed,
+            'running': unfinished - failed,
+        })
+    return result
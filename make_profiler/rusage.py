@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+"""Shell wrapper recording the resource usage of recipe lines.
+
+``profile_make --rusage`` runs every recipe line of the Makefile with this
+module followed by the db, the build id, the target, the time the recipe
+shell launched it and the shell command line of the target, the hooks
+around it run without it. The resource usage ``wait4`` reports for the
+recipe line is appended to the db as a line::
+
+    <timestamp> <build id> rusage <target> {"utime":...,"maxrss":...}
+
+CPU times are in seconds, ``maxrss`` is in kilobytes, ``inblock`` and
+``oublock`` count block reads and writes and ``nvcsw`` and ``nivcsw`` count
+voluntary and involuntary context switches. ``overhead`` is the wall time
+the wrapper itself took, from its launch to the start of the recipe line
+and from the end of the line to the record, which ``timing`` takes off the
+duration of the target.
+
+The wrapper starts once per recipe line, so it imports nothing beyond what
+the interpreter loads anyway and writes its record without ``json``.
+"""
+
+import os
+import sys
+import time
+
+# Action of the per-recipe-line resource usage records.
+RUSAGE = 'rusage'
+
+
+def usage_record(usage, overhead=0.0):
+    """Convert a ``resource.struct_rusage`` into a db record."""
+    return {
+        'utime': round(usage.ru_utime, 6),
+        'stime': round(usage.ru_stime, 6),
+        'maxrss': usage.ru_maxrss,
+        'nvcsw': usage.ru_nvcsw,
+        'nivcsw': usage.ru_nivcsw,
+        'inblock': usage.ru_inblock,
+        'oublock': usage.ru_oublock,
+        'overhead': round(overhead, 6),
+    }
+
+
+def main(argv=sys.argv[1:]):
+    db_filename, bid, target, launched, *command = argv
+    spawned = time.time()
+    pid = os.posix_spawnp(command[0], command, os.environ)
+    _, status, usage = os.wait4(pid, 0)
+    finished = time.time()
+    with open(db_filename, 'a', encoding='utf-8') as fd:
+        record = usage_record(usage, max(spawned - float(launched), 0) + time.time() - finished)
+        fd.write('%.6f %s %s %s {%s}\n' % (
+            finished, bid, RUSAGE, target, ','.join('"%s":%r' % item for item in record.items())))
+    code = os.waitstatus_to_exitcode(status)
+    # a recipe killed by a signal exits like it would from a shell
+    return 128 - code if code < 0 else code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Mergeable quantile sketch for target durations.
+
+A small t-digest: the distribution is kept as a sorted list of centroids
+``[mean, weight]`` whose size is bounded by the compression factor. Centroids
+near the tails stay small, so extreme quantiles remain accurate, and two
+sketches merge by simply compressing their centroids together.
+"""
+
+DEFAULT_COMPRESSION = 50
+
+
+class QuantileSketch:
+    """Approximate distribution of a stream of values."""
+
+    def __init__(self, centroids=(), compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.centroids = [list(c) for c in centroids]
+        self.buffer = []
+
+    @property
+    def count(self):
+        return sum(w for _, w in self.centroids) + sum(w for _, w in self.buffer)
+
+    def add(self, value, weight=1.0):
+        self.buffer.append([float(value), float(weight)])
+        if len(self.buffer) > 5 * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        """Add every value seen by ``other`` to this sketch."""
+        self.buffer.extend([list(c) for c in other.centroids + other.buffer])
+        self._compress()
+
+    def _compress(self):
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        total = sum(w for _, w in points)
+        result = []
+        # weight of the centroids before the last one in ``result``
+        cumulative = 0.0
+        for mean, weight in points:
+            if result:
+                last = result[-1]
+                q = (cumulative + (last[1] + weight) / 2) / total
+                if last[1] + weight <= 4 * total * q * (1 - q) / self.compression:
+                    last[1] += weight
+                    last[0] += (mean - last[0]) * weight / last[1]
+                    continue
+                cumulative += last[1]
+            result.append([mean, weight])
+        self.centroids = result
+
+    def quantile(self, q):
+        """Return the estimated ``q``-quantile, ``q`` being between 0 and 1.
+
+        For a sketch of few values this equals the linear interpolation
+        between closest ranks used for exact percentiles.
+        """
+        if self.buffer:
+            self._compress()
+        if not self.centroids:
+            return 0
+        total = sum(w for _, w in self.centroids)
+        target = q * (total - 1) + 0.5
+        cumulative = 0.0
+        prev_mean = prev_center = None
+        for mean, weight in self.centroids:
+            center = cumulative + weight / 2
+            if target <= center:
+                if prev_mean is None:
+                    return mean
+                return prev_mean + (mean - prev_mean) * (target - prev_center) / (center - prev_center)
+            prev_mean, prev_center = mean, center
+            cumulative += weight
+        return self.centroids[-1][0]
+
+    def to_list(self):
+        """Return the centroids in a JSON serialisable form."""
+        if self.buffer:
+            self._compress()
+        return [[round(mean, 6), weight] for mean, weight in self.centroids]
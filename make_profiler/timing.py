@@ -1,20 +1,166 @@
+import collections
+import json
+import math
 import os
 import time
+from array import array
 
+from make_profiler.rusage import RUSAGE
+from make_profiler.sketch import QuantileSketch
 
-def parse_timing_db(filename, after_date=None):
-    if not os.path.isfile(filename):
-        return {}
+# Size of the blocks the db is read in when scanning it backwards.
+REVERSE_BLOCK_SIZE = 1 << 16
 
-    lines = [i.strip().split() for i in open(filename)]
-    lines.reverse()
+# Number of bytes before the checkpoint offset that are stored in the
+# checkpoint and compared on load to detect a rewritten or rotated db.
+CHECKPOINT_TAIL = 256
+
+# Names of a target log for every capture mode of ``make_profiler.logcap``.
+LOG_NAMES = ('log.txt', 'log.txt.gz', 'log.txt.zst')
+
+# Action of the per-target records written by ``profile_make_compact``.
+AGGREGATE = 'aggregate'
+
+# Actions of the per-recipe-line events written with ``--line_timing``,
+# their payload is the number of the recipe line within the target.
+LINE_START = 'line_start'
+LINE_FINISH = 'line_finish'
+
+# Action of a failed run: sent to the event stream by the Makefile hooks and
+# standing for the last run of a compacted target that never succeeded.
+FAIL = 'fail'
+
+
+class LogIndex:
+    """Files below the ``logs`` directory, indexed with ``os.scandir``.
+
+    Each ``logs/<bid>`` tree is scanned once, the first time a file of that
+    build is asked for, and every later lookup is answered from memory
+    instead of a ``stat`` call per db line.
+    """
+
+    def __init__(self, root='logs'):
+        self.root = root
+        self.entries = set()
+        self.scanned = set()
+
+    def _scan(self, bid):
+        stack = ['']
+        while stack:
+            target = stack.pop()
+            try:
+                it = os.scandir(os.path.join(self.root, bid, target))
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(target + '/' + entry.name if target else entry.name)
+                    elif target:
+                        self.entries.add((bid, target, entry.name))
+        self.scanned.add(bid)
+
+    def exists(self, bid, target, name, scan=True):
+        """Check whether ``logs/<bid>/<target>/<name>`` exists.
+
+        With ``scan`` False a build that wasn't scanned yet is not scanned,
+        the file is looked up with a single ``stat`` call instead, which is
+        cheaper when only one target of the build is of interest.
+        """
+        if bid not in self.scanned:
+            if not scan:
+                return os.path.exists(os.path.join(self.root, bid, target, name))
+            self._scan(bid)
+        return (bid, target, name) in self.entries
+
+    def refresh(self, bid, target):
+        """Add files created in ``logs/<bid>/<target>`` since it was scanned."""
+        if bid not in self.scanned:
+            self._scan(bid)
+            return
+        try:
+            with os.scandir(os.path.join(self.root, bid, target)) as it:
+                for entry in it:
+                    if not entry.is_dir(follow_symlinks=False):
+                        self.entries.add((bid, target, entry.name))
+        except OSError:
+            pass
+
+    def targets_with(self, bid, name):
+        """Return the targets of build ``bid`` that have a ``name`` file."""
+        if bid not in self.scanned:
+            self._scan(bid)
+        return {t for b, t, n in self.entries if b == bid and n == name}
+
+
+def _expand_aggregates(lines, newest_first=True):
+    """Replace aggregate records with the last run they folded.
+
+    An aggregate record written by ``profile_make_compact`` carries the build
+    id, start and finish of the most recent successful run it folded, which
+    is turned back into a start and a finish line so that compacted targets
+    keep their previous run timings. When the last folded run failed, or
+    none of them succeeded, a start and a ``fail`` line of the last run
+    follow.
+    """
+    for parts in lines:
+        if len(parts) == 5 and parts[2] == AGGREGATE:
+            ts, bid, _, target, record = parts
+            record = json.loads(record)
+            events = []
+            if 'start' in record:
+                # records of older versions keep the last successful run on the line
+                success = record.get('bid', bid)
+                events += [[record['start'], success, 'start', target],
+                           [record.get('finish', ts), success, 'finish', target]]
+            if 'failed' in record or 'start' not in record:
+                events += [[record.get('failed', ts), bid, 'start', target], [ts, bid, FAIL, target]]
+            if newest_first:
+                events.reverse()
+            yield from events
+        else:
+            yield parts
+
+
+def _merge_rusage(total, record):
+    """Add the resource usage ``record`` of a recipe line to ``total``."""
+    for key, value in record.items():
+        if key == 'maxrss':
+            total[key] = max(total.get(key, 0), value)
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def _collect_targets(lines, after_date=None, wanted=None, max_runs=None, log_index=None):
+    """Build per-target timing information from db lines, newest first.
+
+    ``lines`` is an iterable of split db lines ordered from the most recent
+    one to the oldest one. Reading stops early once every target in
+    ``wanted`` has both its current and previous run data, or once lines of
+    more than ``max_runs`` builds were seen.
+    """
+    if log_index is None:
+        log_index = LogIndex()
     cur_run_bid = ''
     targets = dict()
-    for parts in lines:
+    pending = set(wanted) if wanted is not None else None
+    seen_runs = set()
+    usage = {}
+    for parts in _expand_aggregates(lines):
+        if pending is not None and not pending:
+            break
+        if len(parts) == 5 and parts[2] == RUSAGE:
+            _merge_rusage(usage.setdefault((parts[3], parts[1]), {}), json.loads(parts[4]))
+            continue
         if len(parts) != 4:
             continue
         target = parts[3]
         bid = parts[1]
+        if max_runs is not None and bid not in seen_runs:
+            if len(seen_runs) >= max_runs:
+                break
+            seen_runs.add(bid)
         action = parts[2]
         timestamp = float(parts[0])
 
@@ -29,13 +175,22 @@ def parse_timing_db(filename, after_date=None):
                 'isdir': os.path.isdir(target)
             }
 
-        logpath = 'logs/%s/%s/log.txt' % (bid, target)
-        if 'log' not in targets[target] and os.path.exists(logpath):
-            targets[target]['log'] = logpath
+        if 'log' not in targets[target]:
+            for log_name in LOG_NAMES:
+                if log_index.exists(bid, target, log_name):
+                    targets[target]['log'] = 'logs/%s/%s/%s' % (bid, target, log_name)
+                    break
 
         failpath = 'logs/%s/%s/failed.touch' % (bid, target)
         if 'failed' not in targets[target]:
-            targets[target]['failed'] = os.path.exists(failpath)
+            targets[target]['failed'] = action == FAIL or log_index.exists(bid, target, 'failed.touch')
+
+        if action == FAIL:
+            # the logs of a compacted run may be gone, the failure time is the event time
+            if bid == cur_run_bid:
+                targets[target]['current'] = True
+                targets[target].setdefault('finish_current', timestamp)
+            continue
 
         if bid == cur_run_bid:
             targets[target]['current'] = True
@@ -61,10 +216,225 @@ def parse_timing_db(filename, after_date=None):
                 targets[target]['timing_sec'] = 1
             else:
                 targets[target]['timing_sec'] = targets[target]['finish_prev'] - targets[target]['start_prev']
+
+        if pending is not None and 'start_prev' in targets[target]:
+            pending.discard(target)
+
+    # resource usage of the run the timing comes from
+    for target, info in targets.items():
+        bid = cur_run_bid if info['current'] else info.get('prev')
+        if (target, bid) in usage:
+            info['rusage'] = usage[target, bid]
+            # the time the rusage wrapper took is not the target's
+            cut = after_date and not info['current'] and info.get('start_prev', 0) < after_date.timestamp()
+            if 'timing_sec' in info and not info['running'] and not cut:
+                info['timing_sec'] = max(info['timing_sec'] - info['rusage'].get('overhead', 0), 0)
     return targets
 
 
-def analyze_target(filename, target_name):
+def _read_lines_reversed(filename, block_size=REVERSE_BLOCK_SIZE):
+    """Yield split lines of ``filename`` from the last one to the first one.
+
+    The file is read backwards in blocks of ``block_size`` bytes, so only
+    the part of the history that is actually consumed gets read.
+    """
+    with open(filename, 'rb') as fd:
+        position = fd.seek(0, os.SEEK_END)
+        rest = b''
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            fd.seek(position)
+            chunk = fd.read(size) + rest
+            lines = chunk.split(b'\n')
+            # the first piece may be the end of a line from the previous block
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                yield line.decode('utf-8').split()
+        yield rest.decode('utf-8').split()
+
+
+def _fold_line(state, seq, parts):
+    """Record a db line, oldest first, in the checkpoint ``state``.
+
+    For every target and build id only the events that can still influence
+    the result of :func:`_collect_targets` are kept: the first start, the
+    first and the last finish, the very last event of the run and the sum of
+    its resource usage records.
+    """
+    ts, bid, action, target, *record = parts
+    run = state['targets'].setdefault(target, {}).setdefault(bid, {})
+    if action == RUSAGE:
+        # resource usage of the run is kept summed up in a single record
+        total = run['rusage'][3] if 'rusage' in run else {}
+        run['rusage'] = [seq, ts, action, _merge_rusage(total, json.loads(record[0]))]
+        return
+    event = [seq, ts, action]
+    if action == 'start' and 'first_start' not in run:
+        run['first_start'] = event
+    elif action == 'finish':
+        run.setdefault('first_finish', event)
+        run['last_finish'] = event
+    run['last'] = event
+    state['cur_run_bid'] = bid
+
+
+def _prune_runs(state, target):
+    """Forget runs of ``target`` hidden behind two newer finished runs.
+
+    Whichever build becomes current later, the previous run of the target is
+    one of its two most recent finished runs, so older runs can't show up in
+    the result any more. This holds as long as builds sharing a db don't
+    overlap in time.
+    """
+    runs = state['targets'][target]
+    finished = sorted(
+        (run['last_finish'][0] for run in runs.values() if 'last_finish' in run),
+        reverse=True)
+    if len(finished) < 2:
+        return
+    oldest_kept = finished[1]
+    for bid in list(runs):
+        if 'last' in runs[bid] and runs[bid]['last'][0] < oldest_kept and bid != state['cur_run_bid']:
+            del runs[bid]
+
+
+def _retained_lines(state):
+    """Return the db lines kept in the checkpoint ``state``, newest first."""
+    events = {}
+    for target, runs in state['targets'].items():
+        for bid, run in runs.items():
+            for seq, ts, action, *record in run.values():
+                events[seq] = [ts, bid, action, target] + [json.dumps(r) for r in record]
+    return [events[seq] for seq in sorted(events, reverse=True)]
+
+
+def _prefix_unchanged(filename, offset, tail):
+    """Check that ``filename`` still has ``tail`` right before ``offset``."""
+    if os.path.getsize(filename) < offset:
+        return False
+    tail = tail.encode('latin-1')
+    with open(filename, 'rb') as fd:
+        fd.seek(offset - len(tail))
+        return fd.read(len(tail)) == tail
+
+
+def _read_appended(filename, offset):
+    """Return complete lines written to ``filename`` after ``offset``.
+
+    The result is a ``(lines, offset, tail)`` tuple holding the decoded
+    lines, the offset right after the last of them and the bytes preceding
+    that offset to pass to :func:`_prefix_unchanged` on the next read.
+    """
+    with open(filename, 'rb') as fd:
+        fd.seek(offset)
+        data = fd.read()
+        # an unterminated last line may still be being written by make
+        data = data[:data.rfind(b'\n') + 1]
+        offset += len(data)
+        start = max(offset - CHECKPOINT_TAIL, 0)
+        fd.seek(start)
+        tail = fd.read(offset - start).decode('latin-1')
+    return data.decode('utf-8').splitlines(), offset, tail
+
+
+def _save_state(filename, state):
+    """Atomically replace the JSON sidecar ``filename`` with ``state``."""
+    tmp_name = filename + '.tmp'
+    with open(tmp_name, 'w', encoding='utf-8') as fd:
+        json.dump(state, fd)
+    os.replace(tmp_name, filename)
+
+
+def _empty_checkpoint():
+    return {'offset': 0, 'tail': '', 'seq': 0, 'cur_run_bid': '', 'targets': {}}
+
+
+def _load_checkpoint(filename, checkpoint):
+    """Load ``checkpoint`` if it still describes a prefix of ``filename``."""
+    empty = _empty_checkpoint()
+    if not os.path.isfile(checkpoint):
+        return empty
+    try:
+        with open(checkpoint, encoding='utf-8') as fd:
+            state = json.load(fd)
+    except ValueError:
+        return empty
+
+    if not _prefix_unchanged(filename, state['offset'], state['tail']):
+        return empty
+    return state
+
+
+def _fold_lines(state, lines):
+    """Fold split db ``lines``, oldest first, into the checkpoint ``state``."""
+    touched = set()
+    for parts in _expand_aggregates(lines, newest_first=False):
+        if len(parts) != 4 and not (len(parts) == 5 and parts[2] == RUSAGE):
+            continue
+        state['seq'] += 1
+        _fold_line(state, state['seq'], parts)
+        touched.add(parts[3])
+    for target in touched:
+        _prune_runs(state, target)
+
+
+def _update_checkpoint(filename, checkpoint):
+    """Fold the lines appended to ``filename`` into ``checkpoint``.
+
+    Only the bytes written after the stored offset are read. Returns the
+    updated checkpoint state, which is also written back to disk.
+    """
+    state = _load_checkpoint(filename, checkpoint)
+    lines, offset, tail = _read_appended(filename, state['offset'])
+    if not lines:
+        return state
+
+    _fold_lines(state, (line.split() for line in lines))
+    state['offset'] = offset
+    state['tail'] = tail
+    _save_state(checkpoint, state)
+    return state
+
+
+def parse_timing_db(filename, after_date=None, checkpoint=None, targets=None, max_runs=None,
+                    log_index=None):
+    """Return per-target timing information read from ``filename``.
+
+    When ``checkpoint`` is given it names a sidecar file holding the byte
+    offset reached by the previous call together with the per-target state
+    built so far, so that only lines appended since then are parsed.
+
+    When ``targets`` or ``max_runs`` is given the db is read backwards and
+    reading stops as soon as every one of ``targets`` has its current and
+    previous run data, or lines of ``max_runs`` builds were read. Targets
+    outside of ``targets`` may then lack their previous run data. With a
+    ``checkpoint`` the checkpoint is advanced first and ``targets`` limits
+    what is read from it; ``max_runs`` can't be combined with it, since the
+    checkpoint only keeps the runs the full result needs.
+
+    ``log_index`` is a :class:`LogIndex` shared with other readers of the
+    ``logs`` directory during the same invocation.
+    """
+    if not os.path.isfile(filename):
+        return {}
+
+    if checkpoint:
+        if max_runs is not None:
+            raise ValueError('max_runs can\'t be used with a checkpoint')
+        state = _update_checkpoint(filename, checkpoint)
+        return _collect_targets(_retained_lines(state), after_date, targets, log_index=log_index)
+
+    if targets is not None or max_runs is not None:
+        return _collect_targets(
+            _read_lines_reversed(filename), after_date, targets, max_runs, log_index)
+
+    lines = [i.strip().split() for i in open(filename)]
+    lines.reverse()
+    return _collect_targets(lines, after_date, log_index=log_index)
+
+
+def analyze_target(filename, target_name, log_index=None):
     """Return timing statistics for the given target.
 
     Parameters
@@ -73,6 +443,8 @@ def analyze_target(filename, target_name):
         Path to ``make_profile.db`` file.
     target_name: str
         Name of the target to analyse.
+    log_index: LogIndex, optional
+        Index of the ``logs`` directory used to look up failed runs.
 
     Returns
     -------
@@ -82,25 +454,59 @@ def analyze_target(filename, target_name):
     """
 
     if not os.path.isfile(filename):
-        return {
-            'started': 0,
-            'finished': 0,
-            'max': 0,
-            'min': 0,
-            'avg': 0,
-            'median': 0,
-            'last': 0,
-        }
+        return _target_statistics({}, target_name, log_index)
 
     lines = [i.strip().split() for i in open(filename)]
     runs = {}
+    aggregate = None
 
-    for ts_str, bid, action, tgt in lines:
+    for parts in lines:
+        if len(parts) == 5 and parts[2] == AGGREGATE and parts[3] == target_name:
+            aggregate = json.loads(parts[4])
+        if len(parts) != 4:
+            continue
+        ts_str, bid, action, tgt = parts
         if tgt != target_name or action not in ('start', 'finish'):
             continue
         ts = float(ts_str)
         runs.setdefault(bid, {}).update({action: ts})
 
+    return _target_statistics(runs, target_name, log_index, aggregate)
+
+
+def analyze_target_lines(filename, target_name, log_index=None):
+    """Return timing statistics for every recipe line of the given target.
+
+    The statistics are built from the ``line_start`` and ``line_finish``
+    events written by ``profile_make --line_timing``. Returns a list ordered
+    by the line number, starting at 1, holding the ``line`` number and the
+    same statistics as :func:`analyze_target`.
+    """
+    lines = {}
+    if os.path.isfile(filename):
+        with open(filename) as fd:
+            for line in fd:
+                parts = line.split()
+                if len(parts) != 5 or parts[2] not in (LINE_START, LINE_FINISH) or parts[3] != target_name:
+                    continue
+                ts, bid, action, _, index = parts
+                run = lines.setdefault(int(index), {}).setdefault(bid, {})
+                run['start' if action == LINE_START else 'finish'] = float(ts)
+
+    return [
+        dict(line=index, **_target_statistics(runs, target_name, log_index))
+        for index, runs in sorted(lines.items())]
+
+
+def _target_statistics(runs, target_name, log_index=None, aggregate=None):
+    """Summarise ``runs`` of ``target_name`` as returned by :func:`analyze_target`.
+
+    ``runs`` maps a build id to a dictionary with ``start`` and ``finish``
+    timestamps of the target in that build. ``aggregate`` is the record of
+    older runs folded by ``profile_make_compact``, if any.
+    """
+    if log_index is None:
+        log_index = LogIndex()
     started = 0
     finished = 0
     durations = []
@@ -109,15 +515,27 @@ def analyze_target(filename, target_name):
         if 'start' in data:
             started += 1
         if 'start' in data and 'finish' in data:
-            failpath = os.path.join('logs', bid, target_name, 'failed.touch')
-            if not os.path.exists(failpath):
+            if not log_index.exists(bid, target_name, 'failed.touch', scan=False):
                 finished += 1
                 durations.append((data['finish'], data['finish'] - data['start']))
 
     durations.sort(key=lambda d: d[0])
     times = [d[1] for d in durations]
 
-    if times:
+    if aggregate:
+        started += aggregate['started']
+        finished += aggregate['count']
+
+    if aggregate and aggregate['count']:
+        sketch = QuantileSketch(aggregate['sketch'])
+        for t in times:
+            sketch.add(t)
+        max_d = max(times + [aggregate['max']])
+        min_d = min(times + [aggregate['min']])
+        avg_d = (sum(times) + aggregate['sum']) / (len(times) + aggregate['count'])
+        median_d = sketch.quantile(0.5)
+        last_d = times[-1] if times else aggregate['last']
+    elif times:
         max_d = max(times)
         min_d = min(times)
         avg_d = sum(times) / len(times)
@@ -140,3 +558,111 @@ def analyze_target(filename, target_name):
         'median': median_d,
         'last': last_d,
     }
+
+
+def _percentile(times, q):
+    """Return the ``q``-th percentile of the sorted ``times``.
+
+    Values between the closest ranks are linearly interpolated.
+    """
+    position = (len(times) - 1) * q / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return times[lower] + (times[upper] - times[lower]) * (position - lower)
+
+
+def _all_target_statistics(runs, log_index=None, aggregates=None):
+    """Summarise ``runs`` of every target as returned by :func:`analyze_all_targets`.
+
+    ``runs`` maps a target name to a dictionary of its runs in the format
+    accepted by :func:`_target_statistics`, ``aggregates`` maps a target name
+    to the record of its runs folded by ``profile_make_compact``.
+    """
+    if log_index is None:
+        log_index = LogIndex()
+    aggregates = aggregates or {}
+
+    result = []
+    for target in set(runs) | set(aggregates):
+        times = array('d', sorted(
+            data['finish'] - data['start']
+            for bid, data in runs.get(target, {}).items()
+            if 'start' in data and 'finish' in data
+            and not log_index.exists(bid, target, 'failed.touch')))
+        aggregate = aggregates.get(target)
+        if aggregate and aggregate['count']:
+            count = len(times) + aggregate['count']
+            total = math.fsum(times) + aggregate['sum']
+            mean = total / count
+            sumsq = math.fsum(t * t for t in times) + aggregate['sumsq']
+            sketch = QuantileSketch(aggregate['sketch'])
+            for t in times:
+                sketch.add(t)
+            stats = {
+                'min': min([aggregate['min'], *times[:1]]),
+                'max': max([aggregate['max'], *times[-1:]]),
+                'median': sketch.quantile(0.5),
+                'p90': sketch.quantile(0.9),
+                'p99': sketch.quantile(0.99),
+                'stddev': math.sqrt(max(sumsq / count - mean * mean, 0)),
+            }
+        elif times:
+            count = len(times)
+            total = math.fsum(times)
+            mean = total / count
+            stats = {
+                'min': times[0],
+                'max': times[-1],
+                'median': _percentile(times, 50),
+                'p90': _percentile(times, 90),
+                'p99': _percentile(times, 99),
+                'stddev': math.sqrt(math.fsum((t - mean) ** 2 for t in times) / count),
+            }
+        else:
+            continue
+        result.append({
+            'target': target,
+            'count': count,
+            'total': total,
+            'min': stats['min'],
+            'max': stats['max'],
+            'mean': mean,
+            'median': stats['median'],
+            'p90': stats['p90'],
+            'p99': stats['p99'],
+            'stddev': stats['stddev'],
+        })
+    result.sort(key=lambda stats: stats['total'], reverse=True)
+    return result
+
+
+def analyze_all_targets(filename, log_index=None):
+    """Return timing statistics of every target in a single pass over the db.
+
+    Parameters
+    ----------
+    filename: str
+        Path to ``make_profile.db`` file.
+    log_index: LogIndex, optional
+        Index of the ``logs`` directory used to look up failed runs.
+
+    Returns
+    -------
+    list
+        One dictionary per target that finished at least once, with its
+        ``count`` of successful runs, ``total``, ``min``, ``max``, ``mean``,
+        ``median``, ``p90``, ``p99`` and ``stddev`` duration in seconds,
+        sorted by the total time spent in the target.
+    """
+    runs = collections.defaultdict(dict)
+    aggregates = {}
+    if os.path.isfile(filename):
+        for line in open(filename):
+            parts = line.split()
+            if len(parts) == 5 and parts[2] == AGGREGATE:
+                aggregates[parts[3]] = json.loads(parts[4])
+            if len(parts) != 4 or parts[2] not in ('start', 'finish'):
+                continue
+            ts, bid, action, target = parts
+            runs[target].setdefault(bid, {})[action] = float(ts)
+    return _all_target_statistics(runs, log_index, aggregates)
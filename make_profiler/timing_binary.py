@@ -0,0 +1,351 @@
+#!/usr/bin/python3
+"""Binary columnar copy of the timing db read through ``mmap``.
+
+The file starts with a fixed header followed by segments, one per sync
+that imported events::
+
+    header     magic, version, segment count, string count, action count,
+               event count, text db offset, end of the last segment,
+               text db tail
+    segment    new string count, new action count, event count, blob size
+      strings  uint32 offsets[new string count + 1] and the UTF-8 blob
+      actions  uint32[new action count], string ids of the new actions
+      timestamp  float64[event count]
+      bid        uint32[event count], index into the string table
+      target     uint32[event count], index into the string table
+      payload    uint32[event count], index into the string table or NO_PAYLOAD
+      action     uint8[event count], index into the action table
+
+Build ids, targets and actions are interned once, so reading an event is
+a few array lookups instead of splitting and converting a text line. A
+segment only holds the strings and actions the previous ones lack, so a
+sync appends the new events after the last segment and rewrites the header,
+without reading the existing columns back. Columns are aligned to 8 bytes
+so they can be cast from the ``mmap`` in place. Like the SQLite store it is
+a synced copy of the text db, which the Makefile hooks keep appending to.
+"""
+
+import argparse
+import bisect
+import collections
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from make_profiler.timing import (
+    AGGREGATE,
+    CHECKPOINT_TAIL,
+    RUSAGE,
+    _all_target_statistics,
+    _collect_targets,
+    _prefix_unchanged,
+    _read_appended,
+    _target_statistics,
+)
+
+MAGIC = b'MKPROFDB'
+VERSION = 2
+HEADER = struct.Struct('<8sIIIIIQQH%ds' % CHECKPOINT_TAIL)
+SEGMENT = struct.Struct('<IIII')
+NO_PAYLOAD = 0xFFFFFFFF
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class BinaryTimingDb:
+    """Columns of a binary timing db mapped into memory."""
+
+    def __init__(self, filename):
+        self._fd = open(filename, 'rb')
+        self._mm = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mm)
+        magic, version, n_segments, n_strings, n_actions, n_events, self.offset, self.end, tail_size, tail = \
+            HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION:
+            view.release()
+            self.close()
+            raise ValueError('%s is not a binary timing db' % filename)
+        self.tail = tail[:tail_size].decode('latin-1')
+
+        self.strings = []
+        self.actions = []
+        self.segments = []
+        self.starts = []
+        self.size = 0
+        pos = _align(HEADER.size)
+        for _ in range(n_segments):
+            new_strings, new_actions, size, blob_size = SEGMENT.unpack_from(self._mm, pos)
+            pos += SEGMENT.size
+            offsets = view[pos:pos + 4 * (new_strings + 1)].cast('I')
+            pos += 4 * (new_strings + 1)
+            blob = bytes(view[pos:pos + blob_size])
+            self.strings.extend(
+                blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(new_strings))
+            offsets.release()
+            pos = _align(pos + blob_size)
+            action_ids = view[pos:pos + 4 * new_actions].cast('I')
+            self.actions.extend(self.strings[i] for i in action_ids)
+            action_ids.release()
+            pos = _align(pos + 4 * new_actions)
+
+            columns = [view[pos:pos + 8 * size].cast('d')]
+            pos += 8 * size
+            for _ in range(3):
+                columns.append(view[pos:pos + 4 * size].cast('I'))
+                pos = _align(pos + 4 * size)
+            columns.append(view[pos:pos + size].cast('B'))
+            pos = _align(pos + size)
+            self.starts.append(self.size)
+            self.segments.append(columns)
+            self.size += size
+        view.release()
+        if (len(self.strings), len(self.actions), self.size, pos) != (n_strings, n_actions, n_events, self.end):
+            self.close()
+            raise ValueError('%s is damaged' % filename)
+
+    def close(self):
+        for columns in getattr(self, 'segments', ()):
+            for column in columns:
+                column.release()
+        self.segments = []
+        self._mm.close()
+        self._fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _event(self, columns, j):
+        timestamps, bids, targets, payloads, codes = columns
+        parts = (
+            timestamps[j],
+            self.strings[bids[j]],
+            self.actions[codes[j]],
+            self.strings[targets[j]],
+        )
+        if payloads[j] != NO_PAYLOAD:
+            parts += (self.strings[payloads[j]],)
+        return parts
+
+    def event(self, i):
+        """Return event ``i`` in the split text line format."""
+        k = bisect.bisect_right(self.starts, i) - 1
+        return self._event(self.segments[k], i - self.starts[k])
+
+    def events(self, targets=None, actions=None):
+        """Yield events, oldest first, optionally only of the given target and action ids."""
+        for columns in self.segments:
+            target_ids, codes = columns[2], columns[4]
+            for j in range(len(codes)):
+                if targets is not None and target_ids[j] not in targets:
+                    continue
+                if actions is not None and codes[j] not in actions:
+                    continue
+                yield self._event(columns, j)
+
+    def reversed_events(self):
+        for columns in reversed(self.segments):
+            for j in range(len(columns[4]) - 1, -1, -1):
+                yield self._event(columns, j)
+
+
+def _segment(events, strings, actions):
+    """Encode ``events`` as a segment, interning new values into ``strings`` and ``actions``.
+
+    ``strings`` and ``actions`` map the values already in the store to
+    their ids and get the new ones added.
+    """
+    n_strings = len(strings)
+    n_actions = len(actions)
+
+    def intern(value):
+        return strings.setdefault(value, len(strings))
+
+    timestamps = array('d')
+    columns = (array('I'), array('I'), array('I'))
+    codes = array('B')
+    for parts in events:
+        timestamps.append(float(parts[0]))
+        columns[0].append(intern(parts[1]))
+        columns[1].append(intern(parts[3]))
+        columns[2].append(intern(parts[4]) if len(parts) == 5 else NO_PAYLOAD)
+        if parts[2] not in actions:
+            if len(actions) == 256:
+                raise ValueError('too many distinct actions for a binary timing db')
+            actions[parts[2]] = len(actions)
+            intern(parts[2])
+        codes.append(actions[parts[2]])
+
+    new_strings = list(strings)[n_strings:]
+    blob = bytearray()
+    offsets = array('I', [0])
+    for value in new_strings:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+    action_ids = array('I', (strings[a] for a in list(actions)[n_actions:]))
+
+    data = bytearray(SEGMENT.pack(len(new_strings), len(action_ids), len(codes), len(blob)))
+    data += offsets.tobytes()
+    data += blob
+    for column in (action_ids, timestamps) + columns + (codes,):
+        data += b'\0' * (_align(len(data)) - len(data))
+        data += column.tobytes()
+    data += b'\0' * (_align(len(data)) - len(data))
+    return bytes(data)
+
+
+def _header(segments, strings, actions, size, offset, end, tail):
+    tail = tail.encode('latin-1')
+    return HEADER.pack(
+        MAGIC, VERSION, segments, len(strings), len(actions), size, offset, end, len(tail), tail)
+
+
+def write(store, events, offset=0, tail=''):
+    """Write ``events`` given as split text lines to the binary ``store``."""
+    strings = {}
+    actions = {}
+    segment = _segment(events, strings, actions)
+    start = _align(HEADER.size)
+    tmp_name = store + '.tmp'
+    with open(tmp_name, 'wb') as fd:
+        fd.write(_header(1, strings, actions, len(events), offset, start + len(segment), tail))
+        fd.write(b'\0' * (start - HEADER.size))
+        fd.write(segment)
+    os.replace(tmp_name, store)
+
+
+def append(store, db, events, offset, tail):
+    """Add ``events`` as a new segment after the last one of the open ``db``.
+
+    The segment is written past the end recorded in the header first and
+    the header is rewritten last, so an interrupted append leaves the
+    store as it was.
+    """
+    strings = {value: i for i, value in enumerate(db.strings)}
+    actions = {value: i for i, value in enumerate(db.actions)}
+    segment = _segment(events, strings, actions)
+    header = _header(
+        len(db.segments) + 1, strings, actions, db.size + len(events), offset, db.end + len(segment), tail)
+    end = db.end
+    db.close()
+    with open(store, 'r+b') as fd:
+        fd.seek(end)
+        fd.write(segment)
+        fd.truncate()
+        fd.flush()
+        os.fsync(fd.fileno())
+        fd.seek(0)
+        fd.write(header)
+
+
+def sync(filename, store):
+    """Append lines written to the text db ``filename`` to the binary ``store``.
+
+    New events are appended as a segment; if the text db was rewritten
+    since the previous sync, or the store is unreadable, it is converted
+    from scratch. Returns the number of imported events.
+    """
+    if not os.path.isfile(filename):
+        return 0
+
+    db = None
+    if os.path.isfile(store):
+        try:
+            db = BinaryTimingDb(store)
+        except (ValueError, struct.error):
+            pass
+        else:
+            if not _prefix_unchanged(filename, db.offset, db.tail):
+                db.close()
+                db = None
+
+    lines, offset, tail = _read_appended(filename, db.offset if db else 0)
+    imported = [
+        parts for parts in (line.split() for line in lines)
+        if len(parts) == 4 or (len(parts) == 5 and parts[2] in (AGGREGATE, RUSAGE))]
+    if db is None:
+        write(store, imported, offset, tail)
+    elif imported:
+        append(store, db, imported, offset, tail)
+    else:
+        db.close()
+    return len(imported)
+
+
+def parse_timing_store(store, after_date=None, log_index=None, targets=None, max_runs=None):
+    """Return the same per-target information as ``timing.parse_timing_db``.
+
+    Events are read from the end of the mapped columns, so with ``targets``
+    or ``max_runs`` only the recent part of the history is touched.
+    """
+    if not os.path.isfile(store):
+        return {}
+    with BinaryTimingDb(store) as db:
+        return _collect_targets(db.reversed_events(), after_date, targets, max_runs, log_index)
+
+
+def _load_runs(store, target_name=None):
+    runs = collections.defaultdict(dict)
+    aggregates = {}
+    if not os.path.isfile(store):
+        return runs, aggregates
+    with BinaryTimingDb(store) as db:
+        wanted = None
+        if target_name is not None:
+            if target_name not in db.strings:
+                return runs, aggregates
+            wanted = {db.strings.index(target_name)}
+        codes = {db.actions.index(a) for a in ('start', 'finish', AGGREGATE) if a in db.actions}
+        for ts, bid, action, target, *payload in db.events(wanted, codes):
+            if payload:
+                aggregates[target] = json.loads(payload[0])
+            else:
+                runs[target].setdefault(bid, {})[action] = ts
+    return runs, aggregates
+
+
+def analyze_target(store, target_name, log_index=None):
+    """Return the same statistics as ``timing.analyze_target`` from ``store``."""
+    runs, aggregates = _load_runs(store, target_name)
+    return _target_statistics(
+        runs.get(target_name, {}), target_name, log_index, aggregates.get(target_name))
+
+
+def analyze_all_targets(store, log_index=None):
+    """Return the same statistics as ``timing.analyze_all_targets`` from ``store``."""
+    runs, aggregates = _load_runs(store)
+    return _all_target_statistics(runs, log_index, aggregates)
+
+
+def main(argv=sys.argv[1:]):
+    options = argparse.ArgumentParser(
+        description='Convert make_profile.db into a binary columnar timing db.')
+    options.add_argument(
+        '-db',
+        action='store',
+        dest='db_filename',
+        type=str,
+        default='make_profile.db',
+        help='Profile with timings (default %(default)s)')
+    options.add_argument(
+        'store',
+        type=str,
+        help='Binary timing db to create or update')
+
+    args = options.parse_args(argv)
+    imported = sync(args.db_filename, args.store)
+    logging.info('imported %d events into %s', imported, args.store)
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,252 @@
+#!/usr/bin/python3
+"""SQLite store for timing events.
+
+The text ``make_profile.db`` written by the Makefile hooks stays the source
+of truth. :func:`sync` copies lines appended to it into an SQLite database
+with runs and events indexed by target and by build id, so that reports and
+``--analyze`` only touch the rows they need instead of the whole history.
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import sqlite3
+import sys
+
+from make_profiler.timing import (
+    AGGREGATE,
+    RUSAGE,
+    _all_target_statistics,
+    _collect_targets,
+    _prefix_unchanged,
+    _read_appended,
+    _target_statistics,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    bid TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    target TEXT NOT NULL,
+    action TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_target ON events (target);
+CREATE INDEX IF NOT EXISTS events_run ON events (run_id, target);
+CREATE TABLE IF NOT EXISTS aggregates (
+    event_id INTEGER PRIMARY KEY REFERENCES events (id),
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rusage (
+    event_id INTEGER PRIMARY KEY REFERENCES events (id),
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def connect(store):
+    """Open ``store`` creating the schema when needed."""
+    conn = sqlite3.connect(store)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _get_meta(conn, key, default):
+    row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else default
+
+
+def _set_meta(conn, key, value):
+    conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+
+def sync(filename, store):
+    """Import lines appended to the text db ``filename`` into ``store``.
+
+    The first call imports the whole file. Later calls only read the bytes
+    written since the previous one; if the text db was rewritten meanwhile
+    the store is rebuilt from scratch. Returns the number of imported events.
+    """
+    if not os.path.isfile(filename):
+        return 0
+
+    conn = connect(store)
+    with conn:
+        offset = int(_get_meta(conn, 'offset', 0))
+        tail = _get_meta(conn, 'tail', '')
+        if not _prefix_unchanged(filename, offset, tail):
+            conn.execute('DELETE FROM aggregates')
+            conn.execute('DELETE FROM rusage')
+            conn.execute('DELETE FROM events')
+            conn.execute('DELETE FROM runs')
+            offset = 0
+
+        lines, offset, tail = _read_appended(filename, offset)
+        run_ids = {}
+        events = []
+        imported = 0
+
+        def run_id(bid):
+            if bid not in run_ids:
+                conn.execute('INSERT OR IGNORE INTO runs (bid) VALUES (?)', (bid,))
+                run_ids[bid] = conn.execute(
+                    'SELECT id FROM runs WHERE bid = ?', (bid,)).fetchone()[0]
+            return run_ids[bid]
+
+        def flush():
+            conn.executemany(
+                'INSERT INTO events (run_id, target, action, timestamp) VALUES (?, ?, ?, ?)',
+                events)
+            events.clear()
+
+        for line in lines:
+            parts = line.split()
+            if len(parts) == 5 and parts[2] in (AGGREGATE, RUSAGE):
+                ts, bid, action, target, record = parts
+                flush()
+                event_id = conn.execute(
+                    'INSERT INTO events (run_id, target, action, timestamp) VALUES (?, ?, ?, ?)',
+                    (run_id(bid), target, action, float(ts))).lastrowid
+                # the action names the table of its record
+                conn.execute(
+                    'INSERT INTO %s (event_id, record) VALUES (?, ?)' % (
+                        'aggregates' if action == AGGREGATE else 'rusage'),
+                    (event_id, record))
+                imported += 1
+            elif len(parts) == 4:
+                ts, bid, action, target = parts
+                events.append((run_id(bid), target, action, float(ts)))
+                imported += 1
+        flush()
+        _set_meta(conn, 'offset', offset)
+        _set_meta(conn, 'tail', tail)
+    conn.close()
+    return imported
+
+
+def parse_timing_store(store, after_date=None, log_index=None, targets=None):
+    """Return the same per-target information as ``timing.parse_timing_db``.
+
+    For every target, or for each of ``targets`` when given, only the events
+    of its latest run, of the current run and of its previous finished run
+    are fetched, each through an index.
+    """
+    if not os.path.isfile(store):
+        return {}
+
+    conn = connect(store)
+    last = conn.execute('SELECT run_id FROM events ORDER BY id DESC LIMIT 1').fetchone()
+    if last is None:
+        conn.close()
+        return {}
+    cur_run_id = last[0]
+
+    rows = {}
+
+    def fetch_run(target, run_id):
+        for row in conn.execute(
+                'SELECT e.id, e.timestamp, r.bid, e.action, e.target, COALESCE(a.record, u.record) '
+                'FROM events e JOIN runs r ON r.id = e.run_id '
+                'LEFT JOIN aggregates a ON a.event_id = e.id '
+                'LEFT JOIN rusage u ON u.event_id = e.id '
+                'WHERE e.run_id = ? AND e.target = ?', (run_id, target)):
+            rows[row[0]] = row[1:] if row[5] else row[1:5]
+
+    if targets is None:
+        targets = [t for t, in conn.execute('SELECT DISTINCT target FROM events')]
+    for target in targets:
+        latest = conn.execute(
+            'SELECT run_id FROM events WHERE target = ? ORDER BY id DESC LIMIT 1',
+            (target,)).fetchone()
+        if latest is None:
+            continue
+        fetch_run(target, latest[0])
+        fetch_run(target, cur_run_id)
+        prev = conn.execute(
+            "SELECT run_id FROM events WHERE target = ? AND action IN ('finish', ?) AND run_id != ? "
+            "ORDER BY id DESC LIMIT 1", (target, AGGREGATE, cur_run_id)).fetchone()
+        if prev:
+            fetch_run(target, prev[0])
+    conn.close()
+
+    return _collect_targets(
+        [rows[i] for i in sorted(rows, reverse=True)], after_date, log_index=log_index)
+
+
+def _load_aggregates(conn, target=None):
+    """Return the latest aggregate record of ``target`` or of every target."""
+    query = 'SELECT e.target, a.record FROM aggregates a JOIN events e ON e.id = a.event_id'
+    params = ()
+    if target is not None:
+        query += ' WHERE e.target = ?'
+        params = (target,)
+    return {t: json.loads(record) for t, record in conn.execute(query + ' ORDER BY e.id', params)}
+
+
+def analyze_target(store, target_name, log_index=None):
+    """Return the same statistics as ``timing.analyze_target`` from ``store``."""
+    runs = {}
+    aggregate = None
+    if os.path.isfile(store):
+        conn = connect(store)
+        for bid, action, ts in conn.execute(
+                'SELECT r.bid, e.action, e.timestamp '
+                'FROM events e JOIN runs r ON r.id = e.run_id '
+                "WHERE e.target = ? AND e.action IN ('start', 'finish') ORDER BY e.id",
+                (target_name,)):
+            runs.setdefault(bid, {}).update({action: ts})
+        aggregate = _load_aggregates(conn, target_name).get(target_name)
+        conn.close()
+    return _target_statistics(runs, target_name, log_index, aggregate)
+
+
+def analyze_all_targets(store, log_index=None):
+    """Return the same statistics as ``timing.analyze_all_targets`` from ``store``."""
+    runs = collections.defaultdict(dict)
+    aggregates = {}
+    if os.path.isfile(store):
+        conn = connect(store)
+        for target, bid, action, ts in conn.execute(
+                'SELECT e.target, r.bid, e.action, e.timestamp '
+                'FROM events e JOIN runs r ON r.id = e.run_id '
+                "WHERE e.action IN ('start', 'finish') ORDER BY e.id"):
+            runs[target].setdefault(bid, {})[action] = ts
+        aggregates = _load_aggregates(conn)
+        conn.close()
+    return _all_target_statistics(runs, log_index, aggregates)
+
+
+def main(argv=sys.argv[1:]):
+    options = argparse.ArgumentParser(
+        description='Import make_profile.db into an indexed SQLite timing store.')
+    options.add_argument(
+        '-db',
+        action='store',
+        dest='db_filename',
+        type=str,
+        default='make_profile.db',
+        help='Profile with timings (default %(default)s)')
+    options.add_argument(
+        'store',
+        type=str,
+        help='SQLite database to create or update')
+
+    args = options.parse_args(argv)
+    imported = sync(args.db_filename, args.store)
+    logging.info('imported %d events into %s', imported, args.store)
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
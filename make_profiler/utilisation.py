@@ -0,0 +1,169 @@
+"""Parallelism utilisation of a build.
+
+The start and finish events of a build give the number of targets running
+at the same time as a step function of time. Its summary tells whether the
+job slots of ``make -j`` were kept busy or the shape of the dependency graph
+left them idle.
+"""
+
+import os
+
+from make_profiler.timing import FAIL, LogIndex, _read_lines_reversed
+
+
+def run_events(filename, bid=None, log_index=None):
+    """Return the ``(timestamp, bid, action, target)`` events of a build.
+
+    The events of build ``bid``, by default the latest one, are returned
+    oldest first. Builds sharing a db are assumed not to overlap in time, so
+    reading stops at the first event of an older build. Failed targets have
+    no finish line, they get a ``fail`` event at the modification time of
+    their ``failed.touch`` file found through ``log_index``.
+    """
+    events = []
+    if not os.path.isfile(filename):
+        return events
+    if log_index is None:
+        log_index = LogIndex()
+    for parts in _read_lines_reversed(filename):
+        if len(parts) != 4:
+            continue
+        if bid is None:
+            bid = parts[1]
+        if parts[1] == bid:
+            events.append((float(parts[0]), parts[1], parts[2], parts[3]))
+        elif events:
+            break
+    events.reverse()
+
+    finished = {target for _, _, action, target in events if action == 'finish'}
+    for target in {target for _, _, action, target in events if action == 'start'} - finished:
+        if log_index.exists(bid, target, 'failed.touch'):
+            failed_at = os.path.getmtime(os.path.join(log_index.root, bid, target, 'failed.touch'))
+            events.append((failed_at, bid, FAIL, target))
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+def concurrency_timeline(events):
+    """Return the number of running targets as ``[time, running]`` steps.
+
+    Every step holds the time the number of running targets changed at and
+    the new number. A ``fail`` event ends a target like a finish. A start
+    without either counts as running until the last event of the build,
+    the last step always drops to zero there.
+    """
+    if not events:
+        return []
+    running = {}
+    steps = []
+    count = 0
+    for ts, _, action, target in sorted(events, key=lambda e: e[0]):
+        if action == 'start':
+            running[target] = running.get(target, 0) + 1
+            count += 1
+        elif action in ('finish', FAIL) and running.get(target):
+            running[target] -= 1
+            count -= 1
+        else:
+            continue
+        if steps and steps[-1][0] == ts:
+            steps[-1][1] = count
+        else:
+            steps.append([ts, count])
+    end = max(ts for ts, _, _, _ in events)
+    if steps and steps[-1][1]:
+        if steps[-1][0] == end:
+            steps[-1][1] = 0
+        else:
+            steps.append([end, 0])
+    return steps
+
+
+def utilisation(steps, jobs=None):
+    """Summarise a ``concurrency_timeline`` against a limit of ``jobs``.
+
+    The result holds the ``wall`` time of the build, the ``mean`` and
+    ``max`` number of running targets, the ``idle`` time nothing was running
+    together with the ``idle_gaps`` as ``[start, duration]`` pairs and, when
+    ``jobs`` is given, the share of time fewer targets than ``jobs`` ran.
+    Times in ``steps`` and in the result are seconds since the build start.
+    """
+    if not steps:
+        return {'start': None, 'wall': 0, 'mean': 0, 'max': 0, 'jobs': jobs,
+                'below_jobs': None, 'idle': 0, 'idle_gaps': [], 'steps': []}
+    start = steps[0][0]
+    wall = steps[-1][0] - start
+    area = 0
+    below = 0
+    gaps = []
+    for (ts, count), (next_ts, _) in zip(steps, steps[1:]):
+        duration = next_ts - ts
+        area += count * duration
+        if jobs and count < jobs:
+            below += duration
+        if count == 0 and duration > 0:
+            gaps.append([ts - start, duration])
+    return {
+        'start': start,
+        'wall': wall,
+        'mean': area / wall if wall else 0,
+        'max': max(count for _, count in steps),
+        'jobs': jobs,
+        'below_jobs': below / wall if jobs and wall else None,
+        'idle': sum(duration for _, duration in gaps),
+        'idle_gaps': gaps,
+        'steps': [[ts - start, count] for ts, count in steps],
+    }
+
+
+def run_utilisation(filename, bid=None, jobs=None, log_index=None):
+    """Return the :func:`utilisation` of build ``bid`` of ``filename``.
+
+    The build id is added to the result as ``bid``.
+    """
+    events = run_events(filename, bid, log_index)
+    result = utilisation(concurrency_timeline(events), jobs)
+    result['bid'] = events[0][1] if events else bid
+    return result
+
+
+def job_limit(make_args):
+    """Return the ``-j`` limit given in ``make_args``, None when unlimited or unknown."""
+    jobs = None
+    for i, arg in enumerate(make_args):
+        if arg in ('-j', '--jobs'):
+            value = make_args[i + 1] if i + 1 < len(make_args) else ''
+        elif arg.startswith('--jobs='):
+            value = arg[len('--jobs='):]
+        elif arg.startswith('-j'):
+            value = arg[2:]
+        else:
+            continue
+        jobs = int(value) if value.isdigit() else None
+    return jobs
+
+
+def annotate_scheduler_wait(performance, dependencies):
+    """Record how long targets of the current build waited to be started.
+
+    A target is ready once the last of its prerequisites that ran in the
+    current build finished, or at the start of the build when none of them
+    ran. ``ready_current`` and the ``wait_sec`` between it and the start of
+    the target are added to ``performance``; the total wait is returned.
+    """
+    current = {t: p for t, p in performance.items() if p.get('current') and 'start_current' in p}
+    if not current:
+        return 0
+    build_start = min(p['start_current'] for p in current.values())
+    total = 0
+    for target, perf in current.items():
+        deps, order_deps = dependencies.get(target, ([], []))
+        ready = max(
+            (current[d]['finish_current'] for d in deps + order_deps
+             if d in current and not current[d]['running']),
+            default=build_start)
+        perf['ready_current'] = ready
+        perf['wait_sec'] = max(perf['start_current'] - ready, 0)
+        total += perf['wait_sec']
+    return total
@@ -40,12 +40,20 @@ setup(
     install_requires=(
         'more-itertools==2.4.1',
     ),
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     entry_points={
         'console_scripts': [
             'profile_make_clean = make_profiler.cmd_clean:main',
+            'profile_make_compact = make_profiler.cmd_compact:main',
             'profile_make = make_profiler.__main__:main',
             'profile_make_lint = make_profiler.lint_makefile:main',
-            'profile_make_init_viewer = make_profiler.viewer_export:main'
+            'profile_make_init_viewer = make_profiler.viewer_export:main',
+            'profile_make_import_sqlite = make_profiler.timing_sqlite:main',
+            'profile_make_import_binary = make_profiler.timing_binary:main',
+            'profile_make_bench = make_profiler.bench:main',
+            'profile_make_collect = make_profiler.collector:main'
         ]
     },
     include_package_data=True,
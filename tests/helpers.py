@@ -0,0 +1,11 @@
+import io
+
+from make_profiler.parser import parse
+from make_profiler.preprocess import generate_makefile
+
+
+def preprocess(makefile, hooks, **kwargs):
+    """Return ``makefile`` as ``profile_make`` would run it with ``hooks``."""
+    out = io.StringIO()
+    generate_makefile(parse(io.StringIO(makefile)), out, 'make_profile.db', hooks, **kwargs)
+    return out.getvalue()
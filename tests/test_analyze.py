@@ -1,5 +1,6 @@
+import math
 import os
-from make_profiler.timing import analyze_target
+from make_profiler.timing import LogIndex, analyze_all_targets, analyze_target, analyze_target_lines
 
 def test_analyze_target(tmp_path):
     db = tmp_path / "make_profile.db"
@@ -18,8 +19,11 @@ def test_analyze_target(tmp_path):
     (tmp_path / 'logs' / 'r3' / 't1').mkdir(parents=True)
     cwd = os.getcwd()
     os.chdir(tmp_path)
-    stats = analyze_target(str(db), 't1')
+    log_index = LogIndex()
+    stats = analyze_target(str(db), 't1', log_index)
     os.chdir(cwd)
+    # failed runs of a single target are looked up without scanning the builds
+    assert not log_index.scanned
     assert stats['started'] == 3
     assert stats['finished'] == 2
     assert stats['max'] == 4
@@ -27,3 +31,62 @@ def test_analyze_target(tmp_path):
     assert stats['avg'] == 3
     assert stats['median'] == 3
     assert stats['last'] == 4
+
+
+def test_analyze_all_targets(tmp_path, monkeypatch):
+    db = tmp_path / "make_profile.db"
+    lines = [
+        "10 r1 start t1\n",
+        "12 r1 finish t1\n",
+        "12 r1 start t2\n",
+        "42 r1 finish t2\n",
+        "20 r2 start t1\n",
+        "25 r2 finish t1\n",
+        "30 r3 start t1\n",
+        "34 r3 finish t1\n",
+        "40 r4 start t1\n",
+        "50 r4 finish t1\n",
+        "50 r4 start t3\n",
+    ]
+    db.write_text(''.join(lines))
+    (tmp_path / 'logs' / 'r2' / 't1').mkdir(parents=True)
+    (tmp_path / 'logs' / 'r2' / 't1' / 'failed.touch').write_text('')
+    monkeypatch.chdir(tmp_path)
+    stats = analyze_all_targets(str(db))
+    assert [s['target'] for s in stats] == ['t2', 't1']
+    t1 = stats[1]
+    assert t1['count'] == 3
+    assert t1['total'] == 16
+    assert t1['min'] == 2
+    assert t1['max'] == 10
+    assert t1['median'] == 4
+    assert abs(t1['p90'] - 8.8) < 1e-9
+    assert abs(t1['stddev'] - math.sqrt(104 / 9)) < 1e-9
+    assert analyze_target(str(db), 't1')['median'] == t1['median']
+
+
+def test_analyze_target_lines(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / "make_profile.db"
+    db.write_text(''.join([
+        "10 r1 start t1\n",
+        "10 r1 line_start t1 1\n",
+        "11 r1 line_finish t1 1\n",
+        "11 r1 line_start t1 2\n",
+        "15 r1 line_finish t1 2\n",
+        "15 r1 finish t1\n",
+        "20 r2 start t1\n",
+        "20 r2 line_start t1 1\n",
+        "22 r2 line_finish t1 1\n",
+        "22 r2 line_start t1 2\n",
+        "24 r2 line_finish t1 2\n",
+        "24 r2 finish t1\n",
+        "30 r3 line_start t2 1\n",
+    ]))
+    lines = analyze_target_lines(str(db), 't1')
+    assert [line['line'] for line in lines] == [1, 2]
+    assert (lines[0]['avg'], lines[0]['last']) == (1.5, 2)
+    assert (lines[1]['max'], lines[1]['min']) == (4, 2)
+    # line events don't disturb the target statistics
+    assert analyze_target(str(db), 't1')['avg'] == 4.5
+    assert analyze_target_lines(str(db), 'missing') == []
@@ -0,0 +1,25 @@
+import io
+import shutil
+
+import pytest
+
+from make_profiler.bench import run_benchmark, synthetic_makefile
+from make_profiler.parser import parse, get_dependencies_influences
+
+
+def test_synthetic_makefile_fan_in():
+    ast = parse(io.StringIO(synthetic_makefile(20, 3)))
+    deps, influences, _, _ = get_dependencies_influences(ast)
+    assert len(deps['all'][0]) == 20
+    assert deps['t0'][0] == []
+    assert all(len(deps['t%d' % i][0]) == 3 for i in range(3, 20))
+    assert synthetic_makefile(20, 3) == synthetic_makefile(20, 3)
+
+
+@pytest.mark.skipif(not (shutil.which('make') and shutil.which('bash')), reason='needs make and bash')
+def test_run_benchmark():
+    results = run_benchmark([5], [1], [1, 2], ['light'], repeat=1)
+    assert [(r['targets'], r['fan_in'], r['jobs']) for r in results] == [(5, 1, 1), (5, 1, 2)]
+    assert all(r['light']['wall'] > 0 and r['plain'] > 0 for r in results)
+    assert all(r['light']['per_target_ms'] * 6 / 1000 == pytest.approx(r['light']['wall'] - r['plain'])
+               for r in results)
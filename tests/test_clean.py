@@ -1,9 +1,22 @@
 import logging
+import shutil
+
 import make_profiler.cmd_clean as cmd_clean
+from make_profiler.parse_cache import CACHE_FILENAME
 
 
-def test_clean_nonexistent_target(caplog):
+def test_clean_nonexistent_target(caplog, tmp_path):
+    makefile = str(tmp_path / 'example.mk')
+    shutil.copy('test/example.mk', makefile)
     with caplog.at_level(logging.ERROR):
-        ret = cmd_clean.main(['-f', 'test/example.mk', 'no_such_target'])
+        ret = cmd_clean.main(['-f', makefile, 'no_such_target'])
     assert 'no_such_target' in caplog.text
     assert ret == 1
+    assert (tmp_path / CACHE_FILENAME).exists()
+
+
+def test_clean_without_parse_cache(tmp_path):
+    makefile = str(tmp_path / 'example.mk')
+    shutil.copy('test/example.mk', makefile)
+    assert cmd_clean.main(['-f', makefile, '--no_parse_cache', 'no_such_target']) == 1
+    assert not (tmp_path / CACHE_FILENAME).exists()
@@ -0,0 +1,119 @@
+import errno
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from make_profiler.collector import Collector
+from make_profiler.preprocess import HOOKS, LIGHT_HOOKS, event_stream_hooks
+from make_profiler.timing import parse_timing_db
+
+from tests.helpers import preprocess
+
+MAKEFILE = """\
+all: ok broken
+
+ok:
+\techo hello
+
+broken:
+\tfalse
+"""
+
+
+def test_event_stream_hooks():
+    makefile = preprocess(MAKEFILE, event_stream_hooks(HOOKS, '/tmp/events.fifo'))
+    assert makefile.count(
+        '[ -p /tmp/events.fifo ] && echo "$$(date +%s.%6N) ${RANDOM_HASH} start $@"'
+        ' | dd of=/tmp/events.fifo oflag=nonblock conv=notrunc,nocreat status=none 2>/dev/null;') == 3
+    assert makefile.count('${RANDOM_HASH} fail $@') == 2
+    assert 'events.fifo' not in preprocess(MAKEFILE, HOOKS)
+
+
+def test_collector_folds_events(tmp_path):
+    db = tmp_path / 'make_profile.db'
+    db.write_text('1.0 b1 start ok\n2.0 b1 finish ok\n')
+    collector = Collector(str(db), str(tmp_path / 'events.fifo'))
+    try:
+        assert collector.targets()['ok']['timing_sec'] == 1
+
+        # events arrive in pieces
+        assert collector.feed(b'3.0 b2 start ok\n3.5 b2 sta') == 1
+        assert collector.targets()['ok']['current']
+        assert collector.feed(b'rt broken\n4.0 b2 fail broken\n5.5 b2 finish ok\n') == 3
+        performance = collector.targets()
+        assert performance['ok']['timing_sec'] == 2.5
+        assert performance['ok']['start_prev'] == 1
+        assert performance['broken']['current']
+    finally:
+        collector.close()
+    assert not (tmp_path / 'events.fifo').exists()
+    assert not (tmp_path / 'make_profile.parse_cache').exists()
+
+
+@pytest.mark.skipif(not (shutil.which('make') and shutil.which('bash')), reason='needs make and bash')
+def test_collector_follows_build(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Makefile').write_text(preprocess(MAKEFILE, event_stream_hooks(LIGHT_HOOKS, str(tmp_path / 'events.fifo'))))
+    collector = Collector('make_profile.db', 'events.fifo')
+    try:
+        subprocess.run(['make', '-s', '-k', 'all'], capture_output=True)
+        assert collector.poll(0) == 4
+        performance = collector.targets()
+        # the hooks read the clock again for the event stream
+        assert performance['ok']['start_current'] == pytest.approx(
+            parse_timing_db('make_profile.db')['ok']['start_current'], abs=0.1)
+        assert performance['ok']['log'].endswith('/ok/log.txt')
+        assert performance['broken']['failed']
+    finally:
+        collector.close()
+
+    # the build goes on when nobody collects events
+    subprocess.run(['make', '-s', '-k', 'all'], capture_output=True, timeout=30)
+    assert parse_timing_db('make_profile.db')['ok']['start_prev'] > 0
+
+
+@pytest.mark.skipif(not (shutil.which('make') and shutil.which('bash')), reason='needs make and bash')
+def test_stalled_fifo_does_not_block_build(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Makefile').write_text(preprocess(MAKEFILE, event_stream_hooks(LIGHT_HOOKS, str(tmp_path / 'events.fifo'))))
+    # a FIFO left behind by a killed collector
+    os.mkfifo('events.fifo')
+    subprocess.run(['make', '-s', '-k', 'all'], capture_output=True, timeout=30)
+
+    # a collector that stopped reading, with the pipe buffer full
+    fd = os.open('events.fifo', os.O_RDWR | os.O_NONBLOCK)
+    try:
+        while True:
+            try:
+                os.write(fd, b'x' * 4096)
+            except OSError as e:
+                assert e.errno == errno.EAGAIN
+                break
+        subprocess.run(['make', '-s', '-k', 'all'], capture_output=True, timeout=30)
+    finally:
+        os.close(fd)
+    assert (tmp_path / 'make_profile.db').read_text().count(' start ') == 4
+    assert os.path.exists('events.fifo') and not os.path.isfile('events.fifo')
+
+
+def test_collector_unlinks_fifo_on_sigterm(tmp_path):
+    (tmp_path / 'Makefile').write_text(MAKEFILE)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'make_profiler.collector', '--fifo', 'events.fifo', '--no_parse_cache'],
+        cwd=str(tmp_path), env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    try:
+        deadline = time.time() + 30
+        while not (tmp_path / 'report.json').exists() and time.time() < deadline:
+            time.sleep(0.05)
+        assert (tmp_path / 'events.fifo').exists()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+    finally:
+        process.kill()
+    assert not (tmp_path / 'events.fifo').exists()
+    assert not (tmp_path / 'make_profile.parse_cache').exists()
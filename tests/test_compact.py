@@ -0,0 +1,148 @@
+import os
+import shutil
+
+import pytest
+
+from make_profiler import timing_sqlite
+from make_profiler.cmd_compact import compact, main
+from make_profiler.timing import analyze_all_targets, analyze_target, parse_timing_db
+
+
+def build_db(path):
+    lines = []
+    for run in range(6):
+        base = run * 100
+        lines.append("%d r%d start t1\n" % (base, run))
+        lines.append("%d r%d finish t1\n" % (base + run + 1, run))
+        if run < 3:
+            # t2 is only built in old runs
+            lines.append("%d r%d start t2\n" % (base + 10, run))
+            lines.append("%d r%d finish t2\n" % (base + 20 + run, run))
+    path.write_text(''.join(lines))
+
+
+def test_compact_keeps_statistics(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / 'make_profile.db'
+    build_db(db)
+    (tmp_path / 'logs' / 'r1' / 't1').mkdir(parents=True)
+    (tmp_path / 'logs' / 'r1' / 't1' / 'failed.touch').write_text('')
+
+    before = {t: analyze_target(str(db), t) for t in ('t1', 't2')}
+    timings = parse_timing_db(str(db))
+
+    assert compact(str(db), 2) == 4
+    assert len(db.read_text().splitlines()) == 2 + 4
+    assert parse_timing_db(str(db)) == timings
+    assert {t: analyze_target(str(db), t) for t in ('t1', 't2')} == before
+
+    # a second compaction merges into the existing aggregates
+    assert compact(str(db), 1) == 1
+    assert {t: analyze_target(str(db), t) for t in ('t1', 't2')} == before
+    stats = {s['target']: s for s in analyze_all_targets(str(db))}
+    assert stats['t1']['count'] == 5
+    assert stats['t1']['total'] == 1 + 3 + 4 + 5 + 6
+    assert stats['t2']['max'] == 12
+
+
+def test_compacted_db_in_sqlite_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / 'make_profile.db'
+    store = str(tmp_path / 'make_profile.sqlite')
+    build_db(db)
+    compact(str(db), 2)
+    timing_sqlite.sync(str(db), store)
+    assert timing_sqlite.parse_timing_store(store) == parse_timing_db(str(db))
+    assert timing_sqlite.analyze_target(store, 't2') == analyze_target(str(db), 't2')
+    assert timing_sqlite.analyze_all_targets(store) == analyze_all_targets(str(db))
+
+
+def test_compact_all_builds_keeps_last_build_current(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / 'make_profile.db'
+    db.write_text("100 b1 start zzz\n101 b1 finish zzz\n200 b2 start aaa\n205 b2 finish aaa\n")
+    before = parse_timing_db(str(db))
+    assert before['aaa']['current'] and not before['zzz']['current']
+
+    assert compact(str(db), 0) == 2
+    after = parse_timing_db(str(db))
+    assert after['aaa']['current'] and not after['zzz']['current']
+    assert after['aaa']['timing_sec'] == 5
+    assert after['zzz']['prev'] == 'b1'
+
+    with pytest.raises(ValueError):
+        compact(str(db), -1)
+    with pytest.raises(SystemExit):
+        main(['-db', str(db), '-n', '-1'])
+
+
+def test_compacted_failures_stay_visible(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / 'make_profile.db'
+    db.write_text("100 b1 start broken\n200 b2 start broken\n300 b3 start ok\n301 b3 finish ok\n")
+    for bid in ('b1', 'b2'):
+        (tmp_path / 'logs' / bid / 'broken').mkdir(parents=True)
+        (tmp_path / 'logs' / bid / 'broken' / 'failed.touch').write_text('')
+
+    assert compact(str(db), 1) == 2
+    shutil.rmtree(str(tmp_path / 'logs'))
+    timings = parse_timing_db(str(db))
+    assert timings['broken']['failed']
+    assert not timings['broken']['current']
+    assert timings['ok']['current']
+    assert analyze_target(str(db), 'broken')['started'] == 2
+
+    assert compact(str(db), 0) == 1
+    timings = parse_timing_db(str(db), checkpoint=str(tmp_path / 'checkpoint'))
+    assert timings['ok']['current'] and not timings['broken']['current']
+
+    # a folded failure can be the last build too
+    db.write_text("100 b1 start broken\n")
+    assert compact(str(db), 0) == 1
+    timings = parse_timing_db(str(db))
+    assert timings['broken']['current'] and timings['broken']['failed']
+    assert not timings['broken']['running']
+
+
+def test_compaction_keeps_latest_failure(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / 'make_profile.db'
+    db.write_text(''.join(
+        "%d r%d start a\n%d r%d finish a\n%d r%d start b\n%d r%d finish b\n" % (
+            run * 10, run, run * 10 + 1, run, run * 10 + 2, run, run * 10 + 5, run)
+        for run in range(1, 4)) + "40 r4 start a\n40 r4 start b\n43 r4 finish b\n")
+    (tmp_path / 'logs' / 'r4' / 'a').mkdir(parents=True)
+    (tmp_path / 'logs' / 'r4' / 'a' / 'failed.touch').write_text('')
+    before = parse_timing_db(str(db))
+    assert before['a']['current'] and before['a']['failed']
+
+    assert compact(str(db), 0) == 4
+    after = parse_timing_db(str(db))
+    assert (after['a']['current'], after['a']['failed'], after['a']['running']) == (True, True, False)
+    assert (after['a']['prev'], after['a']['finish_prev']) == ('r3', 31)
+    assert (after['b']['current'], after['b']['failed'], after['b']['timing_sec']) == (True, False, 3)
+    assert analyze_target(str(db), 'a')['started'] == 4
+
+    # and still once the logs are gone
+    shutil.rmtree(str(tmp_path / 'logs'))
+    after = parse_timing_db(str(db))
+    assert after['a']['current'] and after['a']['failed']
+
+
+def test_lines_appended_during_compaction_are_kept(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / 'make_profile.db'
+    build_db(db)
+    replace = os.replace
+
+    def replace_while_appending(src, dst):
+        # a hook that opened the db just before it got replaced
+        with open(str(db), 'a') as fd:
+            fd.write("600 r6 start t1\n")
+            fd.flush()
+            replace(src, dst)
+            fd.write("601 r6 finish t1\n")
+
+    monkeypatch.setattr(os, 'replace', replace_while_appending)
+    compact(str(db), 1)
+    assert db.read_text().splitlines()[-2:] == ["600 r6 start t1", "601 r6 finish t1"]
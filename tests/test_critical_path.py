@@ -0,0 +1,76 @@
+import collections
+import random
+
+import pytest
+
+from make_profiler.critical_path import critical_set, schedule
+from make_profiler.dot_export import critical_path
+
+
+def test_schedule_times_and_slack():
+    # a -> b -> d, a -> c -> d, c is the longer branch
+    influences = {'a': {'b', 'c'}, 'b': {'d'}, 'c': {'d'}, 'd': set()}
+    durations = {'a': 1, 'b': 2, 'c': 5, 'd': 1}
+    targets = schedule(influences, {'a'}, durations.get)
+
+    assert {t: (z['early_start'], z['late_start'], z['slack']) for t, z in targets.items()} == {
+        'a': (0, 0, 0),
+        'b': (1, 4, 3),
+        'c': (1, 1, 0),
+        'd': (6, 6, 0),
+    }
+    assert critical_set(targets) == {'a', 'c', 'd'}
+
+
+def test_schedule_skips_unreachable_and_survives_cycles():
+    influences = {'a': {'b'}, 'b': {'c'}, 'c': {'b'}, 'x': set()}
+    targets = schedule(influences, {'a'}, lambda t: 1)
+    assert set(targets) == {'a', 'b', 'c'}
+    assert targets['a']['early_end'] == 1
+
+
+def test_fan_in_lattice_is_linear():
+    # every target depends on the eight before it: the number of paths
+    # grows exponentially, visits must not
+    names = ['t%d' % i for i in range(5000)]
+    influences = collections.defaultdict(set)
+    dependencies = {}
+    for i, name in enumerate(names):
+        deps = names[max(0, i - 8):i]
+        dependencies[name] = [deps, []]
+        influences[name]
+        for d in deps:
+            influences[d].add(name)
+
+    calls = collections.Counter()
+
+    def duration(t):
+        calls[t] += 1
+        return 1
+
+    targets = schedule(influences, {'t0'}, duration)
+    assert set(calls.values()) == {1}
+    assert critical_set(targets) == set(names)
+    assert targets['t4999']['early_end'] == pytest.approx(5000)
+
+    cp, timing_tags = critical_path(influences, dependencies, {'t0'}, {})
+    assert cp == set(names)
+    # only the last target of every ten minutes is pinned to the timeline
+    assert timing_tags == {k: ['t%d' % (600 * k - 1)] for k in range(1, 9)}
+
+
+def test_fractional_durations_keep_the_whole_chain():
+    influences = {'a': {'b'}, 'b': {'c'}, 'c': set()}
+    durations = {'a': 0.1, 'b': 0.2, 'c': 0.7}
+    targets = schedule(influences, {'a'}, durations.get)
+    assert critical_set(targets) == {'a', 'b', 'c'}
+
+
+def test_fractional_linear_chains():
+    rng = random.Random(1)
+    for _ in range(200):
+        names = ['t%d' % i for i in range(6)]
+        influences = {a: {b} for a, b in zip(names, names[1:])}
+        influences[names[-1]] = set()
+        durations = {t: rng.uniform(0.001, 2) for t in names}
+        assert critical_set(schedule(influences, {'t0'}, durations.get)) == set(names)
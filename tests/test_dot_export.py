@@ -71,6 +71,19 @@ def test_current_targets_are_highlighted():
     assert 'fontcolor="#fff"' in data
 
 
+def test_scheduler_wait_in_label():
+    inf, deps, order, _, ind, docs = build_sample()
+    perf = {
+        'a': {'done': True, 'failed': False, 'isdir': False, 'current': True, 'wait_sec': 75.5},
+        'b': {'done': True, 'failed': False, 'isdir': False, 'current': True, 'wait_sec': 0.2},
+    }
+    f = io.StringIO()
+    export_dot(f, inf, deps, order, perf, ind, docs)
+    data = f.getvalue()
+    assert data.count('waited') == 1
+    assert 'waited 0:01:15' in data
+
+
 def test_current_run_critical_path_colored():
     inf, deps, order, _, ind, docs = build_sample()
     perf = {
@@ -102,3 +115,14 @@ def test_grouped_targets_render_once() -> None:
     assert 'a -> c' in data
     assert 'a -> d' in data
     assert 'b ->' not in data  # b is merged with a
+
+
+def test_redundant_edges_dashed():
+    mk = "all: a b ## [FINAL]\na: b\n\ttrue\nb:\n\ttrue\n"
+    ast = parser.parse(io.StringIO(mk))
+    deps, inf, order, ind = parser.get_dependencies_influences(ast)
+    f = io.StringIO()
+    export_dot(f, inf, deps, order, {}, ind, {})
+    data = f.getvalue()
+    assert 'b -> all [color="#00000033" style=dashed weight=0]' in data
+    assert 'a -> all [color="#cc0000"' in data
@@ -0,0 +1,38 @@
+import io
+
+from make_profiler import parser
+from make_profiler.graph import Graph
+
+MAKEFILE = """\
+all: a b ## [FINAL]
+a: c | dir
+\ttrue
+b:
+\ttrue
+c:
+\ttrue
+a: d
+x y &: c
+\ttrue
+.PHONY: all
+"""
+
+
+def test_graph_matches_rules():
+    ast = parser.parse(io.StringIO(MAKEFILE))
+    graph = Graph.from_ast(ast)
+    assert graph.names == ['all', 'a', 'b', 'c', 'dir', 'd', 'x']
+    # the last rule of a target sets its prerequisites ...
+    assert graph.dependencies()['a'] == [['d'], []]
+    # ... but all of them influence it
+    assert graph.influences()['c'] == {'a', 'x'}
+    assert graph.order_only_names() == {'dir'}
+    assert sorted(graph.descendants('d')) == ['a', 'all']
+    assert 'y' not in graph
+
+
+def test_rules_read_like_dicts():
+    _, rule = parser.parse(io.StringIO("x y &: b a ## doc\n\ttrue\n"))[0]
+    assert rule['all_targets'] == ('x', 'y')
+    assert rule.get('grouped') and rule['deps'] == (('a', 'b'), ())
+    assert rule.get('missing', 1) == 1
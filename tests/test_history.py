@@ -0,0 +1,104 @@
+import io
+import json
+import os
+
+from make_profiler.__main__ import main as profile_make
+from make_profiler.dot_export import export_dot
+from make_profiler.cmd_compact import compact
+from make_profiler.history import annotate_quantiles, baseline, flag_regressions, quantiles, update_history
+from make_profiler.timing import parse_timing_db
+
+
+def write_runs(db, durations, first_run=0):
+    with open(db, 'a') as fd:
+        for i, run in enumerate(durations, first_run):
+            for target, duration in run.items():
+                fd.write("%d r%d start %s\n" % (i * 1000, i, target))
+                fd.write("%d r%d finish %s\n" % (i * 1000 + duration, i, target))
+
+
+def test_regression_flagged(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = str(tmp_path / 'make_profile.db')
+    write_runs(db, [{'slow': 10, 'stable': 20}] * 4)
+
+    history = update_history(db)
+    assert baseline(history, 'slow') == (10, 0, 3)
+    performance = flag_regressions(parse_timing_db(db), history)
+    assert not performance['slow']['regression']
+
+    write_runs(db, [{'slow': 40, 'stable': 21}], first_run=4)
+    history = update_history(db)
+    assert history['targets']['slow']['n'] == 5
+    performance = flag_regressions(parse_timing_db(db), history)
+    assert performance['slow']['regression']
+    assert performance['slow']['baseline_sec'] == 10
+    assert not performance['stable']['regression']
+
+    f = io.StringIO()
+    export_dot(f, {'slow': set()}, {'slow': [[], []]}, set(), performance, {'slow': set()}, {})
+    assert 'fillcolor="#FB8C00"' in f.getvalue()
+
+
+def test_quantiles(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = str(tmp_path / 'make_profile.db')
+    write_runs(db, [{'t': d} for d in range(1, 101)])
+    update_history(db)
+    # a second update only reads what was appended and merges into the sketch
+    write_runs(db, [{'t': 101}], first_run=100)
+    history = update_history(db)
+
+    q = quantiles(history, 't')
+    assert abs(q['p50'] - 51) < 2
+    assert abs(q['p95'] - 96) < 2
+    assert abs(q['p99'] - 100) < 2
+    assert quantiles(history, 'missing') == {}
+
+    performance = annotate_quantiles(parse_timing_db(db), history)
+    assert performance['t']['p99'] == q['p99']
+
+
+def test_quantiles_after_compaction(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = str(tmp_path / 'make_profile.db')
+    write_runs(db, [{'t': d} for d in range(1, 101)])
+    compact(db, 1)
+    # a history started on a compacted db is seeded from the aggregate records
+    history = update_history(db)
+    assert history['targets']['t']['n'] == 100
+    assert abs(quantiles(history, 't')['p50'] - 50) < 3
+
+
+def test_history_only_on_request(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('make_profiler.__main__.render_dot', lambda dot_file, filename: None)
+    (tmp_path / 'Makefile').write_text("slow:\n\ttrue\n")
+    db = str(tmp_path / 'make_profile.db')
+    write_runs(db, [{'slow': 10}] * 4 + [{'slow': 40}])
+
+    profile_make([])
+    assert not (tmp_path / 'make_profile.db.history').exists()
+    assert not json.load(open(tmp_path / 'report.json'))['status'][0]['targetRegression']
+
+    profile_make(['--history'])
+    assert (tmp_path / 'make_profile.db.history').is_file()
+    assert json.load(open(tmp_path / 'report.json'))['status'][0]['targetRegression']
+
+
+def test_analyze_reads_history_only(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    db = str(tmp_path / 'make_profile.db')
+    write_runs(db, [{'t': 10}] * 3)
+
+    profile_make(['--analyze', 't'])
+    assert 'p50' not in capsys.readouterr().out
+    assert not (tmp_path / 'make_profile.db.history').exists()
+
+    profile_make(['--analyze', 't', '--history'])
+    assert 'p50: 10' in capsys.readouterr().out
+    write_runs(db, [{'t': 20}], first_run=3)
+    mtime = os.path.getmtime(db + '.history')
+    profile_make(['--analyze', 't'])
+    assert 'p50: 10' in capsys.readouterr().out
+    assert os.path.getmtime(db + '.history') == mtime
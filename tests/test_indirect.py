@@ -18,3 +18,29 @@ def test_indirect_influences_transitive():
     assert indirect['target1'] == set()
 
 
+
+
+def test_shortcut_edges_are_indirect():
+    sample = (
+        "all: a b\n"
+        "a: b\n"
+        "b: c\n"
+        "c:\n"
+        "\ttrue\n"
+    )
+    ast = parser.parse(io.StringIO(sample))
+    _, influences, _, indirect = parser.get_dependencies_influences(ast)
+    # b -> all is also reached through a
+    assert influences['b'] == {'a', 'all'}
+    assert indirect['b'] == {'all'}
+    assert indirect['c'] == {'a', 'all'}
+    assert 'all' not in indirect['all']
+
+
+def test_deep_chain_and_cycle():
+    n = 20000
+    sample = ''.join('t%d: t%d\n' % (i, i + 1) for i in range(n)) + 'loop1: loop2\nloop2: loop1\nt%d: loop1\n' % n
+    ast = parser.parse(io.StringIO(sample))
+    _, _, _, indirect = parser.get_dependencies_influences(ast)
+    assert len(indirect['t%d' % (n - 2)]) == n - 3
+    assert 't0' in indirect['loop1']
@@ -113,12 +113,13 @@ def test_main_reports_summary(tmp_path, monkeypatch, capsys) -> None:
     mk = "all: foo\n"
     mfile = tmp_path / "Makefile"
     mfile.write_text(mk)
-    monkeypatch.setattr("sys.argv", ["profile_make_lint", "--in_filename", str(mfile)])
+    monkeypatch.setattr("sys.argv", ["profile_make_lint", "--in_filename", str(mfile), "--no_parse_cache"])
     ret = lint_makefile.main()
     captured = capsys.readouterr()
     assert ret == 1
     assert "validation failed" in captured.err.lower()
     assert "missing rule: 1" in captured.err.lower()
+    assert not (tmp_path / "make_profile.parse_cache").exists()
 
 
 def test_summary_counts_similar_errors() -> None:
@@ -154,3 +155,24 @@ def test_multiple_targets_grouped_is_ok() -> None:
     )
     valid, errors = run_validation(mk)
     assert valid, errors
+
+
+def test_included_target_line_info(tmp_path, monkeypatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "rules.mk").write_text("# rules\nfoo:\n\t@echo foo\n")
+    valid, errors = run_validation("include rules.mk\n")
+    assert not valid
+    orphan = next(e for e in errors if e.error_type == "orphan target")
+    assert (orphan.filename, orphan.line_number, orphan.line_text) == ("rules.mk", 1, "foo:")
+
+
+def test_main_prints_error_locations(tmp_path, monkeypatch, capsys) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "rules.mk").write_text("# rules\nfoo:\n\t@echo foo\n")
+    (tmp_path / "Makefile").write_text("include rules.mk\nall: bar ## [FINAL] doc \n")
+    monkeypatch.setattr("sys.argv", ["profile_make_lint", "--no_parse_cache"])
+    assert lint_makefile.main() == 1
+    err = capsys.readouterr().err.splitlines()
+    assert "rules.mk:2: foo, is orphan - not marked as [FINAL] and no other target depends on it" in err
+    assert "Makefile:2: No rule to make target 'bar', needed by 'all'" in err
+    assert any(line.startswith("Makefile:2: Trailing spaces") for line in err)
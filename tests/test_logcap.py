@@ -0,0 +1,42 @@
+import io
+
+from make_profiler.logcap import BoundedLog, capture, open_log, read_log
+
+
+class Chunks(io.RawIOBase):
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def read(self, size=-1):
+        return self.chunks.pop(0) if self.chunks else b''
+
+
+def test_batched_timestamps():
+    clock = iter([0, 0.5, 1.2, 1.3]).__next__
+    log = io.BytesIO()
+    out = io.BytesIO()
+    capture(Chunks([b'a\nb', b'c\nd\n', b'e\nf\n', b'g\n']), out, log, stamp_interval=1, clock=clock)
+    assert out.getvalue() == b'a\nbc\nd\ne\nf\ng\n'
+    lines = log.getvalue().decode().splitlines()
+    # only the first line and the first one starting a second later are stamped
+    assert [line.startswith('[') for line in lines] == [True, False, False, True, False, False]
+    assert lines[1] == 'bc' and lines[3].endswith('] e')
+
+
+def test_bounded_log_keeps_head_and_tail():
+    log = io.BytesIO()
+    log.close = lambda: None
+    bounded = BoundedLog(log, max_bytes=10)
+    for chunk in (b'01234', b'56789', b'abcde', b'fghij'):
+        bounded.write(chunk)
+    bounded.close()
+    assert log.getvalue() == b'01234\n[... 10 bytes skipped ...]\nfghij'
+
+
+def test_gzip_members_append(tmp_path):
+    filename = str(tmp_path / 'log.txt.gz')
+    for text in (b'first\n', b'second\n'):
+        fd = open_log(filename, 'gzip')
+        fd.write(text)
+        fd.close()
+    assert read_log(filename) == b'first\nsecond\n'
@@ -0,0 +1,74 @@
+import json
+import os
+
+import pytest
+
+from make_profiler import parse_cache
+
+
+def test_cache_is_used_until_an_include_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Makefile').write_text("all: a ## [FINAL]\ninclude rules.mk\n-include optional.mk\n")
+    (tmp_path / 'rules.mk').write_text("a:\n\ttrue\n")
+    calls = []
+    parse = parse_cache.parse
+    monkeypatch.setattr(parse_cache, 'parse', lambda *args, **kwargs: calls.append(1) or parse(*args, **kwargs))
+
+    ast, graph = parse_cache.load_makefile('Makefile')
+    assert graph.dependencies() == {'all': [['a'], []], 'a': [[], []]}
+    assert (tmp_path / parse_cache.CACHE_FILENAME).is_file()
+    cached_ast, cached_graph = parse_cache.load_makefile('Makefile')
+    assert cached_ast == ast
+    assert cached_ast[1][1]['body'][0].source == ('rules.mk', 2)
+    assert cached_graph.influences() == graph.influences()
+    assert len(calls) == 1
+
+    # touching without changes keeps the cache
+    os.utime('rules.mk', ns=(1, 1))
+    parse_cache.load_makefile('Makefile')
+    assert len(calls) == 1
+
+    (tmp_path / 'rules.mk').write_text("a: b\n\ttrue\nb:\n\ttrue\n")
+    _, graph = parse_cache.load_makefile('Makefile')
+    assert graph.dependencies()['a'] == [['b'], []]
+    assert len(calls) == 2
+
+    # an optional include showing up invalidates the cache too
+    (tmp_path / 'optional.mk').write_text("c:\n\ttrue\n")
+    _, graph = parse_cache.load_makefile('Makefile')
+    assert 'c' in graph
+    assert len(calls) == 3
+
+    parse_cache.load_makefile('Makefile', cache_filename=None)
+    assert len(calls) == 4
+
+
+def test_broken_cache_is_ignored(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Makefile').write_text("all:\n\ttrue\n")
+    (tmp_path / parse_cache.CACHE_FILENAME).write_bytes(b'garbage')
+    ast, _ = parse_cache.load_makefile('Makefile')
+    assert ast[0][1]['target'] == 'all'
+
+
+def test_cache_holds_plain_data_of_the_current_user(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Makefile').write_text("all: a ## doc\n\techo $@\na: | b\n\ttrue\nb c &:\n\ttrue\n")
+    ast, graph = parse_cache.load_makefile('Makefile')
+    cache = tmp_path / parse_cache.CACHE_FILENAME
+    assert json.loads(cache.read_text())['version'] == parse_cache.CACHE_VERSION
+
+    cached_ast, cached_graph = parse_cache.load_makefile('Makefile')
+    assert cached_ast == ast
+    assert cached_graph.names == graph.names
+    assert cached_graph.dependencies() == graph.dependencies()
+    assert cached_graph.order_only_names() == graph.order_only_names() == {'b'}
+
+    if not hasattr(os, 'getuid') or os.getuid() != 0:
+        pytest.skip('needs root to hand the cache to another user')
+    calls = []
+    parse = parse_cache.parse
+    monkeypatch.setattr(parse_cache, 'parse', lambda *args, **kwargs: calls.append(1) or parse(*args, **kwargs))
+    os.chown(str(cache), 12345, 12345)
+    assert parse_cache.load_makefile('Makefile')[0] == ast
+    assert len(calls) == 1
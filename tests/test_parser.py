@@ -0,0 +1,80 @@
+import io
+
+import pytest
+
+from make_profiler import parser
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_includes_are_expanded_in_place(tmp_path, monkeypatch, threads):
+    monkeypatch.chdir(tmp_path)
+    write(tmp_path / 'a.mk', "a: b ## from a\n\ttrue\ninclude b.mk\n")
+    write(tmp_path / 'b.mk', "\nb:\n\ttrue\n")
+    ast = parser.parse(io.StringIO("all: a\ninclude a.mk # fragments\n-include missing.mk\nc:\n\ttrue\n"), threads=threads)
+
+    targets = [data for token, data in ast if token == parser.Tokens.target]
+    assert [t['target'] for t in targets] == ['all', 'a', 'b', 'c']
+    assert [t['source'] for t in targets] == [
+        ('<makefile>', 1), ('a.mk', 1), ('b.mk', 2), ('<makefile>', 4)]
+    assert targets[1]['body'] == ((parser.Tokens.command, 'true'),)
+    assert targets[1]['body'][0].source == ('a.mk', 2)
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_missing_include_fails(tmp_path, monkeypatch, threads):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(FileNotFoundError, match="<makefile>:2: included makefile not found: 'missing.mk'"):
+        parser.parse(io.StringIO("x = 1\ninclude missing.mk\n"), threads=threads)
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_include_loop_is_detected(tmp_path, monkeypatch, threads):
+    monkeypatch.chdir(tmp_path)
+    write(tmp_path / 'loop.mk', "x = 1\ninclude loop.mk\n")
+    with pytest.raises(Exception, match='^loop.mk:2: Your make chain is looped or too deep'):
+        parser.parse(io.StringIO("include loop.mk\n"), threads=threads)
+    # shallow chains pass with the default depth
+    write(tmp_path / 'leaf.mk', "leaf:\n\ttrue\n")
+    ast = parser.parse(io.StringIO("include leaf.mk\n"), loop_check_depth=1)
+    assert ast[0][1]['source'] == ('leaf.mk', 1)
+
+
+def test_prefetched_includes_keep_include_order(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = ''
+    for i in range(30):
+        write(tmp_path / f'{i}.mk', f"t{i}: common\n\ttrue\ninclude common.mk nested{i}.mk\n")
+        write(tmp_path / f'nested{i}.mk', f"n{i}:\n\ttrue\n")
+        root += f"include {i}.mk\n"
+    write(tmp_path / 'common.mk', "common:\n\ttrue\n")
+
+    serial_included, threaded_included = [], []
+    serial = parser.parse(io.StringIO(root), included=serial_included)
+    threaded = parser.parse(io.StringIO(root), included=threaded_included, threads=8)
+    assert threaded == serial
+    assert threaded_included == serial_included
+    assert [name for name, _ in serial_included[:4]] == ['0.mk', 'common.mk', 'nested0.mk', '1.mk']
+
+
+def test_multiline_target_keeps_first_line():
+    lines = ["a: b \\\n", "  c\n", "\techo $@\n"]
+    tokens = list(parser.located_tokenizer((line, ('Makefile', i)) for i, line in enumerate(lines, 1)))
+    assert tokens == [
+        (parser.Tokens.target, 'a: b c', ('Makefile', 1)),
+        (parser.Tokens.command, 'echo $@', ('Makefile', 3)),
+    ]
+
+
+def test_expressions_and_commands_keep_their_source(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write(tmp_path / 'vars.mk', "\nX = 1\n")
+    ast = parser.parse(io.StringIO("include vars.mk\nall:\n\techo \\\n\t  $(X)\n\ttrue\n"))
+    expression, (_, rule) = ast
+    assert expression == (parser.Tokens.expression, 'X = 1\n')
+    assert expression.source == ('vars.mk', 2)
+    assert [line.source for line in rule['body']] == [('<makefile>', 3), ('<makefile>', 5)]
@@ -0,0 +1,119 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import make_profiler
+
+from make_profiler.logcap import read_log
+from make_profiler.preprocess import LIGHT_HOOKS, compressed_log_hooks
+from make_profiler.timing import parse_timing_db
+
+from tests.helpers import preprocess
+
+MAKEFILE = """\
+all: ok broken
+
+ok:
+\techo hello
+\techo world
+
+broken:
+\tfalse
+"""
+
+
+def test_light_hooks_do_not_fork_awk():
+    makefile = preprocess(MAKEFILE, LIGHT_HOOKS)
+    assert 'awk' not in makefile
+    assert 'hexdump' not in makefile
+    assert makefile.count("printf '%s ${RANDOM_HASH} start $@\\n' \"$${EPOCHREALTIME/,/.}\" >> make_profile.db") == 3
+
+
+@pytest.mark.skipif(not (shutil.which('make') and shutil.which('bash')), reason='needs make and bash')
+def test_light_hooks_record_events(tmp_path):
+    (tmp_path / 'Makefile').write_text(preprocess(MAKEFILE, LIGHT_HOOKS))
+    subprocess.run(['make', '-s', '-k', 'all'], cwd=tmp_path, capture_output=True)
+
+    events = [line.split() for line in (tmp_path / 'make_profile.db').read_text().splitlines()]
+    assert sorted((target, action) for _, _, action, target in events) == [
+        ('broken', 'start'), ('ok', 'finish'), ('ok', 'start')]
+    assert len({bid for _, bid, _, _ in events}) == 1
+    # microsecond timestamps
+    assert all(len(ts.split('.')[1]) == 6 for ts, _, _, _ in events)
+
+    logs = tmp_path / 'logs' / 'latest'
+    assert (logs / 'ok' / 'log.txt').read_text() == 'hello\nworld\n'
+    assert (logs / 'broken' / 'failed.touch').exists()
+
+    performance = parse_timing_db(str(tmp_path / 'make_profile.db'))
+    assert performance['ok']['timing_sec'] >= 0
+    assert performance['broken']['current']
+
+
+@pytest.mark.skipif(not (shutil.which('make') and shutil.which('bash')), reason='needs make and bash')
+def test_rusage_shell_records_usage(tmp_path):
+    (tmp_path / 'Makefile').write_text(preprocess(MAKEFILE, LIGHT_HOOKS, rusage=True))
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(make_profiler.__file__)))
+    result = subprocess.run(['make', '-s', '-k', 'all'], cwd=tmp_path, capture_output=True, env=env)
+    # the exit status of the recipe is passed through
+    assert result.returncode != 0
+    assert b'hello' in result.stdout
+
+    performance = parse_timing_db(str(tmp_path / 'make_profile.db'))
+    assert performance['ok']['rusage']['maxrss'] > 0
+    assert performance['ok']['rusage'].keys() == {
+        'utime', 'stime', 'maxrss', 'nvcsw', 'nivcsw', 'inblock', 'oublock', 'overhead'}
+    # the wrapper's own start-up is not charged to the target
+    overhead = performance['ok']['rusage']['overhead']
+    assert 0 < overhead < 1
+    assert performance['ok']['timing_sec'] == pytest.approx(
+        performance['ok']['finish_current'] - performance['ok']['start_current'] - overhead)
+    # only the recipe lines of the Makefile are wrapped, not the hooks
+    assert (tmp_path / 'make_profile.db').read_text().count(' rusage ') == 3
+
+
+@pytest.mark.skipif(not (shutil.which('make') and shutil.which('bash')), reason='needs make and bash')
+def test_rusage_keeps_recipe_lines_verbatim(tmp_path):
+    makefile = (
+        "MESSAGE = it's, fine\n"
+        "all:\n"
+        "\techo \"$(MESSAGE)\" 'quoted' \"$@\" $$((1 + 1)) # comment, with comma\n"
+    )
+    preprocessed = preprocess(makefile, LIGHT_HOOKS, rusage=True)
+    assert 'SHELL =' not in preprocessed
+    (tmp_path / 'Makefile').write_text(preprocessed)
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(make_profiler.__file__)))
+    result = subprocess.run(['make', '-s', 'all'], cwd=tmp_path, capture_output=True, env=env)
+    assert result.returncode == 0
+    assert result.stdout.splitlines() == [b"it's, fine quoted all 2"]
+    assert (tmp_path / 'make_profile.db').read_text().count(' rusage all ') == 1
+
+
+@pytest.mark.skipif(not (shutil.which('make') and shutil.which('bash')), reason='needs make and bash')
+def test_compressed_logs(tmp_path, monkeypatch):
+    (tmp_path / 'Makefile').write_text(preprocess(MAKEFILE, compressed_log_hooks(LIGHT_HOOKS, 'gzip', max_bytes=1000)))
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(make_profiler.__file__)))
+    subprocess.run(['make', '-s', '-k', 'all'], cwd=tmp_path, capture_output=True, env=env)
+
+    logs = tmp_path / 'logs' / 'latest'
+    assert not (logs / 'ok' / 'log.txt').exists()
+    # one capture per target: lines written within a stamp interval share a timestamp
+    lines = read_log(str(logs / 'ok' / 'log.txt.gz')).decode().splitlines()
+    assert lines[0].startswith('[')
+    assert [line.split('] ')[-1] for line in lines] == ['hello', 'world']
+    assert not list((logs / 'ok').glob('*.fifo*'))
+    assert (logs / 'broken' / 'failed.touch').exists()
+
+    monkeypatch.chdir(tmp_path)
+    performance = parse_timing_db('make_profile.db')
+    assert performance['ok']['log'].endswith('/ok/log.txt.gz')
+
+
+def test_line_timing_events():
+    recipe = [line for line in preprocess(MAKEFILE, LIGHT_HOOKS, line_timing=True).splitlines() if 'echo world' in line][0]
+    assert recipe.index('line_start $@ 2') < recipe.index('echo world') < recipe.index('line_finish $@ 2')
+    # the recipe line still fails when the command failed
+    assert recipe.rstrip().endswith('test ! -e ${RUN_DIRECTORY}/logs/${RANDOM_HASH}/$@/failed.touch')
+    assert 'line_start' not in preprocess(MAKEFILE, LIGHT_HOOKS)
@@ -0,0 +1,48 @@
+import json
+
+from make_profiler.__main__ import main as profile_make
+from make_profiler.cmd_compact import compact
+from make_profiler.run_index import list_runs
+
+
+def test_list_runs_incremental(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / 'make_profile.db'
+    db.write_text(
+        "10 r1 start t1\n"
+        "12 r1 finish t1\n"
+        "12 r1 start t2\n"
+        "20 r2 start t1\n"
+        "25 r2 finish t1\n"
+    )
+    runs = list_runs(str(db))
+    assert [r['bid'] for r in runs] == ['r1', 'r2']
+    assert runs[0]['wall'] == 2
+    assert (runs[0]['built'], runs[0]['failed'], runs[0]['running']) == (1, 1, 0)
+    assert (tmp_path / 'make_profile.db.runs').is_file()
+
+    with open(db, 'a') as fd:
+        fd.write("30 r3 start t1\n30 r3 start t2\n31 r3 start t3\n33 r3 finish t3\n")
+    (tmp_path / 'logs' / 'r3' / 't2').mkdir(parents=True)
+    (tmp_path / 'logs' / 'r3' / 't2' / 'failed.touch').write_text('')
+    runs = list_runs(str(db))
+    assert [r['bid'] for r in runs] == ['r1', 'r2', 'r3']
+    assert (runs[2]['built'], runs[2]['failed'], runs[2]['running']) == (1, 1, 1)
+
+    # compaction drops raw events of old builds but not their summaries
+    compact(str(db), 1)
+    assert list_runs(str(db)) == runs
+
+
+def test_runs_json_only_on_request(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('make_profiler.__main__.render_dot', lambda dot_file, filename: None)
+    (tmp_path / 'Makefile').write_text("all:\n\ttrue\n")
+    (tmp_path / 'make_profile.db').write_text("10 r1 start all\n12 r1 finish all\n")
+
+    profile_make([])
+    assert not (tmp_path / 'runs.json').exists()
+    assert not (tmp_path / 'make_profile.db.runs').exists()
+
+    profile_make(['--export_runs'])
+    assert json.load(open(tmp_path / 'runs.json'))['runs'][0]['buildId'] == 'r1'
@@ -0,0 +1,195 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from make_profiler import timing_binary, timing_sqlite
+from make_profiler.__main__ import main as profile_make
+from make_profiler.timing import LogIndex, _read_lines_reversed, analyze_target, parse_timing_db
+
+
+def write_db(path, lines):
+    with open(path, 'a') as fd:
+        fd.write(''.join(lines))
+
+
+def test_checkpoint_matches_full_parse(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = str(tmp_path / 'make_profile.db')
+    checkpoint = db + '.checkpoint'
+    write_db(db, [
+        "10 r1 start t1\n",
+        "12 r1 finish t1\n",
+        "13 r1 start t2\n",
+        "15 r1 finish t2\n",
+        "20 r2 start t1\n",
+        "25 r2 finish t1\n",
+    ])
+    assert parse_timing_db(db, checkpoint=checkpoint) == parse_timing_db(db)
+    assert os.path.isfile(checkpoint)
+
+    write_db(db, [
+        "30 r3 start t2\n",
+        "34 r3 finish t2\n",
+        "40 r4 start t1\n",
+        "47 r4 finish t1\n",
+        "50 r5 start t1\n",
+        "52 r5 finish t1\n",
+    ])
+    after = datetime.fromtimestamp(45)
+    assert parse_timing_db(db, after, checkpoint) == parse_timing_db(db, after)
+    targets = parse_timing_db(db, checkpoint=checkpoint)
+    assert targets['t1']['timing_sec'] == 2
+    assert targets['t1']['prev'] == 'r4'
+    assert targets['t2']['timing_sec'] == 4
+    assert not targets['t2']['current']
+
+
+def test_checkpoint_rebuilt_after_rewrite(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = str(tmp_path / 'make_profile.db')
+    checkpoint = db + '.checkpoint'
+    write_db(db, ["10 r1 start t1\n", "12 r1 finish t1\n"])
+    parse_timing_db(db, checkpoint=checkpoint)
+
+    with open(db, 'w') as fd:
+        fd.write("10 r9 start t3\n11 r9 finish t3\n20 r10 start t3\n29 r10 finish t3\n")
+    targets = parse_timing_db(db, checkpoint=checkpoint)
+    assert set(targets) == {'t3'}
+    assert targets['t3']['timing_sec'] == 9
+
+
+def test_checkpoint_with_targets_advances(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = str(tmp_path / 'make_profile.db')
+    checkpoint = db + '.checkpoint'
+    write_db(db, ["10 r1 start t1\n", "12 r1 finish t1\n"])
+    assert parse_timing_db(db, checkpoint=checkpoint, targets={'t1'})['t1']['timing_sec'] == 2
+    offset = json.load(open(checkpoint))['offset']
+
+    with open(db, 'a') as fd:
+        fd.write("20 r2 start t1\n25 r2 finish t1\n")
+    targets = parse_timing_db(db, checkpoint=checkpoint, targets={'t1'})
+    assert targets['t1']['timing_sec'] == 5
+    assert json.load(open(checkpoint))['offset'] > offset
+
+    with pytest.raises(ValueError):
+        parse_timing_db(db, checkpoint=checkpoint, max_runs=1)
+
+
+@pytest.mark.parametrize('flags', [
+    ['--checkpoint', '--max_runs', '2'],
+    ['--checkpoint', '--timing_store', 'make_profile.bin'],
+    ['--max_runs', '2', '--timing_store', 'make_profile.sqlite'],
+    ['--analyze', 't', '--lines', '--timing_store', 'make_profile.bin'],
+])
+def test_conflicting_timing_flags_are_rejected(flags):
+    with pytest.raises(SystemExit):
+        profile_make(flags)
+
+
+def test_reverse_scan_stops_early(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = str(tmp_path / 'make_profile.db')
+    write_db(db, [
+        "1 r0 start old\n",
+        "2 r0 finish old\n",
+        "10 r1 start t1\n",
+        "12 r1 finish t1\n",
+        "13 r1 start t2\n",
+        "15 r1 finish t2\n",
+        "20 r2 start t1\n",
+        "25 r2 finish t1\n",
+    ])
+    full = parse_timing_db(db)
+    targets = parse_timing_db(db, targets={'t1', 't2'})
+    assert 'old' not in targets
+    assert targets == {k: v for k, v in full.items() if k != 'old'}
+    assert set(parse_timing_db(db, max_runs=1)) == {'t1'}
+
+
+def test_read_lines_reversed_small_blocks(tmp_path):
+    db = tmp_path / 'make_profile.db'
+    lines = ["%d r1 start target_%d\n" % (i, i) for i in range(50)]
+    db.write_text(''.join(lines) + "60 r1 start unterminated")
+    parts = [p for p in _read_lines_reversed(str(db), block_size=7) if p]
+    assert parts == [['60', 'r1', 'start', 'unterminated']] + [
+        line.split() for line in reversed(lines)]
+
+
+def test_log_index_nested_targets(tmp_path):
+    logs = tmp_path / 'logs'
+    (logs / 'r1' / 'data' / 'out.csv').mkdir(parents=True)
+    (logs / 'r1' / 'data' / 'out.csv' / 'log.txt').write_text('')
+    (logs / 'r1' / 'data' / 'log.txt').write_text('')
+    (logs / 'r1' / 't1').mkdir()
+    (logs / 'r1' / 't1' / 'failed.touch').write_text('')
+    os.symlink('r1', str(logs / 'latest'))
+
+    index = LogIndex(str(logs))
+    assert index.exists('r1', 'data/out.csv', 'log.txt')
+    assert index.exists('r1', 'data', 'log.txt')
+    assert index.exists('r1', 't1', 'failed.touch')
+    assert not index.exists('r1', 't1', 'log.txt')
+    assert not index.exists('r2', 't1', 'log.txt')
+    assert index.scanned == {'r1', 'r2'}
+
+
+def test_parse_uses_log_index(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = str(tmp_path / 'make_profile.db')
+    write_db(db, ["10 r1 start t1\n", "12 r1 finish t1\n"])
+    (tmp_path / 'logs' / 'r1' / 't1').mkdir(parents=True)
+    (tmp_path / 'logs' / 'r1' / 't1' / 'log.txt').write_text('')
+    monkeypatch.setattr(os.path, 'exists', lambda path: False)
+    targets = parse_timing_db(db)
+    assert targets['t1']['log'] == 'logs/r1/t1/log.txt'
+    assert not targets['t1']['failed']
+
+
+def test_rusage_of_reported_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = str(tmp_path / 'make_profile.db')
+    write_db(db, [
+        "10 r1 start t1\n",
+        '11 r1 rusage t1 {"utime":1.5,"stime":0.5,"maxrss":100}\n',
+        "12 r1 finish t1\n",
+        "20 r2 start t1\n",
+        '21 r2 rusage t1 {"utime":2,"stime":1,"maxrss":300}\n',
+        '22 r2 rusage t1 {"utime":1,"stime":0,"maxrss":200}\n',
+        "25 r2 finish t1\n",
+        "30 r3 start t2\n",
+        "31 r3 finish t2\n",
+    ])
+    targets = parse_timing_db(db)
+    # t1 reports the timing and resource usage of its previous run
+    assert targets['t1']['rusage'] == {'utime': 3, 'stime': 1, 'maxrss': 300}
+    assert 'rusage' not in targets['t2']
+
+    checkpoint = db + '.checkpoint'
+    assert parse_timing_db(db, checkpoint=checkpoint) == targets
+    write_db(db, ['32 r3 rusage t2 {"utime":4,"stime":0,"maxrss":10}\n'])
+    assert parse_timing_db(db, checkpoint=checkpoint) == parse_timing_db(db)
+    assert parse_timing_db(db, targets={'t1', 't2'}) == parse_timing_db(db)
+
+    for store, name in ((timing_sqlite, 'make_profile.sqlite'), (timing_binary, 'make_profile.bin')):
+        store.sync(db, str(tmp_path / name))
+        assert store.parse_timing_store(str(tmp_path / name)) == parse_timing_db(db)
+
+
+def test_whole_and_fractional_timestamps(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = str(tmp_path / 'make_profile.db')
+    # lines written by older hooks have whole seconds, newer ones microseconds
+    write_db(db, [
+        "10 r1 start t1\n",
+        "12 r1 finish t1\n",
+        "20.250000 r2 start t1\n",
+        "20.500125 r2 finish t1\n",
+    ])
+    targets = parse_timing_db(db)
+    assert targets['t1']['timing_sec'] == pytest.approx(0.250125)
+    assert targets['t1']['finish_current'] == 20.500125
+    assert parse_timing_db(db, checkpoint=db + '.checkpoint') == targets
+    assert analyze_target(db, 't1')['min'] == pytest.approx(0.250125)
@@ -0,0 +1,68 @@
+from make_profiler import timing_binary
+from make_profiler.cmd_compact import compact
+from make_profiler.timing import analyze_all_targets, analyze_target, parse_timing_db
+
+
+def test_binary_store_matches_text_db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / 'make_profile.db'
+    store = str(tmp_path / 'make_profile.bin')
+    db.write_text(''.join(
+        "%d r%d start t%d\n%d r%d finish t%d\n" % (i * 10, i // 2, i % 3, i * 10 + i, i // 2, i % 3)
+        for i in range(12)))
+    (tmp_path / 'logs' / 'r1' / 't1').mkdir(parents=True)
+    (tmp_path / 'logs' / 'r1' / 't1' / 'failed.touch').write_text('')
+
+    assert timing_binary.sync(str(db), store) == 24
+    assert timing_binary.sync(str(db), store) == 0
+    assert timing_binary.parse_timing_store(store) == parse_timing_db(str(db))
+
+    with open(db, 'a') as fd:
+        fd.write("500 r9 start t1\n")
+    assert timing_binary.sync(str(db), store) == 1
+    timings = parse_timing_db(str(db), targets={'t0', 't1', 't2'})
+    assert timing_binary.parse_timing_store(store, targets={'t0', 't1', 't2'}).keys() == timings.keys()
+    assert timing_binary.analyze_target(store, 't1') == analyze_target(str(db), 't1')
+
+    compact(str(db), 2)
+    timing_binary.sync(str(db), store)
+    assert timing_binary.analyze_all_targets(store) == analyze_all_targets(str(db))
+    assert timing_binary.analyze_target(store, 't2') == analyze_target(str(db), 't2')
+    assert timing_binary.analyze_target(store, 'missing')['started'] == 0
+
+
+def test_sync_appends_segments(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / 'make_profile.db'
+    store = tmp_path / 'make_profile.bin'
+    db.write_text("1 r1 start t1\n2 r1 finish t1\n")
+    assert timing_binary.sync(str(db), str(store)) == 2
+    before = store.read_bytes()
+
+    with open(db, 'a') as fd:
+        fd.write("3 r2 start t1\n4 r2 rusage t1 {\"utime\":1}\n5 r2 finish t1\n6 r2 start t2\n6.5 r2 finish t2\n")
+    assert timing_binary.sync(str(db), str(store)) == 5
+    after = store.read_bytes()
+    # the existing segment is left in place, only the header changes
+    header = timing_binary.HEADER.size
+    assert after[header:len(before)] == before[header:]
+    with timing_binary.BinaryTimingDb(str(store)) as binary:
+        assert len(binary.segments) == 2
+        assert binary.size == 7
+        assert [e[2] for e in binary.events()] == ['start', 'finish', 'start', 'rusage', 'finish', 'start', 'finish']
+        assert binary.event(4) == (5.0, 'r2', 'finish', 't1')
+    assert timing_binary.parse_timing_store(str(store)) == parse_timing_db(str(db))
+
+    # an append interrupted before the header was written is ignored
+    with open(store, 'ab') as fd:
+        fd.write(b'garbage')
+    assert timing_binary.sync(str(db), str(store)) == 0
+    with open(db, 'a') as fd:
+        fd.write("7 r3 start t1\n8 r3 finish t1\n")
+    assert timing_binary.sync(str(db), str(store)) == 2
+    assert timing_binary.parse_timing_store(str(store)) == parse_timing_db(str(db))
+
+    # a store of another format is converted again
+    store.write_bytes(b'MKPROFDB\x01\x00\x00\x00' + b'\0' * 400)
+    assert timing_binary.sync(str(db), str(store)) == 9
+    assert timing_binary.analyze_target(str(store), 't1') == analyze_target(str(db), 't1')
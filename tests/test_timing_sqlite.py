@@ -0,0 +1,31 @@
+from make_profiler import timing_sqlite
+from make_profiler.timing import analyze_target, parse_timing_db
+
+
+def test_store_matches_text_db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = str(tmp_path / 'make_profile.db')
+    store = str(tmp_path / 'make_profile.sqlite')
+    lines = [
+        "10 r1 start t1\n",
+        "12 r1 finish t1\n",
+        "13 r1 start t2\n",
+        "15 r1 finish t2\n",
+        "20 r2 start t1\n",
+        "25 r2 finish t1\n",
+    ]
+    with open(db, 'w') as fd:
+        fd.write(''.join(lines))
+    (tmp_path / 'logs' / 'r2' / 't1').mkdir(parents=True)
+    (tmp_path / 'logs' / 'r2' / 't1' / 'log.txt').write_text('')
+
+    assert timing_sqlite.sync(db, store) == 6
+    assert timing_sqlite.sync(db, store) == 0
+    assert timing_sqlite.parse_timing_store(store) == parse_timing_db(db)
+
+    with open(db, 'a') as fd:
+        fd.write("30 r3 start t2\n34 r3 finish t2\n")
+    assert timing_sqlite.sync(db, store) == 2
+    assert timing_sqlite.parse_timing_store(store) == parse_timing_db(db)
+    assert timing_sqlite.analyze_target(store, 't1') == analyze_target(db, 't1')
+    assert timing_sqlite.analyze_target(store, 't2')['median'] == 3
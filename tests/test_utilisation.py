@@ -0,0 +1,126 @@
+import json
+import os
+
+import pytest
+
+from make_profiler.__main__ import main as profile_make
+from make_profiler.utilisation import (
+    annotate_scheduler_wait,
+    concurrency_timeline,
+    job_limit,
+    run_events,
+    run_utilisation,
+    utilisation,
+)
+
+
+def test_concurrency_timeline():
+    events = [
+        (10.0, 'b', 'start', 'a'),
+        (10.0, 'b', 'start', 'b'),
+        (12.0, 'b', 'finish', 'a'),
+        (14.0, 'b', 'finish', 'b'),
+        (16.0, 'b', 'start', 'c'),
+        (17.0, 'b', 'start', 'd'),
+        (20.0, 'b', 'finish', 'd'),
+    ]
+    steps = concurrency_timeline(events)
+    # c never finished and is closed by the last event
+    assert steps == [[10.0, 2], [12.0, 1], [14.0, 0], [16.0, 1], [17.0, 2], [20.0, 0]]
+
+    result = utilisation(steps, jobs=2)
+    assert result['wall'] == 10
+    assert result['mean'] == pytest.approx((2 * 2 + 2 + 1 + 3 * 2) / 10)
+    assert result['max'] == 2
+    assert result['below_jobs'] == pytest.approx(0.5)
+    assert result['idle_gaps'] == [[4.0, 2.0]]
+    assert result['steps'][0] == [0.0, 2]
+    assert utilisation(steps)['below_jobs'] is None
+
+
+def test_run_utilisation(tmp_path):
+    db = tmp_path / 'make_profile.db'
+    db.write_text(
+        "1 r1 start a\n"
+        "5 r1 finish a\n"
+        "10 r2 start a\n"
+        "10 r2 start b\n"
+        '11 r2 rusage a {"utime":1}\n'
+        "11 r2 finish a\n"
+        "13 r2 finish b\n"
+    )
+    assert [e[3] for e in run_events(str(db), 'r1')] == ['a', 'a']
+    result = run_utilisation(str(db), jobs=4)
+    assert result['bid'] == 'r2'
+    assert result['mean'] == pytest.approx(4 / 3)
+    assert result['below_jobs'] == 1
+    assert run_utilisation(str(tmp_path / 'missing.db'))['steps'] == []
+
+
+def test_failed_target_stops_running_at_failure(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / 'make_profile.db'
+    db.write_text(
+        "10 r1 start a\n"
+        "10 r1 start broken\n"
+        "20 r1 finish a\n"
+        "20 r1 start b\n"
+        "40 r1 finish b\n"
+    )
+    failed = tmp_path / 'logs' / 'r1' / 'broken' / 'failed.touch'
+    failed.parent.mkdir(parents=True)
+    failed.write_text('')
+    os.utime(str(failed), (12, 12))
+
+    events = run_events(str(db))
+    assert events[2] == (12, 'r1', 'fail', 'broken')
+    result = run_utilisation(str(db), jobs=2)
+    assert result['steps'] == [[0, 2], [2, 1], [10, 1], [30, 0]]
+    assert result['max'] == 2
+    assert result['mean'] == pytest.approx(32 / 30)
+    assert result['below_jobs'] == pytest.approx(28 / 30)
+
+
+def test_job_limit():
+    assert job_limit(['-j48']) == 48
+    assert job_limit(['-k', '-j', '8']) == 8
+    assert job_limit(['--jobs=3']) == 3
+    assert job_limit(['-j']) is None
+    assert job_limit([]) is None
+    assert job_limit(['--jobs=abc']) is None
+    assert job_limit(['-jabc']) is None
+    assert job_limit(['-j4', '--jobs=']) is None
+
+
+def test_annotate_scheduler_wait():
+    def perf(start, finish, running=False):
+        return {'current': True, 'running': running, 'start_current': start, 'finish_current': finish}
+
+    performance = {
+        'a': perf(10, 12),
+        'b': perf(11, 15),
+        'c': perf(20, 25),
+        'd': perf(16, 30, running=True),
+        'old': {'current': False, 'running': False, 'start_prev': 1, 'finish_prev': 2},
+    }
+    dependencies = {'a': [[], []], 'b': [[], []], 'c': [['a', 'old'], ['b']], 'd': [['b'], []]}
+    assert annotate_scheduler_wait(performance, dependencies) == 0 + 1 + 5 + 1
+    # c was ready when b finished and waited for a slot until 20
+    assert performance['c']['ready_current'] == 15
+    assert performance['c']['wait_sec'] == 5
+    assert performance['b']['wait_sec'] == 1
+    assert 'wait_sec' not in performance['old']
+
+
+def test_plain_run_writes_no_extra_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('make_profiler.__main__.render_dot', lambda dot_file, filename: None)
+    (tmp_path / 'Makefile').write_text("a:\n\ttrue\nb:\n\ttrue\n")
+    (tmp_path / 'make_profile.db').write_text("0 r1 start a\n0 r1 start b\n10 r1 finish a\n30 r1 finish b\n")
+
+    profile_make([])
+    assert set(os.listdir(tmp_path)) == {'Makefile', 'make_profile.db', 'make_profile.parse_cache', 'report.json'}
+
+    profile_make(['--export_utilisation', '-j2'])
+    report = json.load(open(tmp_path / 'utilisation.json'))
+    assert (report['maxConcurrency'], report['jobs']) == (2, 2)